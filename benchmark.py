@@ -0,0 +1,322 @@
+"""
+Benchmarks of the png module, on the images in test_images/
+
+Every benchmark is run on every image (from the smallest, to the largest file), and reports:
+- seconds: The best time of the repeated runs
+- mpix_per_s: Megapixels of the image processed in a second
+- bytes_per_s: Bytes of the input processed in a second (the file for decoding, CRC, and round-trips, the raw pixels otherwise)
+- peak_bytes: The peak of the memory allocated during a separate run (measured with tracemalloc, which slows the run down)
+
+Usage:
+python benchmark.py
+python benchmark.py --images "small_*" "tank.png" --only "decode" "encode_*"
+python benchmark.py --output results.json --baseline baseline.json --threshold 10
+python benchmark.py --baseline baseline.json --update-baseline
+"""
+
+import argparse
+from png import *
+import os
+import io
+import sys
+import glob
+import json
+import time
+import fnmatch
+import platform
+import contextlib
+import tracemalloc
+
+import render
+import shader_test
+
+# Create the parser
+parser = argparse.ArgumentParser()
+
+parser.add_argument('--images', type=str, nargs='+', default=['*.png'], help='Name patterns of the images in the image folder')
+parser.add_argument('--folder', type=str, default='test_images', help='The folder of the benchmarked images')
+parser.add_argument('--only', type=str, nargs='+', default=['*'], help='Name patterns of the benchmarks to run (decode, encode_rgba, shader:render.mask_shader, ...)')
+parser.add_argument('--repeat', type=int, default=3, help='Number of runs of every benchmark, the best time is reported')
+parser.add_argument('--no-memory', action='store_true', help='Skip the (slow) peak memory measurement')
+parser.add_argument('--output', type=str, default=None, help='Save the results into this JSON file')
+parser.add_argument('--baseline', type=str, default=None, help='Compare the results with this JSON file (saved with --output)')
+parser.add_argument('--threshold', type=float, default=10, help='Slowdown (or memory growth) in percent, reported as a regression')
+parser.add_argument('--update-baseline', action='store_true', help='Save the results as the new baseline, after the comparison')
+
+# Time and memory differences below these are noise, never regressions
+MIN_SECONDS = 0.001
+MIN_BYTES = 64 * 1024
+
+# Columns of the terminal, the print benchmark scales the images to
+PRINT_COLUMNS = 160
+
+# (name, shader, arguments, sampler) of the benchmarked shaders. The arguments, and the sampler can be functions of the image
+SHADERS = [
+    ("shader_test.grayscale_shader", shader_test.grayscale_shader, [], False),
+    ("shader_test.alpha_grayscale_shader", shader_test.alpha_grayscale_shader, [], False),
+    ("shader_test.alpha_monochrome_shader", shader_test.alpha_monochrome_shader, [], False),
+    ("shader_test.alpha_edge_shader", shader_test.alpha_edge_shader, [], False),
+    ("shader_test.blur_shader", shader_test.blur_shader, [3], True),
+    ("shader_test.alpha_checkerboard_shader", shader_test.alpha_checkerboard_shader, [], False),
+    ("shader_test.uv_shader", shader_test.uv_shader, [], False),
+    ("shader_test.uv_warp_shader", shader_test.uv_warp_shader, [], True),
+    ("shader_test.band_shader", shader_test.band_shader, [4], False),
+    ("render.alpha_checkerboard_shader", render.alpha_checkerboard_shader, [0.5], False),
+    ("render.uv_warp_shader", render.uv_warp_shader, [10], True),
+    ("render.uv_whirlpool_shader", render.uv_whirlpool_shader, [1], lambda image: Sampler(image, filter = "bilinear")),
+    ("render.band_diff_shader", render.band_diff_shader, [], False),
+    ("render.mask_shader", render.mask_shader, lambda image: [Sampler(image)], False),
+]
+
+def measure(run : callable, setup : "callable|None" = None, repeat : int = 1, memory : bool = True) -> dict:
+    """
+    **Description:**
+
+    Runs a benchmark, and measures its time, and peak memory use
+
+    **Parameters:**
+    - run(callable) The measured function, called with the result of setup
+    - setup(callable) Prepares the input of every run (not measured)
+    - repeat(int) The number of timed runs
+    - memory(bool) Measure the peak memory in one more run, with tracemalloc
+
+    **Returns:**
+    - A dictionary, with the best time (seconds), and the peak memory (peak_bytes), if measured
+    """
+
+    best = None
+
+    for _ in range(max(repeat, 1)):
+        state = setup() if setup else None
+
+        start = time.perf_counter()
+        run(state)
+        elapsed = time.perf_counter() - start
+
+        best = elapsed if best is None else min(best, elapsed)
+
+    out = {"seconds": best}
+
+    if memory:
+        state = setup() if setup else None
+
+        # Only the memory allocated by the run is counted, not its input
+        tracemalloc.start()
+
+        try:
+            run(state)
+            out["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return out
+
+def unmodified_copy(image : PNG) -> callable:
+    """
+    **Description:**
+
+    Returns with a setup function, creating a copy of the image, that has to be encoded again, and has no cached rows
+    """
+
+    def setup() -> PNG:
+        copy = image.copy()
+        copy._mark_dirty()
+
+        return copy
+
+    return setup
+
+def get_benchmarks(path : str) -> tuple:
+    """
+    **Description:**
+
+    Reads an image, and returns with its benchmarks
+
+    **Returns:**
+    - A list of (name, run, setup, processed bytes) tuples, and the number of pixels in the image
+    """
+
+    with open(path, "rb") as f:
+        file_data = f.read()
+
+    image = PNG(path, flags=PNG_READ)
+    width, height = image.image_meta["width"], image.image_meta["height"]
+    raw_size = width * height * 4
+
+    palette_image = image.copy()
+    palette_image.to_palette()
+
+    def run_print(copy : PNG) -> None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            copy.print(width // PRINT_COLUMNS + 1)
+
+    def run_round_trip(state : None) -> None:
+        decoded = PNG(path, flags=PNG_READ)
+        decoded._mark_dirty()
+
+        PNG(decoded.get_bytes(), flags=PNG_READ | PNG_INPUT_BYTES)
+
+    benchmarks = [
+        ("decode", lambda state: PNG(path, flags=PNG_READ), None, len(file_data)),
+        ("encode_rgba", lambda copy: copy.get_bytes(), unmodified_copy(image), raw_size),
+        ("encode_palette", lambda copy: copy.get_bytes(), unmodified_copy(palette_image), width * height),
+        ("crc", lambda state: image._generate_crc(file_data), None, len(file_data)),
+    ]
+
+    for name, shader, arguments, sampler in SHADERS:
+        def run_shader(copy : PNG, shader : callable = shader, arguments : list = arguments, sampler : "Sampler|bool" = sampler) -> None:
+            copy.shader(
+                shader,
+                arguments(copy) if callable(arguments) else arguments,
+                sampler = sampler(copy) if callable(sampler) else sampler,
+            )
+
+        benchmarks.append((f"shader:{name}", run_shader, image.copy, raw_size))
+
+    benchmarks.append(("print", run_print, image.copy, raw_size))
+    benchmarks.append(("round_trip", run_round_trip, None, len(file_data)))
+
+    return benchmarks, width * height
+
+def run_benchmarks(paths : list, patterns : list, repeat : int, memory : bool) -> dict:
+    """
+    **Description:**
+
+    Runs the benchmarks, with names matching any of the patterns, on every image, and prints the results
+
+    **Returns:**
+    - A dictionary of the results, the keys look like: "benchmark:image name"
+    """
+
+    results = {}
+
+    for path in paths:
+        benchmarks, pixels = get_benchmarks(path)
+        image_name = os.path.basename(path)
+
+        for name, run, setup, size in benchmarks:
+            if not any(fnmatch.fnmatch(name, pattern) for pattern in patterns): continue
+
+            result = measure(run, setup, repeat, memory)
+            seconds = max(result["seconds"], 1e-9)
+
+            result["pixels"] = pixels
+            result["bytes"] = size
+            result["mpix_per_s"] = pixels / seconds / 1_000_000
+            result["bytes_per_s"] = size / seconds
+
+            key = f"{name}:{image_name}"
+            results[key] = result
+
+            print(format_result(key, result), flush=True)
+
+    return results
+
+def format_result(key : str, result : dict, change : str = "") -> str:
+    """
+    **Description:**
+
+    Formats a result, as a line of the result table
+    """
+
+    peak = f"{result["peak_bytes"] / 1024 / 1024:>9.2f} MiB" if "peak_bytes" in result else " " * 13
+
+    return f"{key:<56} {result["seconds"]:>10.4f} s {result["mpix_per_s"]:>9.3f} MPix/s {result["bytes_per_s"] / 1024 / 1024:>9.3f} MiB/s {peak} {change}"
+
+def compare(results : dict, baseline : dict, threshold : float) -> list:
+    """
+    **Description:**
+
+    Compares the results with a baseline, and prints the change of every benchmark, that is in both
+
+    **Parameters:**
+    - threshold(float) The slowdown, or memory growth in percent, that counts as a regression
+
+    **Returns:**
+    - The list of regressions, as (key, description) tuples
+    """
+
+    regressions = []
+    limit = 1 + threshold / 100
+
+    print(f"\nCompared with the baseline (threshold: {threshold}%)")
+
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None: continue
+
+        time_change = (result["seconds"] / max(base["seconds"], 1e-9) - 1) * 100
+        change = f"time: {time_change:+.1f}%"
+
+        if result["seconds"] > base["seconds"] * limit and result["seconds"] - base["seconds"] > MIN_SECONDS:
+            regressions.append((key, f"{base["seconds"]:.4f} s -> {result["seconds"]:.4f} s ({time_change:+.1f}%)"))
+
+        if "peak_bytes" in result and "peak_bytes" in base:
+            memory_change = (result["peak_bytes"] / max(base["peak_bytes"], 1) - 1) * 100
+            change += f", memory: {memory_change:+.1f}%"
+
+            if result["peak_bytes"] > base["peak_bytes"] * limit and result["peak_bytes"] - base["peak_bytes"] > MIN_BYTES:
+                regressions.append((key, f"peak memory {base["peak_bytes"]} -> {result["peak_bytes"]} bytes ({memory_change:+.1f}%)"))
+
+        print(format_result(key, result, change))
+
+    return regressions
+
+def save_results(file_name : str, results : dict) -> None:
+    """
+    **Description:**
+
+    Saves the results, with the details of the environment, into a JSON file
+    """
+
+    with open(file_name, "w") as f:
+        json.dump({
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "results": results,
+        }, f, indent=4)
+
+if __name__ == "__main__":
+    # Parse the arguments
+    args = parser.parse_args()
+
+    # From the smallest, to the largest file
+    paths = sorted(
+        {path for pattern in args.images for path in glob.glob(os.path.join(args.folder, pattern))},
+        key = lambda path: (os.path.getsize(path), path),
+    )
+
+    if not paths:
+        parser.error(f"No images found in '{args.folder}', matching: {", ".join(args.images)}")
+
+    print(f"Python {platform.python_version()} ({platform.python_implementation()}), {len(paths)} images\n")
+
+    results = run_benchmarks(paths, args.only, args.repeat, not args.no_memory)
+
+    if args.output:
+        save_results(args.output, results)
+
+    regressions = []
+
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+        regressions = compare(results, baseline["results"], args.threshold)
+
+        if regressions:
+            print(f"\n{len(regressions)} regressions:")
+            for key, description in regressions: print(f" - {key}: {description}")
+        else:
+            print("\nNo regressions")
+
+    elif args.baseline and not args.update_baseline:
+        parser.error(f"Baseline not found: {args.baseline}")
+
+    if args.baseline and args.update_baseline:
+        save_results(args.baseline, results)
+        print(f"\nBaseline saved: {args.baseline}")
+
+    if regressions: sys.exit(1)
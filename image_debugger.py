@@ -1,4 +1,6 @@
 import argparse
+import json
+import sys
 from png import *
 
  # Create the parser
@@ -6,10 +8,78 @@ parser = argparse.ArgumentParser()
 
 # Add the filename argument
 parser.add_argument('filename', type=str, help='File to open and show')
+parser.add_argument('--analyze', action='store_true', help='Only analyze the compression (chunks, filter types, expensive rows, wasted bytes), without decoding the pixels')
+parser.add_argument('--rows', type=int, default=10, help='Number of the most expensive rows to show, when analyzing')
+parser.add_argument('--recompress', action='store_true', help='Also compare the image data with the best compression level, when analyzing (slow)')
+parser.add_argument('--json', action='store_true', help='Print the analysis as JSON')
 
 # Parse the arguments
 args = parser.parse_args()
 
+def print_analysis(result : dict, row_count : int) -> None:
+    """
+    Prints the result of analyze as tables
+    """
+
+    size = result["size"]
+    image_data = result["image_data"]
+
+    print(f"{result["path"]}: {result["width"]}x{result["height"]}, color type {result["color_type"]}, {result["bit_depth"]} bit{", interlaced" if result["interlace_method"] else ""}, {size} bytes")
+    print(f"Analyzed in {result["seconds"] * 1000:.1f}ms\n")
+
+    print("Chunks:")
+    print(f" {"type":<6} {"offset":>10} {"length":>10} {"share":>7}")
+
+    for chunk_type, offset, length in result["chunks"]:
+        print(f" {chunk_type:<6} {offset:>10} {length:>10} {(length + 12) / size * 100:>6.2f}%")
+
+    ratio = image_data["inflated"] / image_data["compressed"] if image_data["compressed"] else 0
+
+    print(f"\nImage data: {image_data["chunks"]} IDAT chunks, {image_data["compressed"]} bytes compressed, {image_data["inflated"]} bytes decompressed ({ratio:.2f}:1)")
+
+    if not image_data["complete"]:
+        print(f" Incomplete: {image_data["expected"]} bytes of scanlines expected")
+
+    rows = result["rows"]
+
+    print("\nFilter types:")
+
+    for filter_type, name in enumerate(PNG._filter_names):
+        count = result["filters"][filter_type]
+        compressed = sum(row["compressed"] for row in rows if row["filter"] == filter_type)
+
+        print(f" - {filter_type} ({name}): {count} rows ({count / max(len(rows), 1) * 100:.1f}%), {compressed:.0f} bytes compressed")
+
+    if result["invalid_filters"]:
+        print(f" - invalid, or missing: {result["invalid_filters"]} rows")
+
+    if row_count > 0 and rows:
+        print(f"\nMost expensive rows:")
+        print(f" {"pass":>4} {"row":>6} {"filter":<8} {"inflated":>9} {"compressed":>11} {"ratio":>7}")
+
+        for row in sorted(rows, key=lambda row: -row["compressed"])[:row_count]:
+            name = PNG._filter_names[row["filter"]] if row["filter"] is not None and row["filter"] < len(PNG._filter_names) else "invalid"
+            print(f" {row["pass"]:>4} {row["row"]:>6} {name:<8} {row["inflated"]:>9} {row["compressed"]:>11.1f} {row["compressed"] / row["inflated"] * 100:>6.1f}%")
+
+    wasted = result["wasted"]
+    total = sum(value for value in wasted.values() if value)
+
+    print(f"\nWasted bytes: {total} ({total / size * 100:.2f}%)")
+
+    for key, value in wasted.items():
+        if value is None: continue
+        print(f" - {key}: {value}")
+
+if args.analyze:
+    result = analyze(args.filename, recompress = args.recompress)
+
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print_analysis(result, args.rows)
+
+    sys.exit()
+
 image_data = [
     [0, 0, 0, 0, 0],
     [0, 1, 0, 1, 0],
@@ -94,11 +164,8 @@ for key in image_data["chunks"]:
                     print(f"{top_ansi_code}{bottom_ansi_code}▄", end=reset_code)
                 print()
 
-            # Count filers
-            filters = [0, 0, 0, 0, 0]
-
-            for f in image_data["chunks"][key]["data"]["filter"]:   
-                filters[f] += 1
+            # Count filers (the decoder does not keep the filter types, they are read by the analysis)
+            filters = analyze(args.filename)["filters"]
 
             print("Filter types:")
             for i, f in enumerate(filters):
@@ -1,26 +1,35 @@
 import argparse
 from png import *
 import os
+import signal
+import time
 
  # Create the parser
 parser = argparse.ArgumentParser()
 
 # Add the filename argument
 parser.add_argument('filename', type=str, help='File to open and show')
+parser.add_argument('--colors', type=str, default='truecolor', choices=['truecolor', '256', '16'], help='Colors supported by the terminal')
+parser.add_argument('--zoom', type=float, default=1, help='Width of the image relative to the terminal width (1 fits the terminal)')
+parser.add_argument('--watch', action='store_true', help='Redraw the image when the terminal is resized, until Ctrl+C is pressed')
+parser.add_argument('--play', action='store_true', help='Play the animation of an animated PNG (APNG) below the image, until Ctrl+C is pressed')
+parser.add_argument('--no-cache', action='store_true', help='Do not read or write the mipmap sidecar file (<filename>.mip)')
 
 # Parse the arguments
 args = parser.parse_args()
 
-# Read image data
-image = PNG(args.filename, flags=PNG_READ)
+# Read image data (or only the downsampled levels, from the sidecar file)
+pyramid = MipmapPyramid(args.filename, use_sidecar = not args.no_cache)
+image_meta = pyramid.meta
 
-color_matrix = image.get_matrix()
-image_meta = image.get_meta()
+def draw() -> None:
+    # Shrink the image to fit inside the terminal (images are never enlarged)
+    w, _ = os.get_terminal_size()
+    width = max(1, min(image_meta["width"], int(w * args.zoom)))
 
-w, _ = os.get_terminal_size()
-scale = int((image_meta["width"] / w) + 1) if image_meta["width"] > w else 1
+    pyramid.get_image(width).print(1, args.colors)
 
-image.print(scale)
+draw()
 
 # # Correct image height
 # height = image_meta["height"]
@@ -47,10 +56,56 @@ image.print(scale)
 #         print(f"{top_ansi_code}{bottom_ansi_code}▄", end=reset_code)
 #     print()
 
-print("Image data")
+def print_meta() -> None:
+    print("Image data")
 
-for key in image_meta:
-    if type(image_meta[key]) is dict: continue
-    if type(image_meta[key]) is list: continue
+    for key in image_meta:
+        if type(image_meta[key]) is dict: continue
+        if type(image_meta[key]) is list: continue
 
-    print(f" - {key}: {image_meta[key]}")
\ No newline at end of file
+        print(f" - {key}: {image_meta[key]}")
+
+print_meta()
+
+if args.play:
+    # Frames are decoded one by one, while they are shown
+    with APNGReader(args.filename) as animation, LivePreview(color_depth = args.colors) as preview:
+        print(f" - frames: {len(animation)}")
+
+        try:
+            loop = 0
+
+            while animation.loop_count == 0 or loop < animation.loop_count:
+                for frame_info, frame in zip(animation.frames, animation):
+                    # The next frame is drawn after the delay of this one
+                    preview.fps = 1 / max(frame_info["delay"], 0.01)
+                    preview.show(frame)
+
+                loop += 1
+
+        except KeyboardInterrupt:
+            pass
+
+elif args.watch and hasattr(signal, "SIGWINCH"):
+    resized = False
+
+    def on_resize(signum, frame) -> None:
+        global resized
+        resized = True
+
+    signal.signal(signal.SIGWINCH, on_resize)
+
+    try:
+        while True:
+            time.sleep(0.1)
+
+            if not resized: continue
+            resized = False
+
+            # Clear the screen, and draw from the top left corner
+            print("\033[2J\033[H", end="")
+            draw()
+            print_meta()
+
+    except KeyboardInterrupt:
+        pass
\ No newline at end of file
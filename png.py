@@ -3,11 +3,6 @@ TODO:
 - generate PNG from array of RGBA colors (truecolor + alpha)
 - generate PNG from array of color indexes (palette based)
 
-- handle multiple IDAT chunks
-- handle interalcing
-
-- zTXt correcly decompress text
-
 - extract palette from any image
 
 - fix bar display length on odd width terminals (0% is 1 character longer)
@@ -20,12 +15,372 @@ https://www.w3.org/TR/png-3/
 
 import zlib
 import os
+import sys
+import io
 import time
+import math
+import struct
+import subprocess
+import fractions
+import collections
+import concurrent.futures
+import hashlib
+import inspect
+import threading
+import fnmatch
+import argparse
+import json
+import glob
+import queue
+import importlib
+import asyncio
+import weakref
+import tempfile
+import shutil
+import copy
+import tracemalloc
+import contextlib
 
 # Flags
 PNG_READ = 1 << 0 # Image reading mode
 PNG_COLOR_PALETTE = 1 << 1 # Plette mode
 PNG_INPUT_ARRAY = 1 << 2 # Input is a 1d array
+PNG_CACHE = 1 << 3 # Decoded images are shared through the decode cache
+PNG_INPUT_BYTES = 1 << 4 # Read mode input is the content of a file, not a file name
+
+# Convolution kernels
+KERNEL_SHARPEN = [
+    [ 0, -1,  0],
+    [-1,  5, -1],
+    [ 0, -1,  0],
+]
+
+KERNEL_EMBOSS = [
+    [-2, -1,  0],
+    [-1,  1,  1],
+    [ 0,  1,  2],
+]
+
+KERNEL_SOBEL_X = [
+    [-1,  0,  1],
+    [-2,  0,  2],
+    [-1,  0,  1],
+]
+
+KERNEL_SOBEL_Y = [
+    [-1, -2, -1],
+    [ 0,  0,  0],
+    [ 1,  2,  1],
+]
+
+def box_kernel(size : int) -> list:
+    """
+    **Description:**
+
+    Returns with a size x size kernel, where every weight is 1 (a box blur, when used with the default divisor)
+    """
+
+    return [[1 for _ in range(size)] for _ in range(size)]
+
+def gaussian_kernel(size : int, sigma : float|None = None) -> list:
+    """
+    **Description:**
+
+    Returns with a size x size gaussian kernel. The kernel is separable, so PNG.convolve will run it as two 1d passes.
+
+    **Parameters:**
+    - size(int) The width and height of the kernel, should be odd
+    - sigma(float) The standard deviation of the curve. When set to None, it is derived from the size
+    """
+
+    if sigma is None: sigma = max(0.5, size / 6)
+
+    center = (size - 1) / 2
+    weights = [math.exp(-((i - center) ** 2) / (2 * sigma * sigma)) for i in range(size)]
+
+    return [[wy * wx for wx in weights] for wy in weights]
+
+def _write_terminal(text : str) -> None:
+    """
+    **Description:**
+
+    Writes the text to the standard output, with a single write call
+    """
+
+    stream = getattr(sys.stdout, "buffer", None)
+
+    # The standard output was replaced (for example with a StringIO)
+    if stream is None:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+        return
+
+    # Anything printed before must appear first
+    sys.stdout.flush()
+
+    stream.write(text.encode(sys.stdout.encoding or "utf-8", errors="replace"))
+    stream.flush()
+
+def _matrix_from_flat(flat : list, width : int, height : int) -> list:
+    """
+    **Description:**
+
+    Converts a flat list of channel values (RGBARGBA...) to a 2d matrix of RGBA colors
+    """
+
+    stride = width * 4
+
+    return [[flat[offset:offset + 4] for offset in range(y * stride, (y + 1) * stride, 4)] for y in range(height)]
+
+def _generate_chunk(chunk_name : bytes, chunk_data : bytes) -> bytearray:
+    """
+    **Description:**
+
+    Generates a complete chunk (length, name, data and CRC) from the name and the data
+    """
+
+    out = bytearray(len(chunk_data).to_bytes(4, 'big'))
+    out += chunk_name
+    out += chunk_data
+    out += (zlib.crc32(chunk_data, zlib.crc32(chunk_name)) & 0xFFFFFFFF).to_bytes(4, 'big')
+
+    return out
+
+def render_frames(render_frame : callable, frame_count : int, workers : int|None = None, max_in_flight : int|None = None, initializer : callable = None, initargs : tuple = ()) -> iter:
+    """
+    **Description:**
+
+    Renders the frames of an animation in parallel, on a pool of processes, and yields the results in the order of the frames, as soon as they are ready.
+    Only a limited number of frames are rendered ahead, so the finished frames waiting to be consumed do not fill up the memory.
+
+    Large inputs (decoded images, samplers) should be passed through the initializer, so they are sent to every process only once, instead of for every frame.
+
+    **Parameters:**
+    - render_frame(callable) A module level function, that receives the frame index, and returns with the result of the frame
+    - frame_count(int) The number of frames in the animation
+    - workers(int) The number of processes, if set to 1, the frames are rendered in this process (**default**: the number of CPU cores)
+    - max_in_flight(int) The maximum number of frames rendered or waiting to be consumed (**default**: 2 * workers)
+    - initializer(callable) A module level function, that is called in every process, before rendering
+    - initargs(tuple) The arguments of the initializer
+
+    **Returns:**
+    - A generator, yielding (frame index, result) tuples
+    """
+
+    if workers is None: workers = os.cpu_count() or 1
+
+    if workers <= 1:
+        if initializer is not None: initializer(*initargs)
+
+        for index in range(frame_count):
+            yield index, render_frame(index)
+
+        return
+
+    if max_in_flight is None: max_in_flight = workers * 2
+
+    pool = concurrent.futures.ProcessPoolExecutor(workers, initializer=initializer, initargs=initargs)
+    pending = collections.deque()
+    next_index = 0
+
+    try:
+        while pending or next_index < frame_count:
+            # Keep the pool busy, but never run too far ahead of the consumer
+            while next_index < frame_count and len(pending) < max_in_flight:
+                pending.append(pool.submit(render_frame, next_index))
+                next_index += 1
+
+            index = next_index - len(pending)
+
+            yield index, pending.popleft().result()
+
+    finally:
+        # The consumer may stop early, the frames that are not started yet are dropped
+        pool.shutdown(cancel_futures=True)
+
+def set_async_limit(limit : int) -> None:
+    """
+    **Description:**
+
+    Sets the maximum number of images loaded (PNG.aopen) or saved (PNG.awrite) at the same time, in an event loop.
+
+    **Parameters:**
+    - limit(int) The number of images (**default**: 4)
+    """
+
+    if limit < 1:
+        raise ValueError(f"Invalid limit: {limit}, must be at least 1!")
+
+    PNG._async_limit = limit
+    PNG._async_limiters = weakref.WeakKeyDictionary()
+
+def set_decode_cache_size(max_bytes : int) -> None:
+    """
+    **Description:**
+
+    Sets the memory budget of the decode cache (used by images read with the PNG_CACHE flag).
+    Images are removed in least recently used order, until the cache fits. Set to 0, to turn off the cache.
+
+    **Parameters:**
+    - max_bytes(int) The approximate maximum memory use of the decoded images (**default**: 64 MiB)
+    """
+
+    with PNG._decode_cache_lock:
+        PNG._decode_cache_max_bytes = max_bytes
+
+        while PNG._decode_cache_bytes > max_bytes:
+            _, evicted = PNG._decode_cache.popitem(last=False)
+            PNG._decode_cache_bytes -= evicted["bytes"]
+
+def clear_decode_cache() -> None:
+    """
+    **Description:**
+
+    Removes every image from the decode cache
+    """
+
+    with PNG._decode_cache_lock:
+        PNG._decode_cache.clear()
+        PNG._decode_cache_bytes = 0
+
+def get_decode_cache_info() -> dict:
+    """
+    **Description:**
+
+    Returns with the state of the decode cache:
+    - entries: int
+    - bytes: int (approximate)
+    - max_bytes: int
+    - hits: int
+    - misses: int
+    """
+
+    with PNG._decode_cache_lock:
+        return {
+            "entries": len(PNG._decode_cache),
+            "bytes": PNG._decode_cache_bytes,
+            "max_bytes": PNG._decode_cache_max_bytes,
+            **PNG._decode_cache_stats,
+        }
+
+def set_instrumentation(hook : "callable|bool|None" = True) -> None:
+    """
+    **Description:**
+
+    Enables, or disables the collection of timings and counters of the phases of reading, processing and writing images.
+    The results are collected into the Stats of every image (see PNG.get_stats). When disabled (**default**), the cost is a single check per phase.
+
+    **Parameters:**
+    - hook(callable|bool) True enables the collection. A function is also called after every measured phase, with (image, phase, seconds, counters).
+    None, or False disables the collection
+
+    **Example:**
+    ```
+    set_instrumentation(lambda image, phase, seconds, counters: print(f"{phase}: {seconds * 1000:.2f}ms {counters}"))
+    ```
+    """
+
+    PNG._instrumentation = hook or None
+
+def set_memory_budget(max_bytes : int|None) -> None:
+    """
+    **Description:**
+
+    Sets the memory, that reading, or writing an image may use (see estimate_memory). Operations, that would need more,
+    switch to streaming: the file, and the image data are processed a few blocks at a time, instead of all at once.
+    If even that needs more memory (the decoded pixels themselves do not fit), MemoryError is raised, before anything is allocated.
+
+    **Parameters:**
+    - max_bytes(int) The budget in bytes, None removes the budget (**default**)
+    """
+
+    if max_bytes is not None and max_bytes < 0:
+        raise ValueError(f"Invalid memory budget: {max_bytes}, must be at least 0!")
+
+    PNG._memory_budget = max_bytes
+
+def set_memory_diagnostics(enabled : bool = True) -> None:
+    """
+    **Description:**
+
+    Enables, or disables measuring the peak memory use of reading (decode), and writing (encode) images, with tracemalloc.
+    The measured peak (peak_bytes), and the estimated peak (peak_estimate) is added to the stats of the image (see PNG.get_stats).
+    Tracing memory makes every operation a lot slower, it is meant for finding the cause of high memory use.
+    """
+
+    PNG._memory_diagnostics = enabled
+
+def estimate_memory(operation : str, width : int, height : int, color_type : int = 6, bit_depth : int = 8, file_size : int = 0, interlaced : bool = False, streaming : bool = False) -> int:
+    """
+    **Description:**
+
+    Estimates the peak memory use of reading, or writing an image, in bytes
+
+    **Parameters:**
+    - operation(str) "decode": reading an image (including the decoded pixels), "encode": encoding, and writing the pixels of an image
+    - width(int), height(int) The size of the image
+    - color_type(int) The color type of the file (3 for paletted images, 6 for RGBA)
+    - bit_depth(int) The bits in a channel
+    - file_size(int) The size of the file, when decoding
+    - interlaced(bool) The image data is interlaced (Adam7), the whole decompressed image data is needed, even when streaming
+    - streaming(bool) Estimate the memory use of streaming decoding, or encoding
+
+    **Returns:**
+    - The estimated peak memory use in bytes
+    """
+
+    if operation not in ("decode", "encode"):
+        raise ValueError(f"Invalid operation: '{operation}', must be decode, or encode!")
+
+    channel_count = PNG._channels_per_color[color_type] if 0 <= color_type < len(PNG._channels_per_color) else 4
+    stride = (width * max(channel_count, 1) * bit_depth + 7) // 8
+    raw_size = height * (stride + 1) # The decompressed image data
+    block_size = PNG._stream_block_size
+
+    # A flat list of channels, and the reconstructed bytes of the current scanline
+    row_size = width * 4 * 8 + 4 * stride
+
+    if operation == "decode":
+        # A list of 4 small integers for every pixel, and a list for every row
+        matrix = width * height * 96 + height * 64
+
+        if streaming:
+            return matrix + row_size + 4 * block_size + (raw_size if interlaced else 0)
+
+        # The file, the joined image data, and the decompressed image data
+        return matrix + row_size + 2 * file_size + raw_size
+
+    # The deflate state of zlib is about 256 KiB
+    deflate_state = 256 * 1024
+
+    if streaming:
+        return row_size + 4 * block_size + deflate_state
+
+    # The scanlines, their cached copy, and the compressed data (copied while the chunk is built, assuming 2:1 compression)
+    return row_size + deflate_state + 2 * raw_size + 3 * raw_size // 2
+
+def shader_invariants(field_function : callable) -> callable:
+    """
+    **Description:**
+
+    Decorator for shaders, that declares per-pixel values, which do not change between shader calls (distances, angles, UV grids...).
+    PNG.shader computes the values once for every image size, and passes the value of the current pixel to the shader,
+    as the `invariants` keyword argument, so an animated shader only has to compute the time dependent part for each frame.
+
+    **Parameters:**
+    - field_function(callable) A function, that looks like the following:
+        - **Parameters:**
+        - uv_position(tuple): (x : float, y : float) The UV position of the pixel
+        - pixel_position(tuple): (x : int, y : int) The coordinate of the pixel
+        - **Returns:**
+        - Any value (or a tuple of values), that will be passed to the shader
+    """
+
+    def decorator(callback : callable) -> callable:
+        callback.invariants = field_function
+        return callback
+
+    return decorator
 
 class PNG:
     log_level : int = 0
@@ -37,6 +392,14 @@ class PNG:
 
     _file_data : bytearray
     _was_modified : bool
+    _dirty_components : set # The parts changed since the file data was encoded: "pixels", "palette", "metadata"
+    _metadata_edits : dict # The text entries ({key: (value, compress)}), and the time ("time") to change on the next encoding
+    _dirty_rect : tuple|None
+    _row_caches : dict # Cache name: {row index: cached value}
+    _back_buffer : list|None # The shader output buffer, reused between passes
+    _front_owned : bool # The current image data was created by this class, and nothing else references it
+    _shared : bool # The image data is shared with the decode cache, it must be copied before modifying it in place
+    _stats : "Stats|None" # Timings and counters of the image, while instrumentation is enabled
 
     # Constants
     _channels_per_color = [
@@ -55,6 +418,40 @@ class PNG:
     _color_type_grayscale_alpha : int = 4
     _color_type_truecolor_alpha : int = 6
 
+    _fixed_point_shift : int = 16 # Fraction bits used by integer convolution weights
+    _edge_modes = ("clamp", "wrap", "mirror", "zero")
+    _resize_methods = ("box", "bilinear", "nearest")
+
+    _invariant_cache : dict = {} # (function, width, height): per pixel values, shared by every image
+    _invariant_cache_size : int = 8
+
+    _decode_cache : collections.OrderedDict = collections.OrderedDict() # Absolute path: decoded image, in least recently used order
+    _decode_cache_bytes : int = 0
+    _decode_cache_max_bytes : int = 64 * 1024 * 1024
+    _decode_cache_lock = threading.Lock()
+    _decode_cache_stats : dict = {"hits": 0, "misses": 0}
+
+    _async_limit : int = 4 # The number of images loaded or saved at the same time, by the coroutines
+    _async_limiters = weakref.WeakKeyDictionary() # Event loop: semaphore
+    _async_time_slice : float = 0.005 # Seconds of work between two yields to the event loop
+
+    _instrumentation : "callable|bool|None" = None # The hook, that is called after every measured phase (see set_instrumentation)
+
+    _memory_budget : int|None = None # Bytes, that reading, or writing an image may use (see set_memory_budget)
+    _memory_diagnostics : bool = False
+    _stream_block_size : int = 64 * 1024 # Bytes of the file, or the image data processed at once, when streaming
+    _filter_names = ("none", "sub", "up", "average", "paeth")
+
+    _color_depths = ("truecolor", "256", "16")
+    _terminal_luts : dict = {} # Color depth: palette index for every 15 bit color
+    _terminal_codes : dict = {} # Color depth: (foreground codes, background codes) for every palette index
+
+    # The default xterm colors of the basic ANSI palette
+    _ansi_16_palette = [
+        (0, 0, 0), (205, 0, 0), (0, 205, 0), (205, 205, 0), (0, 0, 238), (205, 0, 205), (0, 205, 205), (229, 229, 229),
+        (127, 127, 127), (255, 0, 0), (0, 255, 0), (255, 255, 0), (92, 92, 255), (255, 0, 255), (0, 255, 255), (255, 255, 255),
+    ]
+
     def __init__(self, image_data : list = [], width : int = None, height : int = None, palette : list|None = None, flags : int = 0, ) -> None:
         """
         **Description:**
@@ -79,6 +476,9 @@ class PNG:
         - PNG_INPUT_MATRIX (**default**): The image_data must be in a matrix form (2d array, where the first dimension contains the scanlines)
         - PNG_INPUT_ARRAY: The image_data is expected to be an arry, containing pixel values, from top left, to top right,
         then down, mimicking scanlines.
+        - PNG_INPUT_BYTES: Only in read mode. The image_data is the content of a PNG file (bytes), instead of a file name
+        - PNG_CACHE: Only in read mode. The decoded image is kept in memory, and later reads of the same, unchanged file reuse it,
+        instead of decoding it again. The pixels are shared, until the first modification (see set_decode_cache_size)
         """
 
         self.flags = flags
@@ -91,24 +491,35 @@ class PNG:
 
         self._file_data = None
         self._was_modified = False
+        self._dirty_components = set()
+        self._metadata_edits = {"text": {}, "time": None}
+        self._dirty_rect = None
+        self._row_caches = {}
+        self._back_buffer = None
+        self._front_owned = False
+        self._shared = False
+        self._stats = None
 
         if len(image_data) == 0:
             raise ValueError("Image data can not be empty!")
 
         # Read mode
         if self.flags & PNG_READ:
-            with open(image_data, "rb") as f:
-                self._file_data = f.read()
+            if not self.flags & PNG_INPUT_BYTES and self.flags & PNG_CACHE and self._read_cached(image_data):
+                return
 
-            # Get image metadata
-            self.image_meta, raw = self._read_image_data()
+            # The image is streamed, if reading it at once does not fit into the memory budget
+            streaming, estimate = self._plan_decode(image_data)
 
-            # Get color matrix
-            self.image_data = raw["chunks"]["IDAT"]["data"]["matrix"]
+            with self._measure_memory("decode", estimate):
+                if streaming:
+                    self._read_streaming(image_data)
+                    file_stat = None # Streamed images are not cached, the file is not kept in memory
+                else:
+                    file_stat = self._read_file(image_data)
 
-            # Get palette data
-            if "PLTE" in raw["chunks"]:
-                self.palette = raw["chunks"]["PLTE"]["data"]
+            if self.flags & PNG_CACHE and file_stat is not None:
+                self._store_cached(image_data, file_stat)
 
         # Write mode
         else:
@@ -119,739 +530,5315 @@ class PNG:
             if not self.flags & PNG_INPUT_ARRAY and self.image_meta["height"] == None:
                 self.image_meta["height"] = len(self.image_data)
 
-    def fill(self, color):
+    def _read_file(self, source : "str|bytes") -> "os.stat_result|None":
         """
-        ### READ & WRITE MODE
-
         **Description:**
 
-        Fills the entire image with the specified color.
+        Reads the whole file into memory, and decodes it
 
         **Parameters:**
-        - color(tuple): (r : int, g : int, b : int, a : int) The color to fill with
+        - source(str|bytes) The name of the file, or its content (PNG_INPUT_BYTES)
+
+        **Returns:**
+        - The stat of the file, or None, if the content was passed
         """
 
-        self.image_data = [[color for x in range(self.image_meta["width"])] for y in range(self.image_meta["height"])]
-        self._file_data = None
-        self._was_modified = True
+        if self.flags & PNG_INPUT_BYTES:
+            self._file_data = bytes(source)
+            file_stat = None
 
-        pass
+        else:
+            if PNG._instrumentation is not None: start = time.perf_counter()
 
-    def write(self, file_name : str, use_palette : bool|None = None) -> None:
-        """
-        ### READ & WRITE MODE
+            with open(source, "rb") as f:
+                self._file_data = f.read()
+                file_stat = os.fstat(f.fileno())
 
-        **Description:**
-        
-        The function will crate a new file, with the specified name (overwriting previous files) and puts the image into it, as a valid PNG image
+            if PNG._instrumentation is not None: self._record("read", time.perf_counter() - start, {"bytes": len(self._file_data)})
 
-        **Parameters:**
-        - file_name(str) The name of the file, where the image data will be written into.
-        - use_palette(bool) decides whenever to use paletted image generation for the ouput image, or regular RGBA
-        """
+        # Get image metadata
+        self.image_meta, raw = self._read_image_data()
 
-        if not self._file_data or self._was_modified:
-            self._file_data = self._generate_image(use_palette)
+        # Get color matrix
+        self.image_data = raw["chunks"]["IDAT"]["data"]["matrix"]
+        self._front_owned = True
 
-        f = open(file_name, "wb")
-        f.write(self._file_data)
-        f.close()
+        # Get palette data
+        if "PLTE" in raw["chunks"]:
+            self.palette = raw["chunks"]["PLTE"]["data"]
 
-    def get_bytes(self) -> bytearray:
-        """
-        ### READ & WRITE MODE
+        return file_stat
 
+    def _read_streaming(self, source : "str|bytes") -> None:
+        """
         **Description:**
 
-        Returns with the raw bytes read from the image.
-        """
+        Decodes the image, without holding the whole file, and the whole decompressed image data in memory:
+        the image data is read, decompressed and reconstructed a few blocks at a time (see set_memory_budget).
+        Only the small chunks (everything, except IDAT) are kept, to read the metadata from.
 
-        if not self._file_data:
-            self._file_data = self._generate_image()
+        **Parameters:**
+        - source(str|bytes) The name of the file, or its content (PNG_INPUT_BYTES)
+        """
 
-        return self._file_data
+        magic_header = bytes([0x89, 0x50, 0x4E, 0x47, 0x0D, 0x0A, 0x1A, 0x0A])
 
-    def get_matrix(self) -> list:
-        """
-        ### READ & WRITE MODE
+        if self.flags & PNG_INPUT_BYTES:
+            self._file_data = bytes(source)
+            stream = io.BytesIO(self._file_data)
+        else:
+            stream = open(source, "rb")
 
-        **Description:**
+        with stream:
+            if stream.read(len(magic_header)) != magic_header:
+                raise ValueError("Invalid PNG image (Invalid header)")
 
-        Returns with a 2d matrix of RGBA colors, read from the image.
-        """
+            head = bytearray(magic_header)
+            image_chunks = [] # (offset, length) of the IDAT chunks
 
-        return self.image_data
+            while True:
+                chunk_header = stream.read(8)
 
-    def get_meta(self) -> dict:
-        """
-        ### READ MODE
+                if len(chunk_header) < 8:
+                    raise ValueError("Invalid PNG image (Missing IEND chunk)")
 
-        **Description:**
+                chunk_length, chunk_type = struct.unpack(">I4s", chunk_header)
 
-        Returns with a dictionary containing metadata about the read image. The structure looks like this:
-        - width: int
-        - height: int
-        """
+                if chunk_type == b"IDAT":
+                    image_chunks.append((stream.tell(), chunk_length))
+                    stream.seek(chunk_length + 4, os.SEEK_CUR)
+                    continue
 
-        return self.image_meta
+                head += chunk_header + stream.read(chunk_length + 4)
 
-    def shader(self, callback : callable, shader_args : list = [], output : str|None = None) -> any:
-        """
-        ### READ & WRITE MODE
+                if chunk_type == b"IEND": break
 
-        **Description:**
+            if not image_chunks:
+                raise ValueError("No image data found!")
 
-        This function will itrate over every pixel in the image, calling the provided callback function on every pixel, essentially acting a a shader.
-        The return value of the callback function, will replace the pixel value in the image. **NOTE: The return values are recorded in to a buffer, and
-        the original image data is replaced at the end of the iteration**
+            # The metadata is parsed from the small chunks
+            file_data = self._file_data
+            self._file_data = head
 
-        **Parameters:**
-        - callback: A function, that will be called on every pixel of the image, looks like the following:
-            - **Parameters:**
-            - uv_position(tuple): (x : float, y : float) The UV position of this pixel, values range from 0 to 1 inclusive.
-            - pixel_position(tuple): (x : int, y : int) The coordinate of the current pixel, as whole integers.
-            - color(tuple): (r : int, g : int, b : int, a : int) The color of the current pixel, as an RGBA tuple. Color values are integers, from 0 to 255 inclusive.
-            - **Returns:**
-            - output_color(touple): (r : int, g : int, b : int, a: int)
-            - *args: THe passed arguments to the shader
-        - output(str):
-            - None: The funcion will output nothing
-            - print: The function wil print out the progress like so: Processing... {completed} / {total} ({percent}%) and prints a carridge return (\\r) after it.
-            - bar: The function will print a progress bar after each scanline. The progress bar's width is the whole screen, and it is 1 character high
-        - shader_args(list): Any additional arguments that will be passed to the callback function, in an unpacked form
-        """
+            try:
+                self.image_meta, raw = self._read_image_data(decode_pixels = False)
+            finally:
+                self._file_data = file_data
 
-        buffer = []
+            header = raw["chunks"]["IHDR"]["data"]
+            palette = raw["chunks"]["PLTE"]["data"] if "PLTE" in raw["chunks"] else []
 
-        for y, scanline in enumerate(self.image_data):
-            buffer_line = []
+            channel_count = self._channels_per_color[header["color_type"]]
+            pixel_size = int(channel_count * (header["bit_depth"] / 8))
+            scanline_size = header["width"] * pixel_size + 1
 
-            for x, pixel in enumerate(scanline):
-                uv_x = x / self.image_meta["width"]
-                uv_y = y / self.image_meta["height"]
+            pieces = self._inflate_chunks(stream, image_chunks)
 
-                try:
-                    color_out = callback((uv_x, uv_y), (x, y), pixel, *shader_args)
-                except Exception as e:
-                    raise e
+            if header["interlace_method"] == 1:
+                # The passes of interlaced images are spread over the whole image data
+                self.image_data = self._read_interlaced(b"".join(pieces), header, pixel_size, palette)
 
-                for i, channel in enumerate(color_out):
-                    color_out[i] =  int(channel) % 256
+            else:
+                instrumented = PNG._instrumentation is not None
+                expand_seconds = 0.0
+                matrix = []
 
-                buffer_line.append(color_out)
+                for row in self._unfilter_rows(self._split_scanlines(pieces, scanline_size), header["width"], header["height"], pixel_size):
+                    if instrumented: start = time.perf_counter()
 
-            progress = (y / len(self.image_data))
+                    flat = self._row_to_rgba(row, header["color_type"], palette)
+                    matrix.append([flat[offset:offset + 4] for offset in range(0, len(flat), 4)])
 
-            match output:
-                case "print":
-                    print(f"Processing {y}/{len(self.image_data)} ({int(progress * 100)}%)", end="\r")
-                case "bar":
-                    w, _ = os.get_terminal_size()
-                    w -= 15 # Numbers on the side
-                    progress += 0.001
-                    filled = int(progress * w)
-                    empty = int((1 - progress) * w)
-                    print(f"{y:>4}/{len(self.image_data):>4}|{"#"*filled}{"."*empty}|{int(progress * 100):>3}%", end="\r")
+                    if instrumented: expand_seconds += time.perf_counter() - start
 
-            buffer.append(buffer_line)
+                if instrumented: self._record("expand", expand_seconds, {"pixels": header["width"] * header["height"]})
 
-        # Add a new line if printing was done
-        if not output is None: print()
+                self.image_data = matrix
 
-        # Set image data to the modified buffer
-        self.image_data = buffer
+        self._front_owned = True
 
-        # MArk the image as modified
-        self._was_modified = True
+        if "PLTE" in raw["chunks"]:
+            self.palette = palette
 
-    def print(self, step : int|None = None) -> None:
+    def _inflate_chunks(self, stream, image_chunks : list) -> iter:
         """
         **Description:**
 
-        Prints the image to the console, using the BOTTOM HALF (▄) ascii character and ansi escape sequences,
-        to set the foreground and background color of a character. Each character represents 2 pixels above each other.
-        If the image height is odd, then a single black line will be preinted at the bottom (This is not part of the image data)
+        Reads, and decompresses the image data from a stream, one block at a time
 
         **Parameters:**
-        - step(int) The number of steps to take, to reach the next pixel. **MUST BE >= 1** For example, when set to 2,
-        then a single pixel will be skipped over, and the image will be half as big on both axis.
-        If set to None (default) then the image wil be scaled automatically to fully fit inside the terminal
+        - stream(file) The stream of the PNG file
+        - image_chunks(list) The (offset, length) of every IDAT chunk in the stream
+
+        **Returns:**
+        - A generator, yielding the pieces of the decompressed image data (at most one block each)
         """
-        
-        if step is None or step < 1:
-            w, _ = os.get_terminal_size()
-            step = int((self.image_meta["width"] / w) + 1) if self.image_meta["width"] > w else 1
 
-        buffer = self.image_data
+        block_size = PNG._stream_block_size
+        inflater = zlib.decompressobj()
 
-        # Correct image height
-        height = self.image_meta["height"]
-        if height % 2 != 0:
-            # Add an additional black line at the bottom of the image to display the last odd row
-            buffer.append([[0, 0, 0, 0] for _ in range(self.image_meta["width"])])
+        instrumented = PNG._instrumentation is not None
+        inflate_seconds, inflated = 0.0, 0
 
-        # Draw pixels as characters
-        for y in range(0, height, 2 * step):
-            for x in range( 0, self.image_meta["width"], step ):
-                pixel_top = buffer[y][x]
-                pixel_bottom = buffer[y + 1][x]
-
-                # Multiplied alpha
-                a_top = pixel_top[3] / 255
-                pixel_top = [int(c * a_top) for c in pixel_top[0:-1:1]]
-                top_ansi_code = f"\033[48;2;{pixel_top[0]};{pixel_top[1]};{pixel_top[2]}m"
-                
-                a_bottom = pixel_bottom[3] / 255
-                pixel_bottom = [int(c * a_bottom) for c in pixel_bottom[0:-1:1]]
-                bottom_ansi_code = f"\033[38;2;{pixel_bottom[0]};{pixel_bottom[1]};{pixel_bottom[2]}m"
-                
-                reset_code = "\033[0m"
-                print(f"{top_ansi_code}{bottom_ansi_code}▄", end=reset_code)
-            print()
+        for offset, length in image_chunks:
+            stream.seek(offset)
+            remaining = length
 
-    def _paeth_predictor_o(self, a, b, c) -> float:
-        p = a + b - c
-        pa = abs(p - a)
-        pb = abs(p - b)
-        pc = abs(p - c)
+            while remaining > 0:
+                block = stream.read(min(remaining, block_size))
 
-        if pa <= pb and pa <= pc: return a
-        if pb <= pc: return b
-        return c
+                if len(block) == 0:
+                    raise ValueError("Invalid PNG image (Unexpected end of file)")
 
-    def _paeth_predictor(self, a : int, b : int, c : int) -> float:
-        p = a + b - c
-        pa = abs(p - a)
-        pb = abs(p - b)
-        pc = abs(p - c)
+                remaining -= len(block)
 
-        if pa <= pb and pa <= pc: return a
-        if pb <= pc: return b
-        return c
+                # The output is limited, the rest of the input is decompressed in the next round
+                while block:
+                    if instrumented: start = time.perf_counter()
+
+                    piece = inflater.decompress(block, block_size)
+                    block = inflater.unconsumed_tail
+
+                    if instrumented: inflate_seconds, inflated = inflate_seconds + time.perf_counter() - start, inflated + len(piece)
+
+                    yield piece
+
+        piece = inflater.flush()
 
+        if instrumented: self._record("inflate", inflate_seconds, {"bytes": inflated + len(piece)})
 
-    def _read_image_data(self) -> tuple:
+        yield piece
+
+    def _split_scanlines(self, pieces : iter, scanline_size : int) -> iter:
         """
         **Description:**
 
-        Reads the image data from self._file_data and parses it, retrieving IHDR metadata palette data and text data.
+        Splits the pieces of the decompressed image data into scanlines (filter type, and the bytes of the row)
+        """
 
-        **Returns:**
+        pending = bytearray()
 
-        This function returns with 2 values, as a tuple.
-        - The first one is a nicely formatted dictionary holding only the necessary data
-        - The second value is a dictionary holding every data read from the image
+        for piece in pieces:
+            pending += piece
+            offset = 0
+
+            while len(pending) - offset >= scanline_size:
+                yield pending[offset:offset + scanline_size]
+                offset += scanline_size
 
+            del pending[:offset]
+
+    def _plan_decode(self, source : "str|bytes") -> tuple:
         """
+        **Description:**
 
-        if not self._file_data:
-            raise ValueError("No image data found!")
+        Decides how to read the image, based on the memory budget, and its header (IHDR)
 
-        magic_header = bytearray([0x89, 0x50, 0x4E, 0x47, 0x0D, 0x0A, 0x1A, 0x0A])
+        **Returns:**
+        - Whenever to stream the image, and the estimated peak memory use (0, when there is no budget, and no diagnostics)
+        """
 
-        buffer = self._file_data
+        if PNG._memory_budget is None and not PNG._memory_diagnostics:
+            return False, 0
 
-        # Check for the magic header
-        if buffer[:len(magic_header)] == magic_header:
-            buffer = buffer[len(magic_header):]
+        if self.flags & PNG_INPUT_BYTES:
+            head, file_size = bytes(source[:33]), len(source)
         else:
-            raise ValueError("Invalid PNG image (Invalid header)")
+            with open(source, "rb") as f:
+                head, file_size = f.read(33), os.fstat(f.fileno()).st_size
 
-        out = {
-            "size": len(self._file_data),
-            "chunks": {},
-        }
+        # Invalid files are left for the decoder, to report the error
+        if len(head) < 33 or head[12:16] != b"IHDR":
+            return False, 0
 
-        while len(buffer) > 0:
-            chunk_length = int.from_bytes(buffer[:4])
-            buffer = buffer[4:]
+        width, height, bit_depth, color_type, _, _, interlace_method = struct.unpack(">IIBBBBB", head[16:29])
 
-            chunk_type = str(buffer[:4], encoding="ascii")
-            buffer = buffer[4:]
+        size = {"width": width, "height": height, "color_type": color_type, "bit_depth": bit_depth, "interlaced": interlace_method == 1}
 
-            chunk_data_bytes = buffer[:chunk_length]
-            buffer = buffer[chunk_length:]
+        return self._check_budget(
+            "decode",
+            estimate_memory("decode", file_size = file_size, **size),
+            estimate_memory("decode", file_size = file_size, streaming = True, **size),
+            width, height,
+        )
 
-            chunk_crc = buffer[:4]
-            buffer = buffer[4:]
+    def _plan_encode(self, use_palette : bool|None = None, allow_streaming : bool = True) -> tuple:
+        """
+        **Description:**
 
-            out["chunks"][chunk_type] = {
-                "length": chunk_length,
-                "data_bytes": chunk_data_bytes,
-                "data": {},
-                "crc": chunk_crc,
-            }
+        Decides how to encode the image, based on the memory budget
 
-        for key in out["chunks"]:
-            match key:
+        **Returns:**
+        - Whenever to stream the image, and the estimated peak memory use (0, when there is no budget, and no diagnostics)
+        """
+
+        if PNG._memory_budget is None and not PNG._memory_diagnostics:
+            return False, 0
+
+        # The compressed image data is copied from the previous encoding
+        if self._can_reuse_pixels(use_palette):
+            return False, 2 * len(self._file_data) if self._dirty_components else 0
+
+        if use_palette == None: use_palette = self.flags & PNG_COLOR_PALETTE
+
+        width, height = self.image_meta["width"], self.image_meta["height"]
+        color_type = PNG._color_type_indexed if use_palette else PNG._color_type_truecolor_alpha
+
+        return self._check_budget(
+            "encode",
+            estimate_memory("encode", width, height, color_type),
+            estimate_memory("encode", width, height, color_type, streaming = True) if allow_streaming else None,
+            width, height,
+        )
+
+    def _check_budget(self, operation : str, estimate : int, streaming_estimate : int|None, width : int, height : int) -> tuple:
+        """
+        **Description:**
+
+        Compares the estimated memory use of an operation with the memory budget
+
+        **Returns:**
+        - Whenever to use streaming, and the estimated peak memory use
+
+        **Raises:**
+        - MemoryError, if the operation does not fit into the budget, even with streaming
+        """
+
+        budget = PNG._memory_budget
+
+        if budget is None or estimate <= budget:
+            return False, estimate
+
+        if streaming_estimate is not None and streaming_estimate <= budget:
+            return True, streaming_estimate
+
+        needed = streaming_estimate if streaming_estimate is not None else estimate
+
+        raise MemoryError(
+            f"Can not {operation} the image ({width}x{height}), it needs about {needed / 1024 / 1024:.1f} MiB, "
+            f"but the memory budget is {budget / 1024 / 1024:.1f} MiB!"
+        )
+
+    @contextlib.contextmanager
+    def _measure_memory(self, operation : str, estimate : int) -> iter:
+        """
+        **Description:**
+
+        Measures the peak memory use of an operation with tracemalloc, when memory diagnostics are enabled (see set_memory_diagnostics),
+        and adds it to the stats of the image, with the estimate
+        """
+
+        if not PNG._memory_diagnostics:
+            yield
+            return
+
+        # Someone else may be tracing already, then only the peak is reset
+        started = not tracemalloc.is_tracing()
+
+        if started:
+            tracemalloc.start()
+        else:
+            tracemalloc.reset_peak()
+
+        first = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] - first
+
+            if started: tracemalloc.stop()
+
+            counters = {"peak_bytes": peak, "peak_estimate": estimate}
+            self.get_stats().add(operation, seconds, counters)
+
+            if callable(PNG._instrumentation): PNG._instrumentation(self, operation, seconds, counters)
+
+    def _read_cached(self, file_name : str) -> bool:
+        """
+        **Description:**
+
+        Takes the decoded image from the decode cache, if the file did not change since it was stored
+
+        **Returns:**
+
+        True, if the image was found in the cache
+        """
+
+        try:
+            file_stat = os.stat(file_name)
+        except OSError:
+            return False
+
+        key = os.path.abspath(file_name)
+
+        with PNG._decode_cache_lock:
+            entry = PNG._decode_cache.get(key)
+
+            if entry is None or entry["mtime"] != file_stat.st_mtime_ns or entry["size"] != file_stat.st_size:
+                PNG._decode_cache_stats["misses"] += 1
+                return False
+
+            PNG._decode_cache.move_to_end(key)
+            PNG._decode_cache_stats["hits"] += 1
+
+        self._file_data = entry["file_data"]
+        # The nested text, and time dictionaries are copied too, so changing them does not change the cached image
+        self.image_meta = copy.deepcopy(entry["meta"])
+        self.image_data = entry["matrix"]
+        self.palette = [color[:] for color in entry["palette"]] if entry["palette"] else entry["palette"]
+
+        # The pixels are shared with the cache (and other images), until the first modification
+        self._shared = True
+        self._front_owned = False
+
+        return True
+
+    def _store_cached(self, file_name : str, file_stat : os.stat_result) -> None:
+        """
+        **Description:**
+
+        Puts the decoded image into the decode cache, and removes the least recently used images, if the cache is too big
+        """
+
+        width = self.image_meta["width"]
+        height = self.image_meta["height"]
+
+        # Approximate memory use: a list of 4 small integers for every pixel, and the file itself
+        size = width * height * 96 + height * 64 + len(self._file_data)
+
+        if size > PNG._decode_cache_max_bytes: return
+
+        key = os.path.abspath(file_name)
+
+        with PNG._decode_cache_lock:
+            previous = PNG._decode_cache.pop(key, None)
+            if previous is not None: PNG._decode_cache_bytes -= previous["bytes"]
+
+            PNG._decode_cache[key] = {
+                "mtime": file_stat.st_mtime_ns,
+                "size": file_stat.st_size,
+                "bytes": size,
+                "file_data": self._file_data,
+                "meta": copy.deepcopy(self.image_meta),
+                "matrix": self.image_data,
+                "palette": [color[:] for color in self.palette] if self.palette else self.palette,
+            }
+            PNG._decode_cache_bytes += size
+
+            while PNG._decode_cache_bytes > PNG._decode_cache_max_bytes:
+                _, evicted = PNG._decode_cache.popitem(last=False)
+                PNG._decode_cache_bytes -= evicted["bytes"]
+
+        # This image shares the pixels with the cache from now on
+        self._shared = True
+        self._front_owned = False
+
+    def fill(self, color):
+        """
+        ### READ & WRITE MODE
+
+        **Description:**
+
+        Fills the entire image with the specified color.
+
+        **Parameters:**
+        - color(tuple): (r : int, g : int, b : int, a : int) The color to fill with
+        """
+
+        self.image_data = [[color for x in range(self.image_meta["width"])] for y in range(self.image_meta["height"])]
+        self._front_owned = False # Every pixel is the same color object
+        self._shared = False
+        self._file_data = None
+        self._mark_dirty()
+
+    def set_palette(self, palette : list) -> None:
+        """
+        ### READ & WRITE MODE
+
+        **Description:**
+
+        Replaces the colors of the palette, every pixel keeps its palette index. Works on paletted images (PNG_COLOR_PALETTE),
+        and on images read from an indexed PNG file. Only the palette is encoded again on the next write, if the pixels were not changed.
+
+        **Parameters:**
+        - palette(list) The new colors, (r, g, b) or (r, g, b, a), at least as many, as the current palette has
+
+        **Example:**
+        ```
+        image = PNG("logo.png", flags=PNG_READ)
+        image.set_palette([(255 - r, 255 - g, 255 - b, a) for r, g, b, a in image.palette])
+        image.write("inverted.png")
+        ```
+        """
+
+        if not self.palette or not (self.flags & PNG_COLOR_PALETTE or self.image_meta.get("color_type") == PNG._color_type_indexed):
+            raise ValueError("The image has no palette!")
+
+        if len(palette) < len(self.palette) or len(palette) > 256:
+            raise ValueError(f"Invalid palette size: {len(palette)}, must be between {len(self.palette)} and 256 colors!")
+
+        new_palette = []
+
+        for color in palette:
+            if len(color) not in (3, 4) or any(type(channel) is not int or channel < 0 or channel > 255 for channel in color):
+                raise ValueError(f"Invalid palette color: {color}!")
+
+            new_palette.append([*color[:3], color[3] if len(color) == 4 else 255])
+
+        if not self.flags & PNG_COLOR_PALETTE:
+            # The pixels are colors, they are replaced with the new color of their palette index
+            if self._can_reuse_pixels():
+                indexes = self._read_palette_indexes()
+            else:
+                # The pixels were changed, the index of a pixel is found by its color (the other pixels are left as is)
+                lookup = {}
+                for index, color in reversed(list(enumerate(self.palette))): lookup[tuple(color)] = index
+
+                indexes = [[lookup.get(tuple(pixel)) for pixel in line] for line in self.image_data]
+
+            self.image_data = [
+                [new_palette[index][:] if index is not None else pixel for index, pixel in zip(index_line, line)]
+                for index_line, line in zip(indexes, self.image_data)
+            ]
+            self._back_buffer = None
+            self._front_owned = True
+            self._shared = False
+
+        self.palette = new_palette
+        if "palette" in self.image_meta: self.image_meta["palette"] = new_palette
+
+        self._mark_dirty(component="palette")
+
+    def set_text(self, key : str, value : str|None, compress : bool = False) -> None:
+        """
+        ### READ & WRITE MODE
+
+        **Description:**
+
+        Sets a text entry of the image, written on the next write. Every existing entry with the same key is replaced.
+        The image data is not encoded again, if only the metadata was changed (see edit_metadata, to change a file without reading it).
+
+        **Parameters:**
+        - key(str) The keyword, 1 - 79 Latin-1 characters
+        - value(str) The text, None removes the entry
+        - compress(bool) Store the text compressed (zTXt, or compressed iTXt)
+        """
+
+        # Checks the key, and the value before anything is changed
+        if value is not None: _generate_text_chunk(key, value, compress)
+
+        self._metadata_edits["text"][key] = (value, compress)
+        self._dirty_components.add("metadata")
+        self._was_modified = True
+
+    def set_time(self, modification_time : "dict|bool" = True) -> None:
+        """
+        ### READ & WRITE MODE
+
+        **Description:**
+
+        Sets the modification time of the image, written on the next write, without encoding the image data again.
+
+        **Parameters:**
+        - modification_time(dict|bool) The time (year, month, day, hour, minute, second), True for the current (UTC) time, False to remove the time
+        """
+
+        if modification_time: _generate_time_chunk(modification_time)
+
+        self._metadata_edits["time"] = modification_time
+        self._dirty_components.add("metadata")
+        self._was_modified = True
+
+    def write(self, file_name : str, use_palette : bool|None = None) -> None:
+        """
+        ### READ & WRITE MODE
+
+        **Description:**
+        
+        The function will crate a new file, with the specified name (overwriting previous files) and puts the image into it, as a valid PNG image
+
+        **Parameters:**
+        - file_name(str) The name of the file, where the image data will be written into.
+        - use_palette(bool) decides whenever to use paletted image generation for the ouput image, or regular RGBA
+
+        Only the changed parts of the image are encoded again: when only the palette, or the metadata was changed,
+        the compressed image data is copied from the previous encoding (or the original file).
+        If encoding the image at once does not fit into the memory budget, it is encoded, and written a few rows at a time (see set_memory_budget)
+        """
+
+        streaming, estimate = self._plan_encode(use_palette)
+
+        with self._measure_memory("encode", estimate):
+            if streaming:
+                self._write_streaming(file_name, use_palette)
+
+            else:
+                file_data = self._encode(use_palette)
+
+                instrumented = PNG._instrumentation is not None
+                if instrumented: start = time.perf_counter()
+
+                f = open(file_name, "wb")
+                f.write(file_data)
+                f.close()
+
+                if instrumented: self._record("write", time.perf_counter() - start, {"bytes": len(file_data)})
+
+        self._dirty_rect = None
+
+    def _write_streaming(self, file_name : str, use_palette : bool|None = None) -> None:
+        """
+        **Description:**
+
+        Encodes the image into a file, a few rows at a time, without holding the scanlines, or the compressed image data in memory.
+        The encoded image is not kept (the next write encodes the image again), and the scanlines are not cached.
+        """
+
+        if use_palette == None: use_palette = self.flags & PNG_COLOR_PALETTE
+
+        generate = self._generate_scanlines_palette if use_palette else self._generate_scanlines_rgb
+        block_size = PNG._stream_block_size
+
+        instrumented = PNG._instrumentation is not None
+        deflate_seconds, deflated = 0.0, 0
+
+        deflater = zlib.compressobj()
+        pending = bytearray()
+
+        with open(file_name, "wb") as f:
+            f.write(self._generate_head(use_palette) + self._generate_metadata_chunks())
+
+            for y in range(len(self.image_data)):
+                scanline = generate(self.image_data, None, y, y + 1)
+
+                if instrumented: start = time.perf_counter()
+
+                pending += deflater.compress(scanline)
+
+                if instrumented: deflate_seconds, deflated = deflate_seconds + time.perf_counter() - start, deflated + len(scanline)
+
+                if len(pending) >= block_size:
+                    f.write(_generate_chunk(b"IDAT", pending))
+                    pending = bytearray()
+
+            pending += deflater.flush()
+
+            f.write(_generate_chunk(b"IDAT", pending))
+            f.write(_generate_chunk(b"IEND", b""))
+
+        if instrumented: self._record("deflate", deflate_seconds, {"bytes": deflated})
+
+    @classmethod
+    async def aopen(cls, file_name : str, flags : int = 0, executor : concurrent.futures.Executor|None = None) -> "PNG":
+        """
+        ### READ MODE
+
+        **Description:**
+
+        Reads an image, without blocking the event loop (coroutine). The file is read, and decompressed in the executor,
+        the scanlines are decoded in the event loop, with a yield after every few milliseconds of work.
+        Only a limited number of images are loaded, or saved at the same time (see set_async_limit).
+
+        **Parameters:**
+        - file_name(str) The name of the file to read
+        - flags(int) The flags of the image (PNG_READ is always added)
+        - executor(Executor) Runs the blocking parts (**default**: the default executor of the event loop)
+
+        **Example:**
+        ```
+        image = await PNG.aopen("image.png")
+        ```
+        """
+
+        loop = asyncio.get_running_loop()
+        flags |= PNG_READ
+
+        async with cls._get_async_limiter():
+            # An empty image, the data is filled in below
+            image = cls([[[0, 0, 0, 0]]], flags = flags & ~PNG_READ)
+            image.flags = flags
+
+            if flags & PNG_CACHE and image._read_cached(file_name):
+                return image
+
+            streaming, _ = await loop.run_in_executor(executor, image._plan_decode, file_name)
+
+            # The image does not fit into the memory budget, it is streamed in the executor instead
+            if streaming:
+                await loop.run_in_executor(executor, image._read_streaming, file_name)
+                return image
+
+            def read_file() -> tuple:
+                with open(file_name, "rb") as f:
+                    return f.read(), os.fstat(f.fileno())
+
+            instrumented = PNG._instrumentation is not None
+            if instrumented: start = time.perf_counter()
+
+            image._file_data, file_stat = await loop.run_in_executor(executor, read_file)
+
+            if instrumented: image._record("read", time.perf_counter() - start, {"bytes": len(image._file_data)})
+
+            # Only the small chunks are parsed here
+            image.image_meta, raw = image._read_image_data(decode_pixels = False)
+
+            if "IDAT" not in raw["chunks"]:
+                raise ValueError("No image data found!")
+
+            header = raw["chunks"]["IHDR"]["data"]
+            palette = raw["chunks"]["PLTE"]["data"] if "PLTE" in raw["chunks"] else []
+
+            channel_count = cls._channels_per_color[header["color_type"]]
+            pixel_size = int(channel_count * (header["bit_depth"] / 8))
+
+            if instrumented: start = time.perf_counter()
+
+            data = await loop.run_in_executor(executor, zlib.decompress, raw["chunks"]["IDAT"]["data_bytes"])
+
+            if instrumented: image._record("inflate", time.perf_counter() - start, {"bytes": len(data)})
+
+            if header["interlace_method"] == 1:
+                matrix = await loop.run_in_executor(executor, image._read_interlaced, data, header, pixel_size, palette)
+            else:
+                matrix = []
+                slice_end = time.perf_counter() + cls._async_time_slice
+                expand_seconds = 0.0
+
+                for row in image._unfilter_rows(data, header["width"], header["height"], pixel_size):
+                    if instrumented: start = time.perf_counter()
+
+                    flat = image._row_to_rgba(row, header["color_type"], palette)
+                    matrix.append([flat[offset:offset + 4] for offset in range(0, len(flat), 4)])
+
+                    if instrumented: expand_seconds += time.perf_counter() - start
+
+                    if time.perf_counter() >= slice_end:
+                        await asyncio.sleep(0)
+                        slice_end = time.perf_counter() + cls._async_time_slice
+
+                if instrumented: image._record("expand", expand_seconds, {"pixels": header["width"] * header["height"]})
+
+            image.image_data = matrix
+            image.palette = palette or None
+            image._front_owned = True
+
+            if flags & PNG_CACHE:
+                image._store_cached(file_name, file_stat)
+
+        return image
+
+    async def awrite(self, file_name : str, use_palette : bool|None = None, executor : concurrent.futures.Executor|None = None) -> None:
+        """
+        ### READ & WRITE MODE
+
+        **Description:**
+
+        Writes the image, like write, without blocking the event loop (coroutine). The scanlines are serialized in the event loop,
+        with a yield after every few milliseconds of work, the compression and the file writing is done in the executor.
+
+        **Parameters:**
+        - file_name(str) The name of the file, where the image data will be written into.
+        - use_palette(bool) decides whenever to use paletted image generation for the ouput image, or regular RGBA
+        - executor(Executor) Runs the blocking parts (**default**: the default executor of the event loop)
+        """
+
+        loop = asyncio.get_running_loop()
+
+        async with self._get_async_limiter():
+            streaming, _ = self._plan_encode(use_palette)
+
+            if streaming:
+                await loop.run_in_executor(executor, self._write_streaming, file_name, use_palette)
+                self._dirty_rect = None
+                return
+
+            if self._can_reuse_pixels(use_palette):
+                self._encode(use_palette)
+
+            else:
+                if use_palette == None: use_palette = self.flags & PNG_COLOR_PALETTE
+
+                if use_palette:
+                    generate = self._generate_scanlines_palette
+                    row_cache = self._row_caches.setdefault(("IDAT", "palette"), {})
+                else:
+                    generate = self._generate_scanlines_rgb
+                    row_cache = self._row_caches.setdefault(("IDAT", "rgba"), {})
+
+                out = self._generate_head(use_palette)
+                pixel_data = bytearray()
+                slice_end = time.perf_counter() + self._async_time_slice
+
+                for y in range(len(self.image_data)):
+                    pixel_data += generate(self.image_data, row_cache, y, y + 1)
+
+                    if time.perf_counter() >= slice_end:
+                        await asyncio.sleep(0)
+                        slice_end = time.perf_counter() + self._async_time_slice
+
+                instrumented = PNG._instrumentation is not None
+                if instrumented: start = time.perf_counter()
+
+                compressed = await loop.run_in_executor(executor, zlib.compress, pixel_data)
+
+                if instrumented: self._record("deflate", time.perf_counter() - start, {"bytes": len(pixel_data)})
+
+                out += _generate_chunk(b"IDAT", compressed)
+                out += _generate_chunk(b"IEND", b"")
+
+                self._set_encoded(self._apply_chunk_edits(out, replace_palette=False))
+
+            def write_file(data : bytes) -> None:
+                with open(file_name, "wb") as f:
+                    f.write(data)
+
+            instrumented = PNG._instrumentation is not None
+            if instrumented: start = time.perf_counter()
+
+            await loop.run_in_executor(executor, write_file, self._file_data)
+
+            if instrumented: self._record("write", time.perf_counter() - start, {"bytes": len(self._file_data)})
+
+        self._dirty_rect = None
+
+    @classmethod
+    def _get_async_limiter(cls) -> asyncio.Semaphore:
+        """
+        **Description:**
+
+        Returns with the semaphore, that limits the number of images loaded or saved at the same time, in the running event loop
+        """
+
+        loop = asyncio.get_running_loop()
+        limiter = PNG._async_limiters.get(loop)
+
+        if limiter is None:
+            limiter = asyncio.Semaphore(PNG._async_limit)
+            PNG._async_limiters[loop] = limiter
+
+        return limiter
+
+    def get_bytes(self) -> bytearray:
+        """
+        ### READ & WRITE MODE
+
+        **Description:**
+
+        Returns with the raw bytes read from the image. If the image was changed, it is encoded first (see write).
+        The whole encoded image is returned, so it is never streamed: MemoryError is raised, if it does not fit into the memory budget.
+        """
+
+        _, estimate = self._plan_encode(allow_streaming = False)
+
+        with self._measure_memory("encode", estimate):
+            return self._encode()
+
+    def get_stats(self) -> "Stats":
+        """
+        ### READ & WRITE MODE
+
+        **Description:**
+
+        Returns with the timings and counters of the phases (reading, decoding, shaders, encoding, writing) of this image,
+        collected while instrumentation is enabled (see set_instrumentation). The returned object keeps collecting, until it is reset.
+
+        **Example:**
+        ```
+        set_instrumentation()
+        image = PNG("image.png", flags=PNG_READ)
+        image.write("copy.png")
+        print(image.get_stats())
+        ```
+        """
+
+        if self._stats is None:
+            self._stats = Stats()
+
+        return self._stats
+
+    def _record(self, phase : str, seconds : float, counters : dict|None = None) -> None:
+        """
+        **Description:**
+
+        Records a measured phase into the stats of the image, and calls the instrumentation hook. Only called, when instrumentation is enabled
+        """
+
+        hook = PNG._instrumentation
+        if hook is None: return
+
+        self.get_stats().add(phase, seconds, counters)
+
+        if callable(hook): hook(self, phase, seconds, counters or {})
+
+    def _can_reuse_pixels(self, use_palette : bool|None = None) -> bool:
+        """
+        **Description:**
+
+        Checks whenever the compressed image data of the last encoding (or the original file) can be written again as is:
+        the pixels were not changed since, and the requested color type is the same
+        """
+
+        if not self._file_data or "pixels" in self._dirty_components:
+            return False
+
+        if use_palette == None: return True
+
+        # The color type in the IHDR chunk
+        return bool(use_palette) == (self._file_data[25] == PNG._color_type_indexed)
+
+    def _encode(self, use_palette : bool|None = None) -> bytearray:
+        """
+        **Description:**
+
+        Returns with the encoded image. Only the changed parts are encoded again: when the pixels did not change,
+        every chunk is copied from the previous encoding, except the palette, and the metadata, if they were changed.
+        """
+
+        if self._can_reuse_pixels(use_palette):
+            if self._dirty_components:
+                self._set_encoded(self._apply_chunk_edits(self._file_data, replace_palette="palette" in self._dirty_components))
+
+        else:
+            self._set_encoded(self._apply_chunk_edits(self._generate_image(use_palette), replace_palette=False))
+
+        return self._file_data
+
+    def _set_encoded(self, file_data : bytearray) -> None:
+        """
+        **Description:**
+
+        Stores the result of an encoding, the image has no pending changes after it
+        """
+
+        self._file_data = file_data
+        self._was_modified = False
+        self._dirty_components = set()
+        self._metadata_edits = {"text": {}, "time": None}
+
+    def _generate_metadata_chunks(self) -> bytearray:
+        """
+        **Description:**
+
+        Generates the text, and time chunks of the pending metadata changes (see set_text, and set_time)
+        """
+
+        out = bytearray()
+
+        for key, (value, compress) in self._metadata_edits["text"].items():
+            if value is not None: out += _generate_text_chunk(key, value, compress)
+
+        if self._metadata_edits["time"]: out += _generate_time_chunk(self._metadata_edits["time"])
+
+        return out
+
+    def _apply_chunk_edits(self, file_data : bytes, replace_palette : bool) -> bytes:
+        """
+        **Description:**
+
+        Applies the pending metadata changes (and the new palette, if replace_palette is set) to an encoded image, without touching the image data
+        """
+
+        text = self._metadata_edits["text"]
+        modification_time = self._metadata_edits["time"]
+
+        if not text and modification_time is None and not replace_palette:
+            return file_data
+
+        new_chunks = self._generate_metadata_chunks()
+        palette_chunks = None
+
+        if replace_palette:
+            palette_chunks = _generate_chunk(b"PLTE", bytes(channel for color in self.palette for channel in color[:3]))
+
+            # Trailing opaque entries can be left out
+            alphas = bytes(color[3] if len(color) > 3 else 255 for color in self.palette).rstrip(b"\xff")
+            if alphas: palette_chunks += _generate_chunk(b"tRNS", alphas)
+
+        source = io.BytesIO(file_data)
+        source.seek(8) # The magic header
+
+        target = io.BytesIO()
+        target.write(file_data[:8])
+
+        _copy_chunks(source, target, new_chunks, set(text), modification_time is not None, palette_chunks)
+
+        return bytearray(target.getvalue())
+
+    def get_matrix(self) -> list:
+        """
+        ### READ & WRITE MODE
+
+        **Description:**
+
+        Returns with a 2d matrix of RGBA colors, read from the image.
+        """
+
+        # The caller may modify the pixels directly, so the cached rows can not be trusted anymore
+        self._row_caches = {}
+
+        # The decode cache must not see the changes of the caller
+        if self._shared:
+            self.image_data = [[pixel[:] if type(pixel) is list else pixel for pixel in line] for line in self.image_data]
+            self._shared = False
+
+        # The caller keeps a reference to the pixels, so they can not be reused as a shader output buffer
+        self._front_owned = False
+
+        return self.image_data
+
+    def copy(self) -> "PNG":
+        """
+        ### READ & WRITE MODE
+
+        **Description:**
+
+        Returns with a new image (in write mode), that has its own copy of the pixels, so it can be modified without changing this image.
+        """
+
+        image_data = [[pixel[:] if type(pixel) is list else pixel for pixel in line] for line in self.image_data]
+        palette = [color[:] for color in self.palette] if self.palette else self.palette
+
+        out = PNG(image_data, self.image_meta["width"], self.image_meta["height"], palette, self.flags & ~PNG_READ)
+        out.image_meta = dict(self.image_meta)
+
+        # The pixels are the same, so the encoded image can be reused, until the copy is modified
+        out._file_data = self._file_data
+        out._was_modified = self._was_modified
+        out._dirty_components = set(self._dirty_components)
+        out._metadata_edits = {"text": dict(self._metadata_edits["text"]), "time": self._metadata_edits["time"]}
+        out._front_owned = True
+
+        return out
+
+    def get_meta(self) -> dict:
+        """
+        ### READ MODE
+
+        **Description:**
+
+        Returns with a dictionary containing metadata about the read image. The structure looks like this:
+        - width: int
+        - height: int
+        """
+
+        return self.image_meta
+
+    def shader(self, callback : callable, shader_args : list = [], output : str|None = None, sampler : "Sampler|bool" = False, region : tuple|None = None, mask : list|None = None) -> any:
+        """
+        ### READ & WRITE MODE
+
+        **Description:**
+
+        This function will itrate over every pixel in the image, calling the provided callback function on every pixel, essentially acting a a shader.
+        The return value of the callback function, will replace the pixel value in the image. **NOTE: The return values are written in to a second buffer,
+        and the two buffers are swapped at the end of the iteration. The previous image data is reused as the output buffer of the next pass,
+        unless it was returned by get_matrix (or not created by this class)**
+
+        **Parameters:**
+        - callback: A function, that will be called on every pixel of the image, looks like the following:
+            - **Parameters:**
+            - uv_position(tuple): (x : float, y : float) The UV position of this pixel, values range from 0 to 1 inclusive.
+            - pixel_position(tuple): (x : int, y : int) The coordinate of the current pixel, as whole integers.
+            - color(tuple): (r : int, g : int, b : int, a : int) The color of the current pixel, as an RGBA tuple. Color values are integers, from 0 to 255 inclusive.
+            - **Returns:**
+            - output_color(touple): (r : int, g : int, b : int, a: int)
+            - *args: THe passed arguments to the shader
+        - output(str):
+            - None: The funcion will output nothing
+            - print: The function wil print out the progress like so: Processing... {completed} / {total} ({percent}%) and prints a carridge return (\\r) after it.
+            - bar: The function will print a progress bar after each scanline. The progress bar's width is the whole screen, and it is 1 character high
+        - shader_args(list): Any additional arguments that will be passed to the callback function, in an unpacked form
+        - sampler(Sampler|bool): When set, the sampler is passed to the callback function as the `sampler` keyword argument, so the shader can read
+        other pixels of the image. If set to True, a Sampler (wrap addressing, nearest filtering) is created from the image before the pass
+        - region(tuple): (left : int, top : int, right : int, bottom : int) When set, the callback is only called inside this rectangle (right and bottom are exclusive),
+        every other pixel is kept as it is
+        - mask(list): A 2d matrix, the same size as the image. When set, the callback is only called on pixels, where the mask value is truthy
+
+        **Invariants:**
+
+        If the callback was decorated with @shader_invariants, the invariant value of the current pixel is passed to it as the `invariants` keyword argument.
+        The invariant values are computed only once for every image size, and are reused by later shader calls (for example, in the next animation frame)
+        """
+
+        if sampler is True:
+            sampler = Sampler(self)
+
+        if sampler:
+            shader_kwargs = {"sampler": sampler}
+        else:
+            shader_kwargs = {}
+
+        width = self.image_meta["width"]
+        height = self.image_meta["height"]
+
+        # Precomputed UV coordinates for every column and row
+        uv_columns = [x / width for x in range(width)]
+        uv_rows = [y / height for y in range(height)]
+
+        field_function = getattr(callback, "invariants", None)
+        field = self._get_invariant_field(field_function, width, height) if field_function else None
+
+        left, top, right, bottom = self._get_region(region, mask)
+
+        instrumented = PNG._instrumentation is not None
+        if instrumented: start = time.perf_counter()
+
+        front = self.image_data
+        back = self._get_back_buffer(width, height)
+
+        # Unchanged pixels are swapped between the buffers, if the front buffer can be reused, otherwise they are copied
+        swap = self._front_owned
+
+        for y, scanline in enumerate(front):
+            back_line = back[y]
+
+            # Rows outside of the region are kept as they are
+            if y < top or y >= bottom:
+                if swap:
+                    back[y], front[y] = scanline, back_line
+                else:
+                    for out_pixel, pixel in zip(back_line, scanline): out_pixel[:] = pixel
+
+                continue
+
+            uv_y = uv_rows[y]
+            field_offset = y * width
+            mask_line = mask[y] if mask else None
+
+            for x, pixel in enumerate(scanline):
+                if x < left or x >= right or (mask_line and not mask_line[x]):
+                    if swap:
+                        back_line[x], scanline[x] = pixel, back_line[x]
+                    else:
+                        back_line[x][:] = pixel
+
+                    continue
+
+                uv_x = uv_columns[x]
+
+                if field: shader_kwargs["invariants"] = field[field_offset + x]
+
+                # Shaders may modify the input color, that is only allowed, if nothing else uses the pixel
+                color_out = callback((uv_x, uv_y), (x, y), pixel if swap else pixel[:], *shader_args, **shader_kwargs)
+                channel_count = len(color_out)
+
+                if channel_count > 4:
+                    raise ValueError(f"The shader '{getattr(callback, "__name__", callback)}' returned {channel_count} channels for the pixel ({x}, {y}), at most 4 are allowed!")
+
+                # Write the result into the back buffer, the returned color may be the input pixel itself
+                out_pixel = back_line[x]
+
+                for i, channel in enumerate(color_out):
+                    out_pixel[i] = int(channel) % 256
+
+                # The buffer is reused, so the channels the shader did not return are reset, instead of keeping an older pass
+                if channel_count < 4: out_pixel[channel_count:] = [0] * (4 - channel_count)
+
+            progress = (y / len(front))
+
+            match output:
+                case "print":
+                    print(f"Processing {y}/{len(front)} ({int(progress * 100)}%)", end="\r")
+                case "bar":
+                    w, _ = os.get_terminal_size()
+                    w -= 15 # Numbers on the side
+                    progress += 0.001
+                    filled = int(progress * w)
+                    empty = int((1 - progress) * w)
+                    print(f"{y:>4}/{len(front):>4}|{"#"*filled}{"."*empty}|{int(progress * 100):>3}%", end="\r")
+
+        # Add a new line if printing was done
+        if not output is None: print()
+
+        if instrumented: self._record("shader", time.perf_counter() - start, {"pixels": (right - left) * (bottom - top)})
+
+        # Swap the buffers, the old image data will be overwritten by the next pass, if nothing else uses it
+        self.image_data = back
+        self._back_buffer = front if self._front_owned else None
+        self._front_owned = True
+        self._shared = False
+
+        # MArk the image as modified
+        self._mark_dirty((left, top, right, bottom))
+
+    def get_dirty_rect(self) -> tuple|None:
+        """
+        ### READ & WRITE MODE
+
+        **Description:**
+
+        Returns with the rectangle (left, top, right, bottom), that contains every pixel modified since the image was read, created or last written.
+        Returns None, if nothing was modified.
+        """
+
+        return self._dirty_rect
+
+    def _get_back_buffer(self, width : int, height : int) -> list:
+        """
+        **Description:**
+
+        Returns with the buffer, that the next shader pass writes into. The buffer of the previous pass is reused, if it has the right size.
+        """
+
+        back = self._back_buffer
+
+        if back is not None and len(back) == height and all(len(line) == width for line in back):
+            return back
+
+        return [[[0, 0, 0, 0] for x in range(width)] for y in range(height)]
+
+    def _get_region(self, region : tuple|None, mask : list|None) -> tuple:
+        """
+        **Description:**
+
+        Clamps the region to the image, and shrinks it to the bounding box of the mask (if there is any)
+        """
+
+        width = self.image_meta["width"]
+        height = self.image_meta["height"]
+
+        if region is None:
+            left, top, right, bottom = 0, 0, width, height
+        else:
+            left, top, right, bottom = region
+            left = max(0, min(width, left))
+            right = max(left, min(width, right))
+            top = max(0, min(height, top))
+            bottom = max(top, min(height, bottom))
+
+        if mask:
+            rows = [y for y in range(top, bottom) if any(mask[y][left:right])]
+
+            if len(rows) == 0:
+                return (left, top, left, top)
+
+            top = rows[0]
+            bottom = rows[-1] + 1
+
+            columns = [x for x in range(left, right) if any(mask[y][x] for y in range(top, bottom))]
+
+            left = columns[0]
+            right = columns[-1] + 1
+
+        return (left, top, right, bottom)
+
+    def _mark_dirty(self, rect : tuple|None = None, component : str = "pixels") -> None:
+        """
+        **Description:**
+
+        Marks an area of the image as modified, and drops the cached rows (encoded scanlines, printed lines) that overlap with it.
+
+        **Parameters:**
+        - rect(tuple) (left, top, right, bottom) The modified area. When set to None, the whole image is marked as modified
+        - component(str) The changed part of the image: "pixels", or "palette" (the colors changed, but the palette indexes did not)
+        """
+
+        width = self.image_meta["width"]
+        height = self.image_meta["height"]
+
+        if rect is None:
+            rect = (0, 0, width, height)
+
+        left, top, right, bottom = rect
+
+        # Nothing was modified
+        if right <= left or bottom <= top: return
+
+        self._was_modified = True
+        self._dirty_components.add(component)
+
+        if self._dirty_rect is None:
+            self._dirty_rect = rect
+        else:
+            self._dirty_rect = (
+                min(self._dirty_rect[0], left),
+                min(self._dirty_rect[1], top),
+                max(self._dirty_rect[2], right),
+                max(self._dirty_rect[3], bottom),
+            )
+
+        if top == 0 and bottom >= height:
+            self._row_caches = {}
+            return
+
+        for key, rows in self._row_caches.items():
+            for y in range(top, bottom):
+                rows.pop(y, None)
+
+                # A printed line also shows the row below its key
+                if key[0] == "print": rows.pop(y - 1, None)
+
+    def _get_invariant_field(self, field_function : callable, width : int, height : int) -> list:
+        """
+        **Description:**
+
+        Returns with the values of the invariant function for every pixel (from top left to bottom right), for the given image size.
+        The computed fields are cached on the class, so every image with the same size shares them.
+        """
+
+        key = (field_function, width, height)
+
+        if key in PNG._invariant_cache:
+            return PNG._invariant_cache[key]
+
+        field = []
+
+        for y in range(height):
+            uv_y = y / height
+
+            for x in range(width):
+                field.append(field_function((x / width, uv_y), (x, y)))
+
+        # Drop the oldest field, if the cache is full
+        if len(PNG._invariant_cache) >= PNG._invariant_cache_size:
+            del PNG._invariant_cache[next(iter(PNG._invariant_cache))]
+
+        PNG._invariant_cache[key] = field
+
+        return field
+
+    def convolve(self, kernel : list, edge_mode : str = "clamp", divisor : float|None = None, offset : int = 0, preserve_alpha : bool = False) -> None:
+        """
+        ### READ & WRITE MODE
+
+        **Description:**
+
+        Convolves the image with the given kernel (blur, sharpen, emboss, edge detection...). Rank-1 (separable) kernels, like box and gaussian blurs,
+        are detected automatically and applied as two 1d passes. The weights are converted to integer fixed-point values, and whole scanlines are
+        accumulated at once, by sliding the kernel window over a padded copy of each row, so this is much faster than a neighbourhood shader.
+
+        **Parameters:**
+        - kernel(list) A 2d matrix of weights. The kernel is centered on the pixel at (width // 2, height // 2) of the kernel
+        - edge_mode(str) Decides what pixels are used outside of the image:
+            - clamp (**default**): The closest edge pixel is repeated
+            - wrap: The image is tiled
+            - mirror: The image is reflected at the edges
+            - zero: Transparent black pixels are used
+        - divisor(float) Every weight is divided by this value. When set to None, the sum of the kernel is used (or 1, if the sum is 0)
+        - offset(int) This value is added to every channel after the convolution (for example 128 for emboss like effects)
+        - preserve_alpha(bool) When set to True, the alpha channel is left untouched
+        """
+
+        if edge_mode not in self._edge_modes:
+            raise ValueError(f"Invalid edge mode: '{edge_mode}', must be one of: {", ".join(self._edge_modes)}")
+
+        width = self.image_meta["width"]
+        height = self.image_meta["height"]
+
+        flat = self._get_flat()
+        values = self._convolve_flat(flat, width, height, kernel, edge_mode, divisor)
+
+        if offset != 0:
+            values = [v + offset for v in values]
+
+        # Clamp the results to the 0 - 255 range
+        out = [0 if v < 0 else (255 if v > 255 else v) for v in values]
+
+        if preserve_alpha:
+            out[3::4] = flat[3::4]
+
+        self._set_flat(out, width, height)
+
+    def edge_detect(self, edge_mode : str = "clamp") -> None:
+        """
+        ### READ & WRITE MODE
+
+        **Description:**
+
+        Replaces the image with its edges, using the Sobel operator. The brightness of a pixel is the gradient magnitude (|Gx| + |Gy|),
+        averaged over the color channels. The alpha channel is left untouched.
+
+        **Parameters:**
+        - edge_mode(str) clamp, wrap, mirror or zero, see PNG.convolve
+        """
+
+        width = self.image_meta["width"]
+        height = self.image_meta["height"]
+
+        flat = self._get_flat()
+        gradient_x = self._convolve_flat(flat, width, height, KERNEL_SOBEL_X, edge_mode, 1)
+        gradient_y = self._convolve_flat(flat, width, height, KERNEL_SOBEL_Y, edge_mode, 1)
+
+        magnitude = [abs(gx) + abs(gy) for gx, gy in zip(gradient_x, gradient_y)]
+
+        out = [0] * len(flat)
+
+        for i in range(0, len(flat), 4):
+            brightness = (magnitude[i] + magnitude[i + 1] + magnitude[i + 2]) // 3
+            if brightness > 255: brightness = 255
+
+            out[i] = brightness
+            out[i + 1] = brightness
+            out[i + 2] = brightness
+            out[i + 3] = flat[i + 3]
+
+        self._set_flat(out, width, height)
+
+    def resize(self, width : int, height : int, method : str = "box") -> None:
+        """
+        ### READ & WRITE MODE
+
+        **Description:**
+
+        Resizes the image to the given size. The source pixels (and their weights) for every output column and row are computed once,
+        and then whole scanlines are accumulated at once.
+
+        **Parameters:**
+        - width(int) The new width of the image in pixels
+        - height(int) The new height of the image in pixels
+        - method(str) The resampling method:
+            - box (**default**): Every output pixel is the average of the source pixels it covers, best for making thumbnails
+            - bilinear: The 2x2 closest source pixels are mixed, based on their distance, best for small changes and enlarging
+            - nearest: The closest source pixel is used, the fastest, but it looks blocky
+        """
+
+        if method not in self._resize_methods:
+            raise ValueError(f"Invalid resize method: '{method}', must be one of: {", ".join(self._resize_methods)}")
+
+        if width < 1 or height < 1:
+            raise ValueError("The size of the image must be at least 1x1!")
+
+        out = self._resize_flat(self._get_flat(), self.image_meta["width"], self.image_meta["height"], width, height, method)
+
+        self._set_flat(out, width, height)
+
+    def to_palette(self, max_colors : int = 256) -> None:
+        """
+        ### READ & WRITE MODE
+
+        **Description:**
+
+        Converts the image to palette mode. If the image has more colors than the limit, similar colors are merged
+        (by dropping the lowest bits of every channel), and the palette holds the average of the merged colors.
+        After the conversion, the pixels are palette indexes, so only writing and printing the palette is possible.
+
+        **Parameters:**
+        - max_colors(int) The maximum number of colors in the palette (1 - 256)
+        """
+
+        if max_colors < 1 or max_colors > 256:
+            raise ValueError(f"Invalid number of colors: {max_colors}, must be between 1 and 256!")
+
+        width = self.image_meta["width"]
+        height = self.image_meta["height"]
+
+        flat = self._get_flat()
+        packed = [r << 24 | g << 16 | b << 8 | a for r, g, b, a in zip(flat[0::4], flat[1::4], flat[2::4], flat[3::4])]
+
+        # Drop bits, until the colors fit in to the palette
+        for shift in range(8):
+            channel_mask = (0xFF << shift) & 0xFF
+            mask = channel_mask * 0x01010101
+
+            buckets = [value & mask for value in packed] if shift else packed
+            counts = collections.Counter(buckets)
+
+            if len(counts) <= max_colors: break
+
+        bucket_colors = list(counts)
+
+        # Even 1 bit channels have too many colors, only the most common ones are kept, and the rest is replaced with the closest one
+        bucket_map = {bucket: bucket for bucket in bucket_colors}
+
+        if len(bucket_colors) > max_colors:
+            kept = [bucket for bucket, _ in counts.most_common(max_colors)]
+
+            def unpack(value : int) -> tuple:
+                return (value >> 24, (value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF)
+
+            for bucket in bucket_colors:
+                color = unpack(bucket)
+                bucket_map[bucket] = min(kept, key=lambda other: sum((a - b) ** 2 for a, b in zip(color, unpack(other))))
+
+            bucket_colors = kept
+
+        indexes = {bucket: index for index, bucket in enumerate(bucket_colors)}
+
+        # The palette colors are the average of the original colors
+        sums = [[0, 0, 0, 0, 0] for _ in bucket_colors]
+
+        for value, bucket in zip(packed, buckets):
+            total = sums[indexes[bucket_map[bucket]]]
+            total[0] += value >> 24
+            total[1] += (value >> 16) & 0xFF
+            total[2] += (value >> 8) & 0xFF
+            total[3] += value & 0xFF
+            total[4] += 1
+
+        self.palette = [[(channel + total[4] // 2) // total[4] for channel in total[:4]] for total in sums]
+
+        index_list = [indexes[bucket_map[bucket]] for bucket in buckets]
+
+        self.image_data = [index_list[y * width:(y + 1) * width] for y in range(height)]
+        self.flags |= PNG_COLOR_PALETTE
+
+        self._back_buffer = None
+        self._front_owned = True
+        self._shared = False
+        self._file_data = None
+        self._mark_dirty()
+
+    def _resize_flat(self, flat : list, width : int, height : int, new_width : int, new_height : int, method : str) -> list:
+        """
+        **Description:**
+
+        Resizes a flat RGBA buffer, and returns with the new flat buffer
+        """
+
+        stride = width * 4
+
+        column_taps = self._resample_table(width, new_width, method)
+        row_taps = self._resample_table(height, new_height, method)
+
+        if method == "nearest":
+            # Every output channel comes from exactly one source channel
+            indices = [taps[0][0] * 4 + channel for taps in column_taps for channel in range(4)]
+            rows = {}
+            out = []
+
+            for taps in row_taps:
+                y = taps[0][0]
+
+                if y not in rows:
+                    line = flat[y * stride:(y + 1) * stride]
+                    rows[y] = [line[i] for i in indices]
+
+                out += rows[y]
+
+            return out
+
+        # Split the column taps into slots, slot j holds the j-th source pixel (and weight) of every output column
+        slot_count = max(len(taps) for taps in column_taps)
+        slots = []
+
+        for j in range(slot_count):
+            indices = []
+            weights = []
+
+            for taps in column_taps:
+                index, weight = taps[j] if j < len(taps) else (0, 0)
+
+                indices += [index * 4 + channel for channel in range(4)]
+                weights += [weight] * 4
+
+            slots.append((indices, weights))
+
+        # Horizontally resized source rows, computed when first needed
+        rows = {}
+
+        def resized_row(y : int) -> list:
+            if y in rows: return rows[y]
+
+            line = flat[y * stride:(y + 1) * stride]
+            acc = None
+
+            for indices, weights in slots:
+                if acc is None:
+                    acc = [w * line[i] for i, w in zip(indices, weights)]
+                else:
+                    acc = [a + w * line[i] for a, i, w in zip(acc, indices, weights)]
+
+            rows[y] = acc
+            return acc
+
+        total_shift = self._fixed_point_shift * 2
+        half = 1 << (total_shift - 1)
+
+        out = []
+
+        for taps in row_taps:
+            acc = None
+
+            for y, weight in taps:
+                if acc is None:
+                    acc = [weight * v for v in resized_row(y)]
+                else:
+                    acc = [a + weight * v for a, v in zip(acc, resized_row(y))]
+
+            out += [(a + half) >> total_shift for a in acc]
+
+        return out
+
+    def _resample_table(self, size : int, new_size : int, method : str) -> list:
+        """
+        **Description:**
+
+        Returns with the source pixels of every output pixel along one axis, as a list of [(source index, fixed-point weight), ...] lists.
+        The weights of an output pixel add up to exactly 1 (1 << _fixed_point_shift).
+        """
+
+        one = 1 << self._fixed_point_shift
+        scale = size / new_size
+
+        table = []
+
+        for i in range(new_size):
+            match method:
+                case "nearest":
+                    taps = [(min(size - 1, int((i + 0.5) * scale)), 1.0)]
+
+                case "bilinear":
+                    center = (i + 0.5) * scale - 0.5
+                    x0 = math.floor(center)
+                    t = center - x0
+
+                    taps = [(max(0, min(size - 1, x0)), 1 - t), (max(0, min(size - 1, x0 + 1)), t)]
+
+                case "box":
+                    start = i * scale
+                    end = (i + 1) * scale
+
+                    taps = []
+
+                    for x in range(int(start), min(size, math.ceil(end))):
+                        overlap = min(end, x + 1) - max(start, x)
+                        if overlap > 0: taps.append((x, overlap / scale))
+
+            # Convert to fixed-point, and give the rounding error to the largest weight
+            weights = [round(w * one) for _, w in taps]
+            largest = weights.index(max(weights))
+            weights[largest] += one - sum(weights)
+
+            table.append([(index, weight) for (index, _), weight in zip(taps, weights) if weight != 0])
+
+        return table
+
+    def _convolve_flat(self, flat : list, width : int, height : int, kernel : list, edge_mode : str, divisor : float|None = None) -> list:
+        """
+        **Description:**
+
+        Convolves a flat RGBA buffer with the kernel, and returns with the rounded but **not clamped** channel values
+
+        **Parameters:**
+        - flat(list) The channel values of the image (RGBARGBA...) from top left to bottom right
+        - width(int) The width of the image in pixels
+        - height(int) The height of the image in pixels
+        - kernel(list) A 2d matrix of weights
+        - edge_mode(str) clamp, wrap, mirror or zero
+        - divisor(float) Every weight is divided by this value, None means the sum of the kernel
+        """
+
+        if len(kernel) == 0 or len(kernel[0]) == 0:
+            raise ValueError("Kernel can not be empty!")
+
+        if divisor is None:
+            divisor = sum(sum(row) for row in kernel)
+            if divisor == 0: divisor = 1
+
+        shift = self._fixed_point_shift
+        kernel = [[weight / divisor for weight in row] for row in kernel]
+
+        stride = width * 4
+
+        # Split the image into scanlines, and pad them horizontally
+        rows = [flat[y * stride:(y + 1) * stride] for y in range(height)]
+
+        separable = self._decompose_kernel(kernel)
+
+        if separable:
+            column, row = separable
+
+            # Horizontal pass, keeps the fixed-point scale
+            row_weights = [round(w * (1 << shift)) for w in row]
+            rows = [self._convolve_row(self._pad_row(line, width, len(row), edge_mode), row_weights, stride) for line in rows]
+
+            # Vertical pass
+            column_weights = [round(w * (1 << shift)) for w in column]
+            window = self._pad_rows(rows, height, len(column), edge_mode, stride)
+
+            total_shift = shift * 2
+            half = 1 << (total_shift - 1)
+            out = []
+
+            for y in range(height):
+                acc = None
+
+                for k, weight in enumerate(column_weights):
+                    if weight == 0: continue
+
+                    if acc is None:
+                        acc = [weight * v for v in window[y + k]]
+                    else:
+                        acc = [a + weight * v for a, v in zip(acc, window[y + k])]
+
+                if acc is None: acc = [0] * stride
+
+                out += [(a + half) >> total_shift for a in acc]
+
+            return out
+
+        # Generic 2d kernel, every scanline is the sum of the shifted, padded neighbour lines
+        weights = [[round(w * (1 << shift)) for w in row] for row in kernel]
+        kernel_width = len(weights[0])
+
+        padded = [self._pad_row(line, width, kernel_width, edge_mode) for line in rows]
+        window = self._pad_rows(padded, height, len(weights), edge_mode, (width + kernel_width - 1) * 4)
+
+        half = 1 << (shift - 1)
+        out = []
+
+        for y in range(height):
+            acc = None
+
+            for ky, row in enumerate(weights):
+                line = window[y + ky]
+
+                for kx, weight in enumerate(row):
+                    if weight == 0: continue
+
+                    segment = line[kx * 4:kx * 4 + stride]
+
+                    if acc is None:
+                        acc = [weight * v for v in segment]
+                    else:
+                        acc = [a + weight * v for a, v in zip(acc, segment)]
+
+            if acc is None: acc = [0] * stride
+
+            out += [(a + half) >> shift for a in acc]
+
+        return out
+
+    def _convolve_row(self, padded : list, weights : list, stride : int) -> list:
+        """
+        **Description:**
+
+        Slides the 1d kernel over a padded scanline. Each tap is applied to the whole line at once.
+        """
+
+        acc = None
+
+        for k, weight in enumerate(weights):
+            if weight == 0: continue
+
+            segment = padded[k * 4:k * 4 + stride]
+
+            if acc is None:
+                acc = [weight * v for v in segment]
+            else:
+                acc = [a + weight * v for a, v in zip(acc, segment)]
+
+        return acc if acc is not None else [0] * stride
+
+    def _decompose_kernel(self, kernel : list) -> tuple|None:
+        """
+        **Description:**
+
+        Checks if the kernel is separable (rank-1), meaning kernel[y][x] = column[y] * row[x]
+
+        **Returns:**
+
+        A tuple of (column, row) weights, or None, if the kernel can not be separated
+        """
+
+        # Single column or single row kernels are always separable
+        if len(kernel[0]) == 1: return [row[0] for row in kernel], [1]
+        if len(kernel) == 1: return [1], kernel[0]
+
+        # Use the row, and column with the largest weights as the base
+        pivot_row = max(kernel, key=lambda row: max(abs(w) for w in row))
+        pivot_x = max(range(len(pivot_row)), key=lambda x: abs(pivot_row[x]))
+
+        if pivot_row[pivot_x] == 0: return None
+
+        column = [row[pivot_x] / pivot_row[pivot_x] for row in kernel]
+
+        tolerance = 1e-9 * abs(pivot_row[pivot_x])
+
+        for y, row in enumerate(kernel):
+            for x, weight in enumerate(row):
+                if abs(weight - column[y] * pivot_row[x]) > tolerance:
+                    return None
+
+        return column, pivot_row
+
+    def _edge_indices(self, size : int, before : int, after : int, edge_mode : str) -> list:
+        """
+        **Description:**
+
+        Returns with the source indices for a line of pixels, that is extended on both sides. -1 means a zero (transparent) pixel.
+        """
+
+        indices = []
+
+        for i in range(-before, size + after):
+            if 0 <= i < size:
+                indices.append(i)
+                continue
+
+            match edge_mode:
+                case "clamp":
+                    indices.append(0 if i < 0 else size - 1)
+                case "wrap":
+                    indices.append(i % size)
+                case "mirror":
+                    period = 2 * (size - 1)
+                    i = i % period if period > 0 else 0
+                    indices.append(period - i if i >= size else i)
+                case "zero":
+                    indices.append(-1)
+
+        return indices
+
+    def _pad_row(self, line : list, width : int, kernel_size : int, edge_mode : str) -> list:
+        before = kernel_size // 2
+        after = kernel_size - before - 1
+
+        if before == 0 and after == 0: return line
+
+        padded = []
+
+        for i in self._edge_indices(width, before, after, edge_mode):
+            padded += line[i * 4:i * 4 + 4] if i >= 0 else [0, 0, 0, 0]
+
+        return padded
+
+    def _pad_rows(self, rows : list, height : int, kernel_size : int, edge_mode : str, stride : int) -> list:
+        before = kernel_size // 2
+        after = kernel_size - before - 1
+
+        zero_row = [0] * stride
+
+        return [rows[i] if i >= 0 else zero_row for i in self._edge_indices(height, before, after, edge_mode)]
+
+    def _get_flat(self) -> list:
+        """
+        **Description:**
+
+        Returns with the color matrix, as a flat list of channel values (RGBARGBA...) from top left to bottom right
+        """
+
+        if len(self.image_data) > 0 and len(self.image_data[0]) > 0 and type(self.image_data[0][0]) is int:
+            raise ValueError("This operation is not supported on palette index data!")
+
+        return [channel for scanline in self.image_data for pixel in scanline for channel in pixel]
+
+    def _set_flat(self, flat : list, width : int, height : int) -> None:
+        """
+        **Description:**
+
+        Replaces the color matrix with the pixels from a flat list of channel values
+        """
+
+        self.image_data = _matrix_from_flat(flat, width, height)
+        self.image_meta["width"] = width
+        self.image_meta["height"] = height
+
+        self._front_owned = True
+        self._shared = False
+        self._file_data = None
+        self._mark_dirty()
+
+    def print(self, step : int|None = None, color_depth : str = "truecolor") -> None:
+        """
+        **Description:**
+
+        Prints the image to the console, using the BOTTOM HALF (▄) ascii character and ansi escape sequences,
+        to set the foreground and background color of a character. Each character represents 2 pixels above each other.
+        If the image height is odd, then a single black line will be preinted at the bottom (This is not part of the image data)
+
+        The whole frame is built in memory, and written out at once. Color codes are only emitted, when they differ from the previous character's colors.
+
+        **Parameters:**
+        - step(int) The number of steps to take, to reach the next pixel. **MUST BE >= 1** For example, when set to 2,
+        then a single pixel will be skipped over, and the image will be half as big on both axis.
+        If set to None (default) then the image wil be scaled automatically to fully fit inside the terminal
+        - color_depth(str) The colors supported by the terminal:
+            - truecolor (**default**): 24 bit colors
+            - 256: The xterm 256 color palette, the color codes are much shorter
+            - 16: The basic ANSI colors, supported by almost every terminal
+        """
+        
+        if step is None or step < 1:
+            w, _ = os.get_terminal_size()
+            step = int((self.image_meta["width"] / w) + 1) if self.image_meta["width"] > w else 1
+
+        if color_depth not in self._color_depths:
+            raise ValueError(f"Invalid color depth: '{color_depth}', must be one of: {", ".join(self._color_depths)}")
+
+        height = self.image_meta["height"]
+
+        # Printed lines are cached, until the rows under them are modified
+        cache = self._row_caches.setdefault(("print", step, color_depth), {})
+
+        frame = io.StringIO()
+
+        # Draw pixels as characters
+        for y in range(0, height, 2 * step):
+            line = cache.get(y)
+
+            if line is None:
+                line = self._render_print_line(self._get_print_cells(y, step, color_depth), color_depth)
+                cache[y] = line
+
+            frame.write(line)
+            frame.write("\n")
+
+        _write_terminal(frame.getvalue())
+
+    def _get_print_cells(self, y : int, step : int, color_depth : str = "truecolor") -> list:
+        """
+        **Description:**
+
+        Returns with the colors of a printed line, as a list of (background, foreground) tuples. The background shows the pixel at row y,
+        the foreground shows row y + 1 (black, if it is outside of the image). The colors are multiplied by their alpha, and they are
+        (r, g, b) tuples in truecolor mode, or palette indexes in 256 and 16 color mode.
+        """
+
+        width = self.image_meta["width"]
+
+        top_line = self.image_data[y]
+        bottom_line = self.image_data[y + 1] if y + 1 < self.image_meta["height"] else None
+
+        cells = []
+
+        for x in range(0, width, step):
+            r, g, b, a = top_line[x]
+            top = (r * a // 255, g * a // 255, b * a // 255)
+
+            if bottom_line is None:
+                bottom = (0, 0, 0)
+            else:
+                r, g, b, a = bottom_line[x]
+                bottom = (r * a // 255, g * a // 255, b * a // 255)
+
+            cells.append((top, bottom))
+
+        if color_depth == "truecolor":
+            return cells
+
+        # Map the colors to palette indexes, using 5 bits per channel
+        lut = self._get_terminal_lut(color_depth)
+
+        return [
+            (
+                lut[(top[0] >> 3) << 10 | (top[1] >> 3) << 5 | top[2] >> 3],
+                lut[(bottom[0] >> 3) << 10 | (bottom[1] >> 3) << 5 | bottom[2] >> 3],
+            )
+            for top, bottom in cells
+        ]
+
+    def _render_print_line(self, cells : list, color_depth : str = "truecolor") -> str:
+        """
+        **Description:**
+
+        Converts the cells of a line to a string. The color codes are only added, when the color changes, and the line ends with a reset code.
+        """
+
+        out = []
+        previous_top = None
+        previous_bottom = None
+
+        for top, bottom in cells:
+            if top != previous_top:
+                out.append(self._get_terminal_code(top, True, color_depth))
+                previous_top = top
+
+            if bottom != previous_bottom:
+                out.append(self._get_terminal_code(bottom, False, color_depth))
+                previous_bottom = bottom
+
+            out.append("▄")
+
+        out.append("\033[0m")
+
+        return "".join(out)
+
+    def _get_terminal_code(self, color : tuple|int, background : bool, color_depth : str) -> str:
+        """
+        **Description:**
+
+        Returns with the ansi escape sequence, that sets the background or foreground color to an (r, g, b) tuple (truecolor) or palette index (256 and 16 colors)
+        """
+
+        if color_depth == "truecolor":
+            return f"\033[{48 if background else 38};2;{color[0]};{color[1]};{color[2]}m"
+
+        foreground_codes, background_codes = PNG._terminal_codes[color_depth]
+
+        return background_codes[color] if background else foreground_codes[color]
+
+    def _get_terminal_lut(self, color_depth : str) -> list:
+        """
+        **Description:**
+
+        Returns with the lookup table, that maps colors (5 bits per channel, as r << 10 | g << 5 | b) to the closest palette index of the color depth.
+        The table, and the escape sequences for every palette index are computed once, and shared by every image.
+        """
+
+        if color_depth in PNG._terminal_luts:
+            return PNG._terminal_luts[color_depth]
+
+        if color_depth == "256":
+            levels = [0, 95, 135, 175, 215, 255]
+
+            # The closest 6x6x6 cube level for every 5 bit channel value
+            closest_level = [min(range(6), key=lambda i: abs(levels[i] - (v * 8 + 4))) for v in range(32)]
+
+            lut = []
+
+            for r in range(32):
+                for g in range(32):
+                    for b in range(32):
+                        color = (r * 8 + 4, g * 8 + 4, b * 8 + 4)
+
+                        # Closest color in the cube
+                        cube = (closest_level[r], closest_level[g], closest_level[b])
+                        cube_color = (levels[cube[0]], levels[cube[1]], levels[cube[2]])
+                        cube_distance = sum((c - p) ** 2 for c, p in zip(color, cube_color))
+
+                        # Closest color in the grayscale ramp (8 - 238)
+                        gray_index = max(0, min(23, round((sum(color) / 3 - 8) / 10)))
+                        gray = 8 + gray_index * 10
+                        gray_distance = sum((c - gray) ** 2 for c in color)
+
+                        if gray_distance < cube_distance:
+                            lut.append(232 + gray_index)
+                        else:
+                            lut.append(16 + cube[0] * 36 + cube[1] * 6 + cube[2])
+
+            PNG._terminal_codes["256"] = (
+                [f"\033[38;5;{i}m" for i in range(256)],
+                [f"\033[48;5;{i}m" for i in range(256)],
+            )
+
+        else:
+            palette = self._ansi_16_palette
+
+            # Squared distance of every 5 bit channel value from every palette color, per channel
+            distances = [[[(v * 8 + 4 - color[channel]) ** 2 for color in palette] for v in range(32)] for channel in range(3)]
+
+            lut = []
+
+            for r in range(32):
+                for g in range(32):
+                    red_green = [dr + dg for dr, dg in zip(distances[0][r], distances[1][g])]
+
+                    for b in range(32):
+                        total = [rg + db for rg, db in zip(red_green, distances[2][b])]
+                        lut.append(total.index(min(total)))
+
+            PNG._terminal_codes["16"] = (
+                [f"\033[{30 + i if i < 8 else 90 + i - 8}m" for i in range(16)],
+                [f"\033[{40 + i if i < 8 else 100 + i - 8}m" for i in range(16)],
+            )
+
+        PNG._terminal_luts[color_depth] = lut
+
+        return lut
+
+    def _paeth_predictor_o(self, a, b, c) -> float:
+        p = a + b - c
+        pa = abs(p - a)
+        pb = abs(p - b)
+        pc = abs(p - c)
+
+        if pa <= pb and pa <= pc: return a
+        if pb <= pc: return b
+        return c
+
+    def _paeth_predictor(self, a : int, b : int, c : int) -> float:
+        p = a + b - c
+        pa = abs(p - a)
+        pb = abs(p - b)
+        pc = abs(p - c)
+
+        if pa <= pb and pa <= pc: return a
+        if pb <= pc: return b
+        return c
+
+    def _unfilter_rows(self, data : bytes, width : int, height : int, pixel_size : int) -> iter:
+        """
+        **Description:**
+
+        Reverses the scanline filters of the decompressed image data, one row at a time
+
+        **Parameters:**
+        - data(bytes|iter) The decompressed image data (every scanline starts with a filter type byte), or an iterator of the scanlines
+        - width(int) The width of the image in pixels
+        - height(int) The height of the image in pixels
+        - pixel_size(int) The number of bytes in a pixel
+
+        **Returns:**
+        - A generator, yielding the reconstructed bytes of every scanline (without the filter type)
+        """
+
+        stride = width * pixel_size
+        previous = bytearray(stride)
+
+        # The scanlines are read one by one, when streaming
+        scanlines = None if isinstance(data, (bytes, bytearray, memoryview)) else iter(data)
+
+        # Seconds, and rows of every filter type
+        instrumented = PNG._instrumentation is not None
+        if instrumented: filter_stats = [[0.0, 0] for _ in PNG._filter_names]
+
+        for y in range(height):
+            if scanlines is not None:
+                data = next(scanlines, None)
+
+                if data is None:
+                    raise ValueError(f"Invalid PNG image (Missing scanline {y})")
+
+            if instrumented: start = time.perf_counter()
+
+            data_offset = 0 if scanlines is not None else y * (stride + 1)
+
+            filter_type = data[data_offset]
+            row = bytearray(data[data_offset + 1:data_offset + 1 + stride])
+
+            """
+            c b
+            a x
+            Where X is the current byte
+            """
+
+            match filter_type:
+                case 0:
+                    # No filter
+                    """ Recon(x) = Filt(x) """
+                    pass
+
+                case 1:
+                    # Sub filter
+                    """ Recon(x) = Filt(x) + Recon(a) """
+
+                    for i in range(pixel_size, stride):
+                        row[i] = (row[i] + row[i - pixel_size]) & 0xFF
+
+                case 2:
+                    # Up filter
+                    """ Recon(x) = Filt(x) + Recon(b) """
+
+                    row = bytearray((x + b) & 0xFF for x, b in zip(row, previous))
+
+                case 3:
+                    # Average filter
+                    """ Recon(x) = Filt(x) + floor((Recon(a) + Recon(b)) / 2) """
+
+                    for i in range(stride):
+                        a = row[i - pixel_size] if i >= pixel_size else 0
+                        row[i] = (row[i] + ((a + previous[i]) >> 1)) & 0xFF
+
+                case 4:
+                    # Paeth filter
+                    """ Recon(x) = Filt(x) + PaethPredictor(Recon(a), Recon(b), Recon(c)) """
+
+                    for i in range(stride):
+                        a = row[i - pixel_size] if i >= pixel_size else 0
+                        c = previous[i - pixel_size] if i >= pixel_size else 0
+                        row[i] = (row[i] + self._paeth_predictor(a, previous[i], c)) & 0xFF
+
+                case _:
+                    raise ValueError(f"Invalid filter type: {filter_type} in scanline {y}!")
+
+            if instrumented:
+                filter_stats[filter_type][0] += time.perf_counter() - start
+                filter_stats[filter_type][1] += 1
+
+            yield row
+
+            previous = row
+
+        if instrumented:
+            for name, (seconds, rows) in zip(PNG._filter_names, filter_stats):
+                if rows: self._record(f"unfilter:{name}", seconds, {"rows": rows})
+
+    def _read_interlaced(self, data : bytes, header : dict, pixel_size : int, palette : list) -> list:
+        """
+        **Description:**
+
+        Reads Adam7 interlaced image data, where the pixels are stored in 7 smaller, separately filtered images
+
+        **Returns:**
+        - The color matrix of the whole image
+        """
+
+        width = header["width"]
+        height = header["height"]
+
+        matrix = [[None] * width for _ in range(height)]
+        data_offset = 0
+
+        instrumented = PNG._instrumentation is not None
+        expand_seconds = 0.0
+
+        # (first column, first row, column step, row step) of every pass
+        for start_x, start_y, step_x, step_y in ((0, 0, 8, 8), (4, 0, 8, 8), (0, 4, 4, 8), (2, 0, 4, 4), (0, 2, 2, 4), (1, 0, 2, 2), (0, 1, 1, 2)):
+            pass_width = (width - start_x + step_x - 1) // step_x
+            pass_height = (height - start_y + step_y - 1) // step_y
+
+            # Empty passes have no scanlines at all
+            if pass_width <= 0 or pass_height <= 0: continue
+
+            pass_size = pass_height * (pass_width * pixel_size + 1)
+
+            for pass_y, row in enumerate(self._unfilter_rows(data[data_offset:data_offset + pass_size], pass_width, pass_height, pixel_size)):
+                if instrumented: start = time.perf_counter()
+
+                flat = self._row_to_rgba(row, header["color_type"], palette)
+                scanline = matrix[start_y + pass_y * step_y]
+
+                for pass_x in range(pass_width):
+                    scanline[start_x + pass_x * step_x] = flat[pass_x * 4:pass_x * 4 + 4]
+
+                if instrumented: expand_seconds += time.perf_counter() - start
+
+            data_offset += pass_size
+
+        if instrumented: self._record("expand", expand_seconds, {"pixels": width * height})
+
+        return matrix
+
+    def _read_palette_indexes(self) -> list:
+        """
+        **Description:**
+
+        Decodes the palette indexes of the pixels from the file data of an indexed image (instead of their colors)
+
+        **Returns:**
+        - A 2d matrix of palette indexes
+        """
+
+        image_meta, raw = self._read_image_data(decode_pixels=False)
+        data = zlib.decompress(raw["chunks"]["IDAT"]["data_bytes"])
+
+        # Every index is its own "color"
+        if image_meta["interlace_method"] == 1:
+            return [[color[0] for color in line] for line in self._read_interlaced(data, image_meta, 1, [[index, 0, 0, 0] for index in range(256)])]
+
+        return [list(row) for row in self._unfilter_rows(data, image_meta["width"], image_meta["height"], 1)]
+
+    def _row_to_rgba(self, row : bytes, color_type : int, palette : list) -> list:
+        """
+        **Description:**
+
+        Converts a reconstructed scanline to a flat list of RGBA channel values
+        """
+
+        match color_type:
+            case PNG._color_type_grayscale:
+                return [channel for gray in row for channel in (gray, gray, gray, 255)]
+
+            case PNG._color_type_grayscale_alpha:
+                return [channel for gray, alpha in zip(row[0::2], row[1::2]) for channel in (gray, gray, gray, alpha)]
+
+            case PNG._color_type_truecolor:
+                return [channel for r, g, b in zip(row[0::3], row[1::3], row[2::3]) for channel in (r, g, b, 255)]
+
+            case PNG._color_type_indexed:
+                # Replace with color from the palette
+                return [channel for index in row for channel in palette[index]]
+
+        return list(row)
+
+    def _read_image_data(self, decode_pixels : bool = True) -> tuple:
+        """
+        **Description:**
+
+        Reads the image data from self._file_data and parses it, retrieving IHDR metadata palette data and text data.
+
+        **Parameters:**
+        - decode_pixels(bool) When set to False, the image data (IDAT) is left compressed, and the color matrix is empty
+
+        **Returns:**
+
+        This function returns with 2 values, as a tuple.
+        - The first one is a nicely formatted dictionary holding only the necessary data
+        - The second value is a dictionary holding every data read from the image
+
+        """
+
+        if not self._file_data:
+            raise ValueError("No image data found!")
+
+        magic_header = bytearray([0x89, 0x50, 0x4E, 0x47, 0x0D, 0x0A, 0x1A, 0x0A])
+
+        buffer = self._file_data
+
+        # Check for the magic header
+        if buffer[:len(magic_header)] != magic_header:
+            raise ValueError("Invalid PNG image (Invalid header)")
+
+        out = {
+            "size": len(self._file_data),
+            "chunks": {},
+        }
+
+        instrumented = PNG._instrumentation is not None
+        if instrumented: start = time.perf_counter()
+
+        # The chunks are walked by offsets, so only the data of every chunk is copied, not the rest of the file
+        offset = len(magic_header)
+        image_data_parts = []
+
+        while offset < len(buffer):
+            chunk_length = int.from_bytes(buffer[offset:offset + 4])
+            chunk_type = str(buffer[offset + 4:offset + 8], encoding="ascii")
+            offset += 8
+
+            chunk_data_bytes = buffer[offset:offset + chunk_length]
+            offset += chunk_length
+
+            chunk_crc = buffer[offset:offset + 4]
+            offset += 4
+
+            # The image data may be split between multiple IDAT chunks, that are joined (once) after the walk
+            if chunk_type == "IDAT":
+                image_data_parts.append(chunk_data_bytes)
+
+                if "IDAT" in out["chunks"]:
+                    out["chunks"]["IDAT"]["length"] += chunk_length
+                    out["chunks"]["IDAT"]["crc"] = chunk_crc
+                    continue
+
+            out["chunks"][chunk_type] = {
+                "length": chunk_length,
+                "data_bytes": chunk_data_bytes,
+                "data": {},
+                "crc": chunk_crc,
+            }
+
+        if len(image_data_parts) > 1: out["chunks"]["IDAT"]["data_bytes"] = b"".join(image_data_parts)
+
+        if instrumented: self._record("chunk_walk", time.perf_counter() - start, {"chunks": len(out["chunks"]), "bytes": out["size"]})
+
+        for key in out["chunks"]:
+            match key:
+                case "IHDR":
+                    chunk_data_bytes = out["chunks"]["IHDR"]["data_bytes"]
+
+                    out["chunks"]["IHDR"]["data"] = {
+                        "width": 0,
+                        "height": 0,
+                        "bit_depth": 0,
+                        "color_type": 0,
+                        "compression_method": 0,
+                        "filter_method": 0,
+                        "interlace_method": 0,
+                    }                    
+
+                    out["chunks"]["IHDR"]["data"]["width"] = int.from_bytes(chunk_data_bytes[:4])
+                    chunk_data_bytes = chunk_data_bytes[4:]
+                    out["chunks"]["IHDR"]["data"]["height"] = int.from_bytes(chunk_data_bytes[:4])
+                    chunk_data_bytes = chunk_data_bytes[4:]
+                    out["chunks"]["IHDR"]["data"]["bit_depth"] = int.from_bytes(chunk_data_bytes[:1])
+                    chunk_data_bytes = chunk_data_bytes[1:]
+                    out["chunks"]["IHDR"]["data"]["color_type"] = int.from_bytes(chunk_data_bytes[:1])
+                    chunk_data_bytes = chunk_data_bytes[1:]
+                    out["chunks"]["IHDR"]["data"]["compression_method"] = int.from_bytes(chunk_data_bytes[:1])
+                    chunk_data_bytes = chunk_data_bytes[1:]
+                    out["chunks"]["IHDR"]["data"]["filter_method"] = int.from_bytes(chunk_data_bytes[:1])
+                    chunk_data_bytes = chunk_data_bytes[1:]
+                    out["chunks"]["IHDR"]["data"]["interlace_method"] = int.from_bytes(chunk_data_bytes[:1])
+                    chunk_data_bytes = chunk_data_bytes[1:]
+
+                    if self.log_level > 1: print(out["chunks"]["IHDR"]["data"])
+
+                case "PLTE":
+                    chunk_data_bytes = out["chunks"]["PLTE"]["data_bytes"]
+
+                    out["chunks"]["PLTE"]["data"] = []
+
+                    for i in range(int(len(chunk_data_bytes) / 3)):
+                        data_offset = i * 3
+
+                        r = int.from_bytes(chunk_data_bytes[data_offset:data_offset+1])
+                        g = int.from_bytes(chunk_data_bytes[data_offset+1:data_offset+2])
+                        b = int.from_bytes(chunk_data_bytes[data_offset+2:data_offset+3])
+                        
+                        out["chunks"]["PLTE"]["data"].append([r, g, b, 255])
+
+                    if self.log_level > 1: print(out["chunks"]["PLTE"]["data"])
+
+                case "tRNS":
+                    chunk_data_bytes = out["chunks"]["tRNS"]["data_bytes"]
+
+                    out["chunks"]["tRNS"]["data"] = []
+
+                    match out["chunks"]["IHDR"]["data"]["color_type"]:
+                        case PNG._color_type_grayscale:
+                            # Image global alpha
+                            out["chunks"]["tRNS"]["data"].append( int.from_bytes(chunk_data_bytes[data_offset+1:data_offset+2]) )
+
+                        case PNG._color_type_truecolor:
+                            # Image global alpha per channel
+                            out["chunks"]["tRNS"]["data"].append( int.from_bytes(chunk_data_bytes[data_offset+1:data_offset+2]) )
+
+                        case PNG._color_type_indexed:
+                            for i, byte in enumerate(chunk_data_bytes):
+                                a = byte
+
+                                # Set alpha values in the palette                                
+                                out["chunks"]["PLTE"]["data"][i][3] = a
+                                
+                                # Add to chunk data
+                                out["chunks"]["tRNS"]["data"].append( a )
+
+                    if self.log_level > 1: print(out["chunks"]["tRNS"]["data"])
+
+                case "IDAT":
+                    out["chunks"]["IDAT"]["data"] = {
+                        "matrix": [], # The completed color matrix, after applying the filter
+                    }
+
+                    if not decode_pixels: continue
+
+                    if instrumented: start = time.perf_counter()
+
+                    chunk_data_bytes = zlib.decompress( out["chunks"]["IDAT"]["data_bytes"])
+
+                    if instrumented: self._record("inflate", time.perf_counter() - start, {"bytes": len(chunk_data_bytes)})
+
+                    header = out["chunks"]["IHDR"]["data"]
+                    palette = out["chunks"]["PLTE"]["data"] if "PLTE" in out["chunks"] else []
+
+                    channel_count = self._channels_per_color[header["color_type"]]
+                    pixel_size = int(channel_count * (header["bit_depth"] / 8))
+
+                    if header["interlace_method"] == 1:
+                        out["chunks"]["IDAT"]["data"]["matrix"] = self._read_interlaced(chunk_data_bytes, header, pixel_size, palette)
+
+                    expand_seconds = 0.0
+
+                    for row in self._unfilter_rows(chunk_data_bytes, header["width"], header["height"], pixel_size) if header["interlace_method"] == 0 else []:
+                        if instrumented: row_start = time.perf_counter()
+
+                        flat = self._row_to_rgba(row, header["color_type"], palette)
+
+                        out["chunks"]["IDAT"]["data"]["matrix"].append([flat[offset:offset + 4] for offset in range(0, len(flat), 4)])
+
+                        if instrumented: expand_seconds += time.perf_counter() - row_start
+
+                    if instrumented and header["interlace_method"] == 0: self._record("expand", expand_seconds, {"pixels": header["width"] * header["height"]})
+
+                    if self.log_level > 0: print(f"Read IDAT chunk: {header["width"]}x{header["height"]}")
+
+                case "tEXt":
+                    chunk_data_bytes = out["chunks"]["tEXt"]["data_bytes"]
+
+                    out["chunks"]["tEXt"]["data"] = {
+                        "key": "",
+                        "value": "",
+                    }
+
+                    destination = "key"
+
+                    while len(chunk_data_bytes) > 0:
+                        character = chunk_data_bytes[:1]
+                        chunk_data_bytes = chunk_data_bytes[1:]
+                        
+                        if character == b"\00":
+                            destination = "value"
+                            continue
+
+                        out["chunks"]["tEXt"]["data"][destination] += str(character, encoding="ascii")
+                
+                case "zTXt" | "iTXt":
+                    chunk_data_bytes = out["chunks"][key]["data_bytes"]
+
+                    # The key, the compression method and the (decompressed) value
+                    text = _parse_text_chunk(key, chunk_data_bytes)
+
+                    out["chunks"][key]["data"] = {
+                        "key": text["key"],
+                        "value": text["value"],
+                        "compression_method": 0,
+                    }
+
+                    if key == "iTXt":
+                        out["chunks"][key]["data"]["language"] = text.get("language", "")
+                        out["chunks"][key]["data"]["translated_key"] = text.get("translated_key", "")
+
+                case "tIME":
+                    chunk_data_bytes = out["chunks"]["tIME"]["data_bytes"]
+
+                    out["chunks"]["tIME"]["data"]["year"] = int.from_bytes(chunk_data_bytes[:2])
+                    chunk_data_bytes = chunk_data_bytes[2:]
+
+                    out["chunks"]["tIME"]["data"]["month"] = int.from_bytes(chunk_data_bytes[:1])
+                    chunk_data_bytes = chunk_data_bytes[1:]
+
+                    out["chunks"]["tIME"]["data"]["day"] = int.from_bytes(chunk_data_bytes[:1])
+                    chunk_data_bytes = chunk_data_bytes[1:]
+
+                    out["chunks"]["tIME"]["data"]["hour"] = int.from_bytes(chunk_data_bytes[:1])
+                    chunk_data_bytes = chunk_data_bytes[1:]
+
+                    out["chunks"]["tIME"]["data"]["minute"] = int.from_bytes(chunk_data_bytes[:1])
+                    chunk_data_bytes = chunk_data_bytes[1:]
+
+                    out["chunks"]["tIME"]["data"]["second"] = int.from_bytes(chunk_data_bytes[:1])
+                    chunk_data_bytes = chunk_data_bytes[1:]
+
+                case "IEND":
+                    out["chunks"]["IEND"]["data"] = None
+
+        # Get necessary data from the chunks, and format it nicely
+        # Default values
+        formatted = {
+            "width": 0,
+            "height": 0,
+            "bit_depth": 8,
+            "color_type": 6,
+            "interlace_method": 0,
+            "palette": [],
+            "text": {},
+            "time": {},
+        }
+
+        # Set values if corresponding chunk was found
+        if "IHDR" in out["chunks"]:
+            formatted["width"] = out["chunks"]["IHDR"]["data"]["width"]
+            formatted["height"] = out["chunks"]["IHDR"]["data"]["height"]
+            formatted["bit_depth"] = out["chunks"]["IHDR"]["data"]["bit_depth"]
+            formatted["color_type"] = out["chunks"]["IHDR"]["data"]["color_type"]
+            formatted["interlace_method"] = out["chunks"]["IHDR"]["data"]["interlace_method"]
+
+        if "tIME" in out["chunks"]:
+            formatted["time"] = out["chunks"]["tIME"]["data"]
+
+        if "PLTE" in out["chunks"]:
+            formatted["palette"] = out["chunks"]["PLTE"]["data"]
+
+        if "tEXt" in out["chunks"]:
+            formatted["text"] = out["chunks"]["tEXt"]["data"]
+            formatted["text"]["value"] = out["chunks"]["tEXt"]["data"]["key"] + ": " + out["chunks"]["tEXt"]["data"]["value"]
+
+        return formatted, out
+
+
+    def _generate_crc(self, data : bytearray) -> int:
+        instrumented = PNG._instrumentation is not None
+        if instrumented: start = time.perf_counter()
+
+        crc = 0xFFFFFFFF
+        poly = 0xEDB88320
+
+        for byte in data:
+            crc = crc ^ byte
+
+            for _ in range(8):
+                if crc & 1:
+                    crc = (crc >> 1) ^ poly
+                else:
+                    crc = crc >> 1
+
+        if instrumented: self._record("crc", time.perf_counter() - start, {"bytes": len(data)})
+
+        return crc ^ 0xFFFFFFFF
+
+    def _generate_chunk_IHDR(self) -> bytearray:
+        if self.log_level > 0: print("Generating IHDR chunk...")
+
+        out = bytearray()
+
+        chunk_data = {
+            "width": self.image_meta["width"],
+            "height": self.image_meta["height"],
+            "bit_depth": 8, # 8 bit color depth
+            "color_type": 6, # 3: Palette, 6: True color with alpha
+            "compression_method": 0, # Deflate compression
+            "filter_method": 0, # No filter
+            "interlace_method": 0, # No interlacing
+        }
+
+        if self.flags & PNG_COLOR_PALETTE:
+            chunk_data["color_type"] = 3
+
+        chunk_data_bytes = bytearray([0x49, 0x48, 0x44, 0x52]) # Chunk name IHDR
+        chunk_data_bytes += bytearray(chunk_data['width'].to_bytes(4, 'big')) 
+        chunk_data_bytes += bytearray(chunk_data['height'].to_bytes(4, 'big')) 
+        chunk_data_bytes += bytearray(chunk_data['bit_depth'].to_bytes(1, 'big')) 
+        chunk_data_bytes += bytearray(chunk_data['color_type'].to_bytes(1, 'big')) 
+        chunk_data_bytes += bytearray(chunk_data['compression_method'].to_bytes(1, 'big')) 
+        chunk_data_bytes += bytearray(chunk_data['filter_method'].to_bytes(1, 'big')) 
+        chunk_data_bytes += bytearray(chunk_data['interlace_method'].to_bytes(1, 'big')) 
+
+        chunk_crc = self._generate_crc(chunk_data_bytes)
+
+        chunk_size = len(chunk_data_bytes) - 4 # Not counting the chunk name (4 bytes)
+
+        out += chunk_size.to_bytes(4, 'big')
+        out += chunk_data_bytes
+        out += chunk_crc.to_bytes(4, 'big')
+
+        return out
+
+    def _generate_chunk_PLTE(self, palette : list) -> bytearray:
+        if self.log_level > 0: print("Generating PLTE chunk...")
+
+        out = bytearray()
+
+        chunk_data_bytes = bytearray([0x50, 0x4c, 0x54, 0x45]) # Chunk name PLTE
+
+        for color in palette:
+            chunk_data_bytes += bytearray(color[0].to_bytes(1, 'big'))
+            chunk_data_bytes += bytearray(color[1].to_bytes(1, 'big'))
+            chunk_data_bytes += bytearray(color[2].to_bytes(1, 'big'))
+
+        chunk_crc = self._generate_crc(chunk_data_bytes)
+
+        chunk_size = len(chunk_data_bytes) - 4 # Not counting the chunk name (4 bytes)
+
+        out += chunk_size.to_bytes(4, 'big')
+        out += chunk_data_bytes
+        out += chunk_crc.to_bytes(4, 'big')
+
+        return out
+
+    def _generate_chunk_tRNS(self, palette : list) -> bytearray:
+        if self.log_level > 0: print("Generating tRNS chunk...")
+
+        out = bytearray()
+
+        chunk_data_bytes = bytearray([0x74, 0x52, 0x4e, 0x53]) # Chunk name PLTE
+
+        if self.flags & PNG_COLOR_PALETTE:
+            for color in palette:
+                chunk_data_bytes += bytearray(color[3].to_bytes(1, 'big'))
+
+        chunk_crc = self._generate_crc(chunk_data_bytes)
+
+        chunk_size = len(chunk_data_bytes) - 4 # Not counting the chunk name (4 bytes)
+
+        out += chunk_size.to_bytes(4, 'big')
+        out += chunk_data_bytes
+        out += chunk_crc.to_bytes(4, 'big')
+
+        return out
+
+    def _generate_scanlines_rgb(self, rgb_2d_matrix : list, row_cache : dict|None = None, first_row : int = 0, last_row : int|None = None) -> bytearray:
+        """
+        **Description:**
+
+        Serializes the color matrix to the uncompressed image data (filter type and RGBA bytes of every scanline)
+        Only the rows from first_row, until last_row (not included) are serialized, when they are set.
+        """
+
+        pixel_data = bytearray()
+
+        if last_row is None: last_row = len(rgb_2d_matrix)
+
+        instrumented = PNG._instrumentation is not None
+        if instrumented: start, cached_rows = time.perf_counter(), 0
+
+        for y in range(first_row, last_row):
+            line = rgb_2d_matrix[y]
+
+            # Reuse the scanline from the previous encoding, if it was not modified since
+            if row_cache is not None and y in row_cache:
+                pixel_data += row_cache[y]
+                if instrumented: cached_rows += 1
+                continue
+
+            row = bytearray([0x00]) # Scanline filtering method
+            row += bytes([channel for r, g, b, a in line for channel in (r, g, b, a)])
+
+            if row_cache is not None: row_cache[y] = row
+
+            pixel_data += row
+
+        if instrumented: self._record("filter", time.perf_counter() - start, {"rows": last_row - first_row - cached_rows, "cached_rows": cached_rows})
+
+        return pixel_data
+
+    def _generate_chunk_IDAT_rgb(self, rgb_2d_matrix : list, row_cache : dict|None = None) -> bytearray:
+        if self.log_level > 0: print("Generating (rgba) IDAT chunk...")
+
+        out = bytearray()
+
+        chunk_data_bytes = bytearray([0x49, 0x44, 0x41, 0x54]) # Chunk name IDAT
+
+        scanlines = self._generate_scanlines_rgb(rgb_2d_matrix, row_cache)
+
+        instrumented = PNG._instrumentation is not None
+        if instrumented: start = time.perf_counter()
+
+        chunk_data_bytes += bytearray(zlib.compress(scanlines))
+
+        if instrumented: self._record("deflate", time.perf_counter() - start, {"bytes": len(scanlines)})
+
+        chunk_crc = self._generate_crc(chunk_data_bytes)
+
+        chunk_size = len(chunk_data_bytes) - 4 # Not counting the chunk name (4 bytes)
+
+        out += chunk_size.to_bytes(4, 'big')
+        out += chunk_data_bytes
+        out += chunk_crc.to_bytes(4, 'big')
+
+        return out
+
+    def _generate_scanlines_palette(self, palette_2d_matrix : list, row_cache : dict|None = None, first_row : int = 0, last_row : int|None = None) -> bytearray:
+        """
+        **Description:**
+
+        Serializes the palette index matrix to the uncompressed image data (filter type and index bytes of every scanline)
+        Only the rows from first_row, until last_row (not included) are serialized, when they are set.
+        """
+
+        pixel_data = bytearray()
+
+        if last_row is None: last_row = len(palette_2d_matrix)
+
+        instrumented = PNG._instrumentation is not None
+        if instrumented: start, cached_rows = time.perf_counter(), 0
+
+        for y in range(first_row, last_row):
+            line = palette_2d_matrix[y]
+
+            # Reuse the scanline from the previous encoding, if it was not modified since
+            if row_cache is not None and y in row_cache:
+                pixel_data += row_cache[y]
+                if instrumented: cached_rows += 1
+                continue
+
+            row = bytearray([0x00]) # Scanline filtering method
+            row += bytes(line)
+
+            if row_cache is not None: row_cache[y] = row
+
+            pixel_data += row
+
+        if instrumented: self._record("filter", time.perf_counter() - start, {"rows": last_row - first_row - cached_rows, "cached_rows": cached_rows})
+
+        return pixel_data
+
+    def _generate_chunk_IDAT_palette(self, palette_2d_matrix : list, row_cache : dict|None = None) -> bytearray:
+        if self.log_level > 0: print("Generating (palette) IDAT chunk...")
+
+        out = bytearray()
+
+        chunk_data_bytes = bytearray([0x49, 0x44, 0x41, 0x54]) # Chunk name IDAT
+
+        scanlines = self._generate_scanlines_palette(palette_2d_matrix, row_cache)
+
+        instrumented = PNG._instrumentation is not None
+        if instrumented: start = time.perf_counter()
+
+        chunk_data_bytes += bytearray(zlib.compress(scanlines))
+
+        if instrumented: self._record("deflate", time.perf_counter() - start, {"bytes": len(scanlines)})
+
+        chunk_crc = self._generate_crc(chunk_data_bytes)
+
+        chunk_size = len(chunk_data_bytes) - 4 # Not counting the chunk name (4 bytes)
+
+        out += chunk_size.to_bytes(4, 'big')
+        out += chunk_data_bytes
+        out += chunk_crc.to_bytes(4, 'big')
+
+        return out
+
+
+    def _generate_chunk_IEND(self) -> bytearray:
+        if self.log_level > 0: print("Generating IEND chunk...")
+
+        out = bytearray() # Size of the chunk
+
+        chunk_data_bytes = bytearray([0x49, 0x45, 0x4E, 0x44]) # Chunk name IEND
+
+        chunk_size = len(chunk_data_bytes) - 4 # Not counting the chunk name (4 bytes)
+
+        chunk_crc = self._generate_crc(chunk_data_bytes)
+
+        out += chunk_size.to_bytes(4, 'big')
+        out += chunk_data_bytes
+        out += chunk_crc.to_bytes(4, 'big')
+
+        return out
+
+    def _generate_head(self, use_palette : bool) -> bytearray:
+        """
+        **Description:**
+
+        Generates the start of the file: the magic header, and every chunk before the image data
+        """
+
+        # The magic header for every PNG
+        out = bytearray([0x89, 0x50, 0x4E, 0x47, 0x0D, 0x0A, 0x1A, 0x0A])
+
+        out += self._generate_chunk_IHDR()
+
+        if use_palette:
+            out += self._generate_chunk_PLTE(self.palette)
+            out += self._generate_chunk_tRNS(self.palette)
+
+        return out
+
+    def _generate_image(self, use_palette : bool|None = None) -> bytearray:
+        """
+        ** Description: **
+
+        Generates a PNG image, and returns with a bytearray
+
+        **Parameters:**
+
+        - use_palette(bool) Decides whenever to use paletted image generation or regular RGBA
+        """
+
+        if self.log_level > 0: print("Stated generation...")
+
+        # Set default value for paletted generation
+        if use_palette == None: use_palette = self.flags & PNG_COLOR_PALETTE
+
+        out = self._generate_head(use_palette)
+
+        if use_palette:
+            out += self._generate_chunk_IDAT_palette(self.image_data, self._row_caches.setdefault(("IDAT", "palette"), {}))
+        else:
+            out += self._generate_chunk_IDAT_rgb(self.image_data, self._row_caches.setdefault(("IDAT", "rgba"), {}))
+        
+        out += self._generate_chunk_IEND()
+
+        if self.log_level > 0: print("End generation...")
+
+        return out
+
+
+class Stats:
+    """
+    **Description:**
+
+    Timings and counters of the phases of reading, processing, and writing an image, collected while instrumentation is enabled
+    (see set_instrumentation, and PNG.get_stats). Every phase has its total time (seconds), the number of measurements (calls),
+    and the sum of its counters (bytes, rows, pixels, ...). Counters starting with peak_ keep their largest value instead.
+
+    **Phases:**
+    - read, write: Reading, and writing the file
+    - chunk_walk: Splitting the file into chunks
+    - inflate, deflate: Decompressing, and compressing the image data
+    - unfilter:none, unfilter:sub, unfilter:up, unfilter:average, unfilter:paeth: Reversing the scanline filters, by filter type
+    - expand: Converting the scanlines to RGBA colors
+    - shader: Shader passes
+    - filter: Serializing the scanlines, with their filter type (cached rows are only copied)
+    - crc: Computing the checksums of the chunks
+    - decode, encode: Whole reads, and writes, with their measured (peak_bytes), and estimated (peak_estimate) memory use (see set_memory_diagnostics)
+
+    **Example:**
+    ```
+    stats = image.get_stats()
+    print(stats.phases["inflate"]["seconds"], stats.phases["inflate"]["bytes"])
+    ```
+    """
+
+    phases : dict # Phase: {"seconds": float, "calls": int, counter name: int}
+
+    def __init__(self) -> None:
+        self.phases = {}
+
+    def add(self, phase : str, seconds : float, counters : dict|None = None) -> None:
+        """
+        **Description:**
+
+        Adds a measurement to a phase
+
+        **Parameters:**
+        - phase(str) The name of the phase
+        - seconds(float) The measured time
+        - counters(dict) Name: amount pairs, added to the counters of the phase
+        """
+
+        entry = self.phases.get(phase)
+
+        if entry is None:
+            entry = {"seconds": 0.0, "calls": 0}
+            self.phases[phase] = entry
+
+        entry["seconds"] += seconds
+        entry["calls"] += 1
+
+        if counters:
+            for name, amount in counters.items():
+                entry[name] = max(entry.get(name, 0), amount) if name.startswith("peak_") else entry.get(name, 0) + amount
+
+    def merge(self, other : "Stats") -> None:
+        """
+        **Description:**
+
+        Adds every measurement of an other Stats object to this one (for example, to sum the stats of many images)
+        """
+
+        for phase, entry in other.phases.items():
+            target = self.phases.setdefault(phase, {"seconds": 0.0, "calls": 0})
+
+            for name, amount in entry.items():
+                target[name] = max(target.get(name, 0), amount) if name.startswith("peak_") else target.get(name, 0) + amount
+
+    def reset(self) -> None:
+        """
+        **Description:**
+
+        Drops every measurement
+        """
+
+        self.phases = {}
+
+    def total(self) -> float:
+        """
+        **Description:**
+
+        Returns with the sum of the time of every phase in seconds
+        """
+
+        return sum(entry["seconds"] for entry in self.phases.values())
+
+    def to_dict(self) -> dict:
+        """
+        **Description:**
+
+        Returns with a copy of the measurements, that can be serialized (for example, as JSON)
+        """
+
+        return {phase: dict(entry) for phase, entry in self.phases.items()}
+
+    def __str__(self) -> str:
+        lines = []
+
+        # The slowest phases first
+        for phase, entry in sorted(self.phases.items(), key=lambda item: -item[1]["seconds"]):
+            counters = ", ".join(f"{name}: {amount}" for name, amount in entry.items() if name not in ("seconds", "calls"))
+            lines.append(f"{phase:<18} {entry["seconds"] * 1000:>10.3f}ms {entry["calls"]:>6} calls  {counters}")
+
+        return "\n".join(lines)
+
+class Sampler:
+    """
+    **Description:**
+
+    A read only snapshot of an image, that shaders can use to read any pixel of the source image, without global variables.
+    The pixels are stored in a flat list, and the row offsets, as well as the addressing function are computed once, when the sampler is created.
+
+    **Address modes:**
+    - wrap (**default**): The image is tiled
+    - clamp: The closest edge pixel is used
+    - mirror: The image is reflected at the edges
+
+    **Filters:**
+    - nearest (**default**): The color of the closest pixel is returned
+    - bilinear: The 4 closest pixels are mixed together, based on the distance
+    """
+
+    width : int
+    height : int
+    stride : int
+    address_mode : str
+    filter : str
+
+    _address_modes = ("wrap", "clamp", "mirror")
+    _filters = ("nearest", "bilinear")
+
+    def __init__(self, image : PNG, address_mode : str = "wrap", filter : str = "nearest") -> None:
+        """
+        **Description:**
+
+        Takes a snapshot of the image. Later changes to the image will not affect the sampler.
+
+        **Parameters:**
+        - image(PNG) The image to sample from
+        - address_mode(str) wrap, clamp or mirror, decides what happens with coordinates outside of the image
+        - filter(str) nearest or bilinear, used by Sampler.sample
+        """
+
+        if address_mode not in self._address_modes:
+            raise ValueError(f"Invalid address mode: '{address_mode}', must be one of: {", ".join(self._address_modes)}")
+
+        if filter not in self._filters:
+            raise ValueError(f"Invalid filter: '{filter}', must be one of: {", ".join(self._filters)}")
+
+        self.width = image.image_meta["width"]
+        self.height = image.image_meta["height"]
+        self.stride = self.width * 4
+        self.address_mode = address_mode
+        self.filter = filter
+
+        self._pixels = image._get_flat()
+        self._row_offsets = [y * self.stride for y in range(self.height)]
+
+        match address_mode:
+            case "wrap": self._address = self._address_wrap
+            case "clamp": self._address = self._address_clamp
+            case "mirror": self._address = self._address_mirror
+
+        # Replace the default (nearest) filter
+        if filter == "bilinear":
+            self.sample = self._sample_bilinear
+
+    def fetch(self, x : int, y : int) -> list:
+        """
+        **Description:**
+
+        Returns with the color of the pixel at the given integer coordinates, as an RGBA list. Coordinates outside of the image are resolved by the address mode.
+        """
+
+        offset = self._row_offsets[self._address(y, self.height)] + self._address(x, self.width) * 4
+
+        return self._pixels[offset:offset + 4]
+
+    def sample(self, u : float, v : float) -> list:
+        """
+        **Description:**
+
+        Returns with the color at the given UV position (0 - 1 covers the whole image), filtered with the sampler's filter.
+        """
+
+        return self.fetch(math.floor(u * self.width), math.floor(v * self.height))
+
+    def _sample_bilinear(self, u : float, v : float) -> list:
+        # Pixel centers are at half coordinates
+        x = u * self.width - 0.5
+        y = v * self.height - 0.5
+
+        x0 = math.floor(x)
+        y0 = math.floor(y)
+        tx = x - x0
+        ty = y - y0
+
+        top_left = self.fetch(x0, y0)
+        top_right = self.fetch(x0 + 1, y0)
+        bottom_left = self.fetch(x0, y0 + 1)
+        bottom_right = self.fetch(x0 + 1, y0 + 1)
+
+        out = []
+
+        for channel in range(4):
+            top = top_left[channel] + (top_right[channel] - top_left[channel]) * tx
+            bottom = bottom_left[channel] + (bottom_right[channel] - bottom_left[channel]) * tx
+
+            out.append(top + (bottom - top) * ty)
+
+        return out
+
+    def _address_wrap(self, value : int, size : int) -> int:
+        return value % size
+
+    def _address_clamp(self, value : int, size : int) -> int:
+        return 0 if value < 0 else (size - 1 if value >= size else value)
+
+    def _address_mirror(self, value : int, size : int) -> int:
+        value %= size * 2
+
+        return size * 2 - 1 - value if value >= size else value
+
+class LivePreview:
+    """
+    **Description:**
+
+    Plays animation frames in the terminal. Only the first frame is printed fully, for the later frames, the cursor is moved back to the top
+    of the image, and only the characters whose colors changed since the previous frame are repainted. This keeps the output small enough,
+    to watch shader animations over slow connections.
+
+    **NOTE: Nothing else should be printed while the preview is running, because the cursor movements are relative to the last frame**
+
+    Can be used as a context manager, the cursor is shown again, and moved below the image on exit.
+    """
+
+    fps : float
+    step : int|None
+    color_depth : str
+
+    def __init__(self, fps : float = 24, step : int|None = None, color_depth : str = "truecolor") -> None:
+        """
+        **Parameters:**
+        - fps(float) The maximum number of frames drawn per second
+        - step(int) The number of pixels to step over, see PNG.print. If set to None (default), the frames are scaled to fit inside the terminal
+        - color_depth(str) truecolor, 256 or 16, see PNG.print
+        """
+
+        if color_depth not in PNG._color_depths:
+            raise ValueError(f"Invalid color depth: '{color_depth}', must be one of: {", ".join(PNG._color_depths)}")
+
+        self.fps = fps
+        self.step = step
+        self.color_depth = color_depth
+
+        self._cells = None # The lines of (background, foreground) colors on the screen
+        self._next_time = None
+
+    def __enter__(self) -> "LivePreview":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def show(self, image : PNG) -> None:
+        """
+        **Description:**
+
+        Draws the image, after waiting for the time of the next frame (based on the frame rate).
+        If the previous frame was late, the image is drawn immediately.
+        """
+
+        now = time.perf_counter()
+
+        if self._next_time is not None and now < self._next_time:
+            time.sleep(self._next_time - now)
+            now = self._next_time
+
+        self._next_time = now + 1 / self.fps
+
+        self._draw(image)
+
+    def play(self, render_frame : callable, frame_count : int, render_late : bool = False) -> int:
+        """
+        **Description:**
+
+        Renders and draws the frames of an animation in real time. If rendering falls behind, the frames that are already late, are skipped
+        (not rendered at all), so the animation keeps its speed.
+
+        **Parameters:**
+        - render_frame(callable) A function, that receives the frame index, and returns with the frame as a PNG
+        - frame_count(int) The number of frames in the animation
+        - render_late(bool) Render the late frames too (only drawing them is skipped), when every frame is needed, for example to write them into a file
+
+        **Returns:**
+
+        The number of frames that were drawn
+        """
+
+        start = time.perf_counter()
+        index = 0
+        next_index = 0 # The next frame, that is drawn
+        drawn = 0
+
+        while index < frame_count:
+            image = render_frame(index)
+
+            if index >= next_index:
+                self._draw(image)
+                drawn += 1
+
+                # The frame that should be on the screen right now
+                due = int((time.perf_counter() - start) * self.fps)
+
+                if due > index + 1:
+                    # Skip the late frames
+                    next_index = due
+                else:
+                    next_index = index + 1
+
+                    wait = start + next_index / self.fps - time.perf_counter()
+                    if wait > 0 and next_index < frame_count: time.sleep(wait)
+
+            index = index + 1 if render_late else next_index
+
+        return drawn
+
+    def close(self) -> None:
+        """
+        **Description:**
+
+        Resets the colors and shows the cursor again. The next frame will be drawn fully, below the previous one.
+        """
+
+        _write_terminal("\033[0m\033[?25h")
+
+        self._cells = None
+        self._next_time = None
+
+    def _draw(self, image : PNG) -> None:
+        step = self.step
+
+        if step is None or step < 1:
+            try:
+                w, _ = os.get_terminal_size()
+            except OSError:
+                w = image.image_meta["width"]
+
+            step = int((image.image_meta["width"] / w) + 1) if image.image_meta["width"] > w else 1
+
+        cells = [image._get_print_cells(y, step, self.color_depth) for y in range(0, image.image_meta["height"], 2 * step)]
+
+        previous = self._cells
+        self._cells = cells
+
+        # An empty image, nothing to draw
+        if not cells: return
+
+        # First frame, or the size changed, draw everything
+        if previous is None or len(previous) != len(cells) or len(previous[0]) != len(cells[0]):
+            frame = io.StringIO()
+            frame.write("\033[?25l") # Hide the cursor
+
+            for line in cells:
+                frame.write(image._render_print_line(line, self.color_depth))
+                frame.write("\n")
+
+            _write_terminal(frame.getvalue())
+            return
+
+        frame = io.StringIO()
+
+        # Move to the start of the first line
+        frame.write(f"\033[{len(cells)}F")
+
+        previous_top = None
+        previous_bottom = None
+        skipped_lines = 0
+
+        for line, previous_line in zip(cells, previous):
+            if line == previous_line:
+                skipped_lines += 1
+                continue
+
+            if skipped_lines > 0:
+                frame.write(f"\033[{skipped_lines}E")
+                skipped_lines = 0
+
+            column = 0
+
+            for x, cell in enumerate(line):
+                if cell == previous_line[x]: continue
+
+                # Move the cursor, if the changed character is not the next one
+                if x != column: frame.write(f"\033[{x + 1}G")
+
+                top, bottom = cell
+
+                if top != previous_top:
+                    frame.write(image._get_terminal_code(top, True, self.color_depth))
+                    previous_top = top
+
+                if bottom != previous_bottom:
+                    frame.write(image._get_terminal_code(bottom, False, self.color_depth))
+                    previous_bottom = bottom
+
+                frame.write("▄")
+                column = x + 1
+
+            frame.write("\033[1E")
+
+        # Move below the image
+        if skipped_lines > 0: frame.write(f"\033[{skipped_lines}E")
+
+        frame.write("\033[0m")
+
+        _write_terminal(frame.getvalue())
+
+class MipmapPyramid:
+    """
+    **Description:**
+
+    A pyramid of an image, where every level is half as big (on both axis) as the previous one, down to a single pixel.
+    Images of any size are made from the closest level, that is at least as big as the requested size, so the full size pixels are only needed,
+    when the requested size is bigger than the first downsampled level.
+
+    The levels (except the full size image) can be saved in to a sidecar file next to the image (<file_name>.mip). The sidecar is only used,
+    while the size and modification time of the image stays the same. If the sidecar is valid, the image is not decoded at all, until the full size is needed.
+    """
+
+    file_name : str
+    sidecar_name : str
+    meta : dict
+    levels : list # PNG objects, from the full size image to 1x1. The full size image is None, until it is needed
+
+    _sidecar_magic = b"PNGMIP1\n"
+    _sidecar_header = ">QqIIBBBB" # Source size, source modification time (signed, it is negative before 1970), width, height, bit depth, color type, interlace method, level count
+    _sidecar_level = ">III" # Width, height, compressed data length
+
+    def __init__(self, file_name : str, use_sidecar : bool = True) -> None:
+        """
+        **Parameters:**
+        - file_name(str) The name of the image file
+        - use_sidecar(bool) When set to True, the levels are loaded from the sidecar file, or saved in to it, if it is missing or outdated
+        """
+
+        self.file_name = file_name
+        self.sidecar_name = file_name + ".mip"
+
+        stat = os.stat(file_name)
+        self._source_key = (stat.st_size, stat.st_mtime_ns)
+
+        if use_sidecar and self._load_sidecar():
+            return
+
+        image = PNG(file_name, flags=PNG_READ)
+
+        self.meta = {key: image.image_meta[key] for key in ("width", "height", "bit_depth", "color_type", "interlace_method")}
+        self.levels = [image]
+
+        # Build the smaller levels, each from the previous one
+        flat = image._get_flat()
+        width = self.meta["width"]
+        height = self.meta["height"]
+
+        while width > 1 or height > 1:
+            new_width = max(1, width // 2)
+            new_height = max(1, height // 2)
+
+            flat = image._resize_flat(flat, width, height, new_width, new_height, "box")
+            width, height = new_width, new_height
+
+            self.levels.append(PNG(_matrix_from_flat(flat, width, height)))
+
+        if use_sidecar: self._save_sidecar()
+
+    def get_level(self, width : int) -> PNG:
+        """
+        **Description:**
+
+        Returns with the smallest level, that is at least as wide as the given width (or the full size image). **Do not modify the returned image**
+        """
+
+        for level in reversed(self.levels):
+            if level is not None and level.image_meta["width"] >= width:
+                return level
+
+        return self._get_full_size()
+
+    def get_image(self, width : int, height : int|None = None) -> PNG:
+        """
+        **Description:**
+
+        Returns with a new image of the given size, made from the closest level with box averaging.
+
+        **Parameters:**
+        - width(int) The width of the image
+        - height(int) The height of the image. If set to None, it is calculated from the width, keeping the aspect ratio
+        """
+
+        if height is None:
+            height = max(1, round(self.meta["height"] * width / self.meta["width"]))
+
+        level = self.get_level(width)
+        level_width = level.image_meta["width"]
+        level_height = level.image_meta["height"]
+
+        flat = level._get_flat()
+
+        if level_width != width or level_height != height:
+            flat = level._resize_flat(flat, level_width, level_height, width, height, "box")
+
+        return PNG(_matrix_from_flat(flat, width, height))
+
+    def _get_full_size(self) -> PNG:
+        if self.levels[0] is None:
+            self.levels[0] = PNG(self.file_name, flags=PNG_READ)
+
+        return self.levels[0]
+
+    def _load_sidecar(self) -> bool:
+        """
+        **Description:**
+
+        Loads the levels from the sidecar file. Returns with False, if the sidecar is missing, invalid, or made from a different version of the image.
+        """
+
+        try:
+            with open(self.sidecar_name, "rb") as f:
+                data = f.read()
+        except OSError:
+            return False
+
+        if not data.startswith(self._sidecar_magic):
+            return False
+
+        offset = len(self._sidecar_magic)
+
+        try:
+            size, mtime, width, height, bit_depth, color_type, interlace_method, level_count = struct.unpack_from(self._sidecar_header, data, offset)
+            offset += struct.calcsize(self._sidecar_header)
+
+            if (size, mtime) != self._source_key:
+                return False
+
+            levels = [None]
+
+            for _ in range(level_count):
+                level_width, level_height, length = struct.unpack_from(self._sidecar_level, data, offset)
+                offset += struct.calcsize(self._sidecar_level)
+
+                flat = list(zlib.decompress(data[offset:offset + length]))
+                offset += length
+
+                # A stale, or corrupt level
+                if len(flat) != level_width * level_height * 4:
+                    return False
+
+                levels.append(PNG(_matrix_from_flat(flat, level_width, level_height)))
+
+        except (struct.error, zlib.error):
+            return False
+
+        self.meta = {
+            "width": width,
+            "height": height,
+            "bit_depth": bit_depth,
+            "color_type": color_type,
+            "interlace_method": interlace_method,
+        }
+        self.levels = levels
+
+        return True
+
+    def _save_sidecar(self) -> None:
+        """
+        **Description:**
+
+        Saves every level, except the full size image, in to the sidecar file. Errors (like a read only folder) are ignored.
+        """
+
+        out = bytearray(self._sidecar_magic)
+        out += struct.pack(
+            self._sidecar_header,
+            self._source_key[0], self._source_key[1],
+            self.meta["width"], self.meta["height"], self.meta["bit_depth"], self.meta["color_type"], self.meta["interlace_method"],
+            len(self.levels) - 1,
+        )
+
+        for level in self.levels[1:]:
+            compressed = zlib.compress(bytes(level._get_flat()), 1)
+
+            out += struct.pack(self._sidecar_level, level.image_meta["width"], level.image_meta["height"], len(compressed))
+            out += compressed
+
+        try:
+            with open(self.sidecar_name, "wb") as f:
+                f.write(out)
+        except OSError:
+            pass
+
+class FrameSink:
+    """
+    **Description:**
+
+    Streams animation frames as raw, uncompressed video, to a file, the standard output, or the standard input of an external encoder (like ffmpeg).
+    Frames are not filtered, deflated or checksummed, so writing them costs little more than the I/O itself.
+
+    **Formats:**
+    - y4m (**default**): YUV4MPEG2 stream with 4:4:4 chroma (BT.601, limited range). The size and frame rate are in the header,
+    so encoders can read it without extra arguments, for example: ffmpeg -i frames.y4m out.mp4
+    - rgba: Raw RGBA bytes, frame after frame, without any header, for example: ffmpeg -f rawvideo -pix_fmt rgba -s WxH -r 24 -i frames.rgba out.mp4
+
+    The alpha channel is multiplied in to the colors (transparent pixels become black) in y4m format.
+
+    Can be used as a context manager, the sink is closed on exit.
+    """
+
+    format : str
+    fps : float
+    width : int|None
+    height : int|None
+    frame_count : int
+
+    _formats = ("y4m", "rgba")
+
+    def __init__(self, target : "str|io.BufferedIOBase|None" = None, format : str = "y4m", fps : float = 24, command : list|None = None) -> None:
+        """
+        **Parameters:**
+        - target(str|file) The name of the output file, "-" for the standard output, or an opened binary file
+        - format(str) y4m or rgba
+        - fps(float) The frame rate written into the y4m header
+        - command(list) When set, this command is started, and the frames are written to its standard input, instead of the target.
+        For example: ["ffmpeg", "-y", "-i", "-", "out.mp4"]
+        """
+
+        if format not in self._formats:
+            raise ValueError(f"Invalid format: '{format}', must be one of: {", ".join(self._formats)}")
+
+        if target is None and command is None:
+            raise ValueError("Either a target or a command is needed!")
+
+        self.format = format
+        self.fps = fps
+        self.width = None
+        self.height = None
+        self.frame_count = 0
+
+        self._process = None
+        self._close_stream = False
+
+        if command is not None:
+            self._process = subprocess.Popen(command, stdin=subprocess.PIPE)
+            self._stream = self._process.stdin
+        elif target == "-":
+            sys.stdout.flush()
+            self._stream = sys.stdout.buffer
+        elif type(target) is str:
+            self._stream = open(target, "wb")
+            self._close_stream = True
+        else:
+            self._stream = target
+
+        if format == "y4m":
+            self._build_yuv_tables()
+
+    def __enter__(self) -> "FrameSink":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def write_frame(self, image : PNG) -> None:
+        """
+        **Description:**
+
+        Writes the image as the next frame. Every frame must have the same size as the first one.
+        """
+
+        width = image.image_meta["width"]
+        height = image.image_meta["height"]
+
+        if self.width is None:
+            self.width = width
+            self.height = height
+
+            if self.format == "y4m":
+                fps_numerator, fps_denominator = self._get_fps_fraction()
+                self._stream.write(f"YUV4MPEG2 W{width} H{height} F{fps_numerator}:{fps_denominator} Ip A1:1 C444\n".encode("ascii"))
+
+        elif width != self.width or height != self.height:
+            raise ValueError(f"Every frame must be {self.width}x{self.height}, got {width}x{height}!")
+
+        flat = image._get_flat()
+
+        if self.format == "rgba":
+            self._stream.write(bytes(flat))
+        else:
+            self._stream.write(b"FRAME\n")
+            self._stream.write(self._convert_yuv(flat))
+
+        self.frame_count += 1
+
+    def close(self) -> None:
+        """
+        **Description:**
+
+        Flushes the output, closes the file, or waits for the external encoder to finish.
+        """
+
+        if self._stream is None: return
+
+        self._stream.flush()
+
+        if self._process is not None:
+            self._stream.close()
+            self._process.wait()
+        elif self._close_stream:
+            self._stream.close()
+
+        self._stream = None
+
+    def _get_fps_fraction(self) -> tuple:
+        if float(self.fps).is_integer():
+            return int(self.fps), 1
+
+        return round(self.fps * 1000), 1000
+
+    def _build_yuv_tables(self) -> None:
+        """
+        **Description:**
+
+        Precomputes the contribution of every channel value to Y, Cb and Cr, as 16 bit fixed-point integers (BT.601, limited range)
+        """
+
+        def table(factor : float, offset : float = 0) -> list:
+            return [round((factor * v / 255 + offset) * 65536) for v in range(256)]
+
+        # Offsets are added to the red tables, +0.5 rounds the result
+        self._y_tables = (table(65.481, 16.5), table(128.553), table(24.966))
+        self._cb_tables = (table(-37.797, 128.5), table(-74.203), table(112.0))
+        self._cr_tables = (table(112.0, 128.5), table(-93.786), table(-18.214))
+
+    def _convert_yuv(self, flat : list) -> bytes:
+        """
+        **Description:**
+
+        Converts a flat RGBA buffer to the planar Y, Cb and Cr bytes of a y4m frame
+        """
+
+        red = flat[0::4]
+        green = flat[1::4]
+        blue = flat[2::4]
+        alpha = flat[3::4]
+
+        # Multiply the colors with the alpha, if there are transparent pixels
+        if min(alpha, default=255) < 255:
+            red = [c * a // 255 for c, a in zip(red, alpha)]
+            green = [c * a // 255 for c, a in zip(green, alpha)]
+            blue = [c * a // 255 for c, a in zip(blue, alpha)]
+
+        out = bytearray()
+
+        for r_table, g_table, b_table in (self._y_tables, self._cb_tables, self._cr_tables):
+            out += bytes([(r_table[r] + g_table[g] + b_table[b]) >> 16 for r, g, b in zip(red, green, blue)])
+
+        return bytes(out)
+
+class APNGWriter:
+    """
+    **Description:**
+
+    Writes an animated PNG (APNG) frame by frame. Only the bounding rectangle of the pixels, that differ from the previous frame is stored,
+    so mostly static animations take a fraction of the size (and the encoding time) of separate full frames.
+    The first frame is also the default image, so viewers without APNG support show it as a still image.
+
+    Frame encoding:
+    - Every frame is drawn on top of the previous one (dispose op: NONE)
+    - If every changed pixel is opaque, the unchanged pixels in the rectangle are stored as transparent black (blend op: OVER), this compresses better
+    - Otherwise the rectangle is stored as is, and replaces the previous pixels (blend op: SOURCE)
+    - Frames identical to the previous one are not stored, the display time of the previous frame is extended instead
+    - Display times longer than 65535 seconds are continued by empty frames
+
+    Every frame is written in RGBA mode, and must have the same size as the first one.
+    Can be used as a context manager, the file is finished on exit.
+    """
+
+    file_name : str
+    fps : float
+    loop_count : int
+    width : int|None
+    height : int|None
+    frame_count : int
+
+    _dispose_op_none = 0
+    _blend_op_source = 0
+    _blend_op_over = 1
+
+    def __init__(self, file_name : str, fps : float = 24, loop_count : int = 0) -> None:
+        """
+        **Parameters:**
+        - file_name(str) The name of the output file
+        - fps(float) The default frame rate, used for frames without a delay
+        - loop_count(int) How many times the animation is played, 0 means forever
+        """
+
+        self.file_name = file_name
+        self.fps = fps
+        self.loop_count = loop_count
+        self.width = None
+        self.height = None
+        self.frame_count = 0
+
+        self._file = open(file_name, "wb")
+        self._actl_offset = 0
+        self._sequence_number = 0
+        self._previous = None # The flat buffer of the previous frame (the canvas)
+        self._pending = None # The last frame, it is written when its display time is known
+
+    def __enter__(self) -> "APNGWriter":
+        return self
+
+    def __exit__(self, exception_type : type|None, *args) -> None:
+        # The error of the with block is not hidden by the error of an empty animation
+        if exception_type is not None and self._pending is None:
+            self._discard()
+            return
+
+        self.close()
+
+    def write_frame(self, image : PNG, delay : float|None = None) -> None:
+        """
+        **Description:**
+
+        Adds the image to the animation, as the next frame
+
+        **Parameters:**
+        - image(PNG) The image of the frame
+        - delay(float) The display time of the frame, in seconds (**default**: 1 / fps)
+        """
+
+        if self._file is None:
+            raise ValueError("The animation is already closed!")
+
+        delay = fractions.Fraction(1) / fractions.Fraction(self.fps) if delay is None else fractions.Fraction(delay)
+
+        width = image.image_meta["width"]
+        height = image.image_meta["height"]
+
+        flat = image._get_flat()
+
+        if self._previous is None:
+            self.width = width
+            self.height = height
+
+            self._write_header()
+            self._pending = {"rect": (0, 0, width, height), "data": flat, "blend": self._blend_op_source, "delay": delay}
+            self._previous = flat
+            return
+
+        if width != self.width or height != self.height:
+            raise ValueError(f"Every frame must be {self.width}x{self.height}, got {width}x{height}!")
+
+        rect = self._get_changed_rect(self._previous, flat)
+
+        # Nothing changed, show the previous frame for longer
+        if rect is None:
+            self._pending["delay"] += delay
+            return
+
+        data, blend = self._get_delta(self._previous, flat, rect)
+
+        self._flush_pending()
+        self._pending = {"rect": rect, "data": data, "blend": blend, "delay": delay}
+        self._previous = flat
+
+    def close(self) -> None:
+        """
+        **Description:**
+
+        Writes the last frame, and the frame count, then closes the file.
+        If no frames were added, the file is removed (it would not be a valid PNG), and a ValueError is raised.
+        """
+
+        if self._file is None: return
+
+        if self._pending is None:
+            self._discard()
+            raise ValueError("No frames were added!")
+
+        self._flush_pending()
+        self._file.write(_generate_chunk(b"IEND", b""))
+
+        # The number of frames is only known now
+        self._file.seek(self._actl_offset)
+        self._file.write(self._generate_chunk_acTL())
+
+        self._file.close()
+        self._file = None
+
+    def _discard(self) -> None:
+        """
+        **Description:**
+
+        Closes, and removes the unfinished file
+        """
+
+        self._file.close()
+        self._file = None
+
+        try:
+            os.remove(self.file_name)
+        except OSError:
+            pass
+
+    def _write_header(self) -> None:
+        # The magic header for every PNG
+        self._file.write(bytes([0x89, 0x50, 0x4E, 0x47, 0x0D, 0x0A, 0x1A, 0x0A]))
+
+        # 8 bit, true color with alpha, deflate compression, no filter, no interlacing
+        self._file.write(_generate_chunk(b"IHDR", struct.pack(">IIBBBBB", self.width, self.height, 8, 6, 0, 0, 0)))
+
+        self._actl_offset = self._file.tell()
+        self._file.write(self._generate_chunk_acTL())
+
+    def _generate_chunk_acTL(self) -> bytearray:
+        return _generate_chunk(b"acTL", struct.pack(">II", self.frame_count, self.loop_count))
+
+    def _flush_pending(self) -> None:
+        """
+        **Description:**
+
+        Writes the fcTL and the IDAT (first frame) or fdAT chunks of the pending frame.
+        A delay, that does not fit into one frame, is continued by empty frames, that keep the canvas as it is.
+        """
+
+        delays = self._split_delay(self._pending["delay"])
+
+        self._write_frame_chunks(self._pending["rect"], self._pending["data"], self._pending["blend"], delays[0])
+
+        for delay in delays[1:]:
+            # A single transparent pixel drawn over the canvas
+            self._write_frame_chunks((0, 0, 1, 1), [0, 0, 0, 0], self._blend_op_over, delay)
+
+        self._pending = None
+
+    def _split_delay(self, delay : fractions.Fraction) -> list:
+        """
+        **Description:**
+
+        Splits the delay into (numerator, denominator) pairs, that fit into 16 bit integers.
+        Every part is at most 65535 seconds, the last one is the closest fraction, with both values fitting.
+        """
+
+        parts = []
+
+        while delay > 0xFFFF:
+            parts.append((0xFFFF, 1))
+            delay -= 0xFFFF
+
+        # The largest denominator, that keeps the numerator in 16 bits
+        max_denominator = 0xFFFF if delay <= 1 else int(0xFFFF / delay)
+        delay = delay.limit_denominator(max_denominator)
+
+        parts.append((min(delay.numerator, 0xFFFF), delay.denominator))
+
+        return parts
+
+    def _write_frame_chunks(self, rect : tuple, data : list, blend : int, delay : tuple) -> None:
+        x, y, width, height = rect
+        delay_numerator, delay_denominator = delay
+
+        self._file.write(_generate_chunk(b"fcTL", struct.pack(">IIIIIHHBB",
+            self._sequence_number,
+            width, height, x, y,
+            delay_numerator, delay_denominator,
+            self._dispose_op_none, blend,
+        )))
+        self._sequence_number += 1
+
+        stride = width * 4
+
+        pixel_data = bytearray()
+
+        for offset in range(0, len(data), stride):
+            pixel_data.append(0x00) # Scanline filtering method
+            pixel_data += bytes(data[offset:offset + stride])
+
+        compressed = zlib.compress(pixel_data)
+
+        if self.frame_count == 0:
+            self._file.write(_generate_chunk(b"IDAT", compressed))
+        else:
+            self._file.write(_generate_chunk(b"fdAT", self._sequence_number.to_bytes(4, 'big') + compressed))
+            self._sequence_number += 1
+
+        self.frame_count += 1
+
+    def _get_changed_rect(self, previous : list, current : list) -> tuple|None:
+        """
+        **Description:**
+
+        Returns the bounding rectangle (x, y, width, height) of the pixels, that differ between the two flat buffers, or None, if they are identical
+        """
+
+        if previous == current: return None
+
+        stride = self.width * 4
+
+        left = self.width
+        right = 0
+        top = None
+        bottom = 0
+
+        for y in range(self.height):
+            start = y * stride
+            end = start + stride
+
+            # Whole rows are compared at once, only changed rows are scanned
+            if previous[start:end] == current[start:end]: continue
+
+            if top is None: top = y
+            bottom = y + 1
+
+            first = start
+            while previous[first] == current[first]: first += 1
+
+            last = end - 1
+            while previous[last] == current[last]: last -= 1
+
+            left = min(left, (first - start) // 4)
+            right = max(right, (last - start) // 4 + 1)
+
+        return (left, top, right - left, bottom - top)
+
+    def _get_delta(self, previous : list, current : list, rect : tuple) -> tuple:
+        """
+        **Description:**
+
+        Cuts out the rectangle from the current frame, and chooses the blend op
+
+        **Returns:**
+        - A tuple: (flat RGBA data of the rectangle, blend op)
+        """
+
+        x, y, width, height = rect
+        stride = self.width * 4
+
+        source = []
+        over = []
+        opaque = True
+
+        for row in range(y, y + height):
+            start = row * stride + x * 4
+            end = start + width * 4
+
+            current_row = current[start:end]
+            previous_row = previous[start:end]
+
+            source += current_row
+
+            if not opaque: continue
+
+            for offset in range(0, width * 4, 4):
+                pixel = current_row[offset:offset + 4]
+
+                if pixel == previous_row[offset:offset + 4]:
+                    over += (0, 0, 0, 0)
+                elif pixel[3] == 255:
+                    over += pixel
+                else:
+                    opaque = False
+                    break
+
+        if opaque: return over, self._blend_op_over
+
+        return source, self._blend_op_source
+
+class APNGReader:
+    """
+    **Description:**
+
+    Reads animated PNG (APNG) files lazily. Only the positions of the frame chunks are read up front,
+    every frame is decoded when it is requested, and composited on to a single canvas, that is reused between the frames,
+    so long animations can be played, or scrubbed, without holding every frame in memory.
+
+    Iterating over the reader yields the frames in order. Images without animation have a single frame.
+
+    **Attributes:**
+    - width(int), height(int) The size of the canvas
+    - loop_count(int) How many times the animation should be played, 0 means forever
+    - frames(list) The control data of every frame (x, y, width, height, delay, dispose, blend)
+    - image(PNG) The image of the last decoded frame. **The same object is updated for every frame**, copy its matrix, to keep a frame
+
+    Can be used as a context manager, the file is closed on exit.
+    """
+
+    width : int
+    height : int
+    loop_count : int
+    frames : list
+    image : PNG
+
+    _dispose_op_none = 0
+    _dispose_op_background = 1
+    _dispose_op_previous = 2
+    _blend_op_source = 0
+    _blend_op_over = 1
+
+    def __init__(self, file_name : str) -> None:
+        """
+        **Parameters:**
+        - file_name(str) The name of the (animated) PNG file
+        """
+
+        self._file = open(file_name, "rb")
+
+        self.loop_count = 0
+        self.frames = []
+
+        self._color_type = 6
+        self._pixel_size = 4
+        self._palette = []
+
+        self._index_chunks()
+
+        # A fully transparent canvas
+        self._canvas = [0] * (self.width * self.height * 4)
+        self._next_frame = 0 # The index of the frame, that will be composited next
+        self._dispose = None # (dispose op, rectangle, saved pixels) of the last composited frame
+
+        self.image = PNG(self._canvas, self.width, self.height, flags=PNG_INPUT_ARRAY)
+        self.image._set_flat(list(self._canvas), self.width, self.height)
+
+    def __enter__(self) -> "APNGReader":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def __iter__(self) -> iter:
+        for index in range(len(self.frames)):
+            yield self.get_frame(index)
+
+    def get_frame(self, index : int) -> PNG:
+        """
+        **Description:**
+
+        Decodes the frame with the given index, and returns with the image of the canvas.
+        Moving forward only decodes the frames in between, moving backward starts from the last frame, that covers the whole canvas.
+        """
+
+        if index < 0 or index >= len(self.frames):
+            raise ValueError(f"Invalid frame index: {index}, the animation has {len(self.frames)} frames!")
+
+        if index == self._next_frame - 1:
+            return self.image
+
+        # Start from the last frame, that does not depend on the previous ones
+        start = index
+        while start > 0 and not self._is_key_frame(start): start -= 1
+
+        if index < self._next_frame or start > self._next_frame:
+            if start == 0:
+                self._canvas = [0] * (self.width * self.height * 4)
+
+            self._next_frame = start
+            self._dispose = None
+
+        while self._next_frame <= index:
+            self._composite_frame(self._next_frame)
+            self._next_frame += 1
+
+        self.image._set_flat(list(self._canvas), self.width, self.height)
+
+        return self.image
+
+    def close(self) -> None:
+        """
+        **Description:**
+
+        Closes the file
+        """
+
+        if self._file is None: return
+
+        self._file.close()
+        self._file = None
+
+    def _index_chunks(self) -> None:
+        """
+        **Description:**
+
+        Walks through the chunks, and saves the position of the image data of every frame.
+        The image data is skipped over, only the small chunks are read.
+        """
+
+        magic_header = bytes([0x89, 0x50, 0x4E, 0x47, 0x0D, 0x0A, 0x1A, 0x0A])
+
+        if self._file.read(len(magic_header)) != magic_header:
+            raise ValueError("Invalid PNG image (Invalid header)")
+
+        default_image = [] # The IDAT chunks, when the default image is not a part of the animation
+        animated = False
+        frame = None
+
+        while True:
+            chunk_header = self._file.read(8)
+
+            if len(chunk_header) < 8: break
+
+            chunk_length, chunk_type = struct.unpack(">I4s", chunk_header)
+            data_offset = self._file.tell()
+
+            match chunk_type:
+                case b"IHDR":
+                    self.width, self.height, bit_depth, self._color_type, _, _, interlace_method = struct.unpack(">IIBBBBB", self._file.read(13))
+
+                    if bit_depth != 8 or interlace_method != 0:
+                        raise ValueError("Only 8 bit, not interlaced animations are supported!")
+
+                    self._pixel_size = PNG._channels_per_color[self._color_type]
+
+                case b"PLTE":
+                    chunk_data = self._file.read(chunk_length)
+                    self._palette = [[chunk_data[i], chunk_data[i + 1], chunk_data[i + 2], 255] for i in range(0, chunk_length - 2, 3)]
+
+                case b"tRNS":
+                    if self._color_type == PNG._color_type_indexed:
+                        if chunk_length > len(self._palette):
+                            raise ValueError("Invalid PNG image (tRNS has more entries than PLTE)")
+
+                        for i, alpha in enumerate(self._file.read(chunk_length)):
+                            self._palette[i][3] = alpha
+
+                case b"acTL":
+                    animated = True
+                    _, self.loop_count = struct.unpack(">II", self._file.read(8))
+
+                case b"fcTL":
+                    _, width, height, x, y, delay_numerator, delay_denominator, dispose, blend = struct.unpack(">IIIIIHHBB", self._file.read(26))
+
+                    frame = {
+                        "x": x,
+                        "y": y,
+                        "width": width,
+                        "height": height,
+                        "delay": delay_numerator / (delay_denominator or 100), # A denominator of 0 means 1/100 seconds
+                        "dispose": dispose,
+                        "blend": blend,
+                        "chunks": [], # (offset, length) of the image data
+                    }
+
+                    self.frames.append(frame)
+
+                case b"IDAT":
+                    if frame is None:
+                        default_image.append((data_offset, chunk_length))
+                    else:
+                        frame["chunks"].append((data_offset, chunk_length))
+
+                case b"fdAT":
+                    if frame is None:
+                        raise ValueError("Invalid APNG (fdAT before fcTL)")
+
+                    # The first 4 bytes are the sequence number
+                    frame["chunks"].append((data_offset + 4, chunk_length - 4))
+
+                case b"IEND":
+                    break
+
+            # Skip the (rest of the) data and the CRC
+            self._file.seek(data_offset + chunk_length + 4)
+
+        # A still image, or a file, where the animation could not be found
+        if not animated or len(self.frames) == 0:
+            self.frames = [{
+                "x": 0,
+                "y": 0,
+                "width": self.width,
+                "height": self.height,
+                "delay": 0,
+                "dispose": self._dispose_op_none,
+                "blend": self._blend_op_source,
+                "chunks": default_image + (self.frames[0]["chunks"] if self.frames else []),
+            }]
+
+    def _is_key_frame(self, index : int) -> bool:
+        frame = self.frames[index]
+
+        # A frame disposed to the previous state needs the canvas from before it, so the decoding can not start there
+        return (
+            frame["blend"] == self._blend_op_source and frame["dispose"] != self._dispose_op_previous
+            and frame["x"] == 0 and frame["y"] == 0 and frame["width"] == self.width and frame["height"] == self.height
+        )
+
+    def _composite_frame(self, index : int) -> None:
+        """
+        **Description:**
+
+        Disposes the previous frame, then decodes the frame with the given index, and draws it on the canvas
+        """
+
+        frame = self.frames[index]
+        canvas = self._canvas
+        stride = self.width * 4
+
+        # Dispose the previous frame
+        if self._dispose is not None:
+            dispose, (x, y, width, height), saved = self._dispose
+
+            for row in range(height):
+                start = (y + row) * stride + x * 4
+
+                if dispose == self._dispose_op_background:
+                    canvas[start:start + width * 4] = [0] * (width * 4)
+                elif dispose == self._dispose_op_previous:
+                    canvas[start:start + width * 4] = saved[row]
+
+        x, y, width, height = frame["x"], frame["y"], frame["width"], frame["height"]
+
+        if x + width > self.width or y + height > self.height:
+            raise ValueError(f"Frame {index} is outside of the canvas!")
+
+        # The first frame can not be restored to a previous state
+        dispose = frame["dispose"]
+        if dispose == self._dispose_op_previous and index == 0: dispose = self._dispose_op_background
+
+        saved = None
+        if dispose == self._dispose_op_previous:
+            saved = [canvas[(y + row) * stride + x * 4:(y + row) * stride + (x + width) * 4] for row in range(height)]
+
+        self._dispose = (dispose, (x, y, width, height), saved)
+
+        # Read and decode the image data of the frame
+        data = bytearray()
+
+        for offset, length in frame["chunks"]:
+            self._file.seek(offset)
+            data += self._file.read(length)
+
+        rows = self.image._unfilter_rows(zlib.decompress(data), width, height, self._pixel_size)
+
+        for row, line in enumerate(rows):
+            flat = self.image._row_to_rgba(line, self._color_type, self._palette)
+            start = (y + row) * stride + x * 4
+
+            if frame["blend"] == self._blend_op_source:
+                canvas[start:start + width * 4] = flat
+                continue
+
+            for offset in range(0, width * 4, 4):
+                alpha = flat[offset + 3]
+
+                if alpha == 0: continue
+
+                if alpha == 255:
+                    canvas[start + offset:start + offset + 4] = flat[offset:offset + 4]
+                    continue
+
+                # Alpha compositing, on to a (possibly transparent) background
+                background_alpha = canvas[start + offset + 3] * (255 - alpha) // 255
+                out_alpha = alpha + background_alpha
+
+                for channel in range(3):
+                    canvas[start + offset + channel] = (flat[offset + channel] * alpha + canvas[start + offset + channel] * background_alpha) // out_alpha
+
+                canvas[start + offset + 3] = out_alpha
+
+class ShaderCache:
+    """
+    **Description:**
+
+    Content addressed, on-disk cache for the results of image passes (shaders, convolutions, or functions combining them).
+    A pass is a function, that modifies the image it receives. The result is stored under a key, made from:
+    - The pixels and the size of the input image
+    - The name and the source code of the pass function
+    - The arguments of the pass (functions in the arguments are identified by their source code, images and samplers by their pixels)
+    - The source code of this module
+
+    So any change in the inputs results in a new key, and an old result is never used by mistake.
+    **NOTE: Functions called by the pass are not part of the key, pass them as arguments, to have their changes noticed**
+
+    The results are stored compressed, and the least recently used ones are deleted, when the total size exceeds the limit.
+
+    **Example:**
+    ```
+    def mask_pass(image, kernel, shader):
+        image.convolve(kernel)
+        image.shader(shader)
+
+    cache = ShaderCache(".shader_cache")
+    cache.run(image, mask_pass, box_kernel(5), alpha_monochrome_shader)
+    ```
+    """
+
+    directory : str
+    max_bytes : int
+    hits : int
+    misses : int
+
+    _magic_header = b"PNGPASS1"
+    _file_extension = ".pass"
+    _module_hash : bytes|None = None # The hash of this module, computed once
+
+    def __init__(self, directory : str = ".shader_cache", max_bytes : int = 256 * 1024 * 1024) -> None:
+        """
+        **Parameters:**
+        - directory(str) The folder of the cached results, created if it does not exist
+        - max_bytes(int) The maximum total size of the cached results
+        """
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def run(self, image : PNG, function : callable, *args, **kwargs) -> PNG:
+        """
+        **Description:**
+
+        Applies the pass to the image, or replaces the pixels of the image with the stored result, if the pass was already computed.
+
+        **Parameters:**
+        - image(PNG) The input of the pass, it is modified in place
+        - function(callable) The pass, receives the image, and the rest of the arguments
+        - args, kwargs: The arguments of the pass
+
+        **Returns:**
+
+        The same image
+        """
+
+        key = self.get_key(image, function, *args, **kwargs)
+        path = os.path.join(self.directory, key + self._file_extension)
+
+        result = self._load(path)
+
+        if result is not None:
+            self.hits += 1
+
+            flat, width, height = result
+            image._set_flat(flat, width, height)
+
+            return image
+
+        self.misses += 1
+
+        function(image, *args, **kwargs)
+
+        self._store(path, image)
+        self._evict()
+
+        return image
+
+    def get_key(self, image : PNG, function : callable, *args, **kwargs) -> str:
+        """
+        **Description:**
+
+        Returns with the key of the result of the pass, as a hex string
+        """
+
+        digest = hashlib.sha256()
+
+        digest.update(self._get_module_hash())
+        self._hash_value(digest, image)
+        self._hash_value(digest, function)
+        self._hash_value(digest, args)
+        self._hash_value(digest, sorted(kwargs.items()))
+
+        return digest.hexdigest()
+
+    def clear(self) -> None:
+        """
+        **Description:**
+
+        Deletes every cached result
+        """
+
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self._file_extension): os.remove(entry.path)
+
+    def _get_module_hash(self) -> bytes:
+        if ShaderCache._module_hash is None:
+            with open(__file__, "rb") as f:
+                ShaderCache._module_hash = hashlib.sha256(f.read()).digest()
+
+        return ShaderCache._module_hash
+
+    def _hash_value(self, digest : any, value : any) -> None:
+        """
+        **Description:**
+
+        Adds a value to the hash, by its content, not by its identity
+        """
+
+        if isinstance(value, PNG):
+            digest.update(struct.pack(">BII", 0, value.image_meta["width"], value.image_meta["height"]))
+            digest.update(bytes(value._get_flat()))
+
+        elif isinstance(value, Sampler):
+            digest.update(struct.pack(">BII", 1, value.width, value.height))
+            digest.update(f"{value.address_mode}:{value.filter}".encode())
+            digest.update(bytes(value._pixels))
+
+        elif isinstance(value, (list, tuple)):
+            digest.update(struct.pack(">BI", 2, len(value)))
+
+            for item in value: self._hash_value(digest, item)
+
+        elif callable(value):
+            digest.update(b"\x03" + getattr(value, "__module__", "").encode() + b":" + getattr(value, "__qualname__", "").encode())
+
+            try:
+                digest.update(inspect.getsource(value).encode())
+            except (OSError, TypeError):
+                # The source is not available (for example in the interactive shell), the bytecode is used instead
+                code = getattr(value, "__code__", None)
+                digest.update(code.co_code + repr(code.co_consts).encode() if code else repr(value).encode())
+
+        else:
+            digest.update(b"\x04" + repr(value).encode())
+
+    def _load(self, path : str) -> tuple|None:
+        """
+        **Returns:**
+
+        A tuple: (flat list of RGBA channels, width, height), or None, if the result is not stored, or the file is not valid
+        """
+
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        header_size = len(self._magic_header) + 8
+
+        # Truncated, or not a cache file
+        if len(data) < header_size or data[:len(self._magic_header)] != self._magic_header:
+            return None
+
+        width, height = struct.unpack(">II", data[len(self._magic_header):header_size])
+
+        try:
+            flat = list(zlib.decompress(data[header_size:]))
+        except zlib.error:
+            return None
+
+        if len(flat) != width * height * 4:
+            return None
+
+        # Mark as recently used (not possible in a read-only cache folder, the result is still valid)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return flat, width, height
+
+    def _store(self, path : str, image : PNG) -> None:
+        data = bytearray(self._magic_header)
+        data += struct.pack(">II", image.image_meta["width"], image.image_meta["height"])
+        data += zlib.compress(bytes(image._get_flat()))
+
+        # Written under a temporary name first, so other processes never read a half written file
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+
+        with open(temporary_path, "wb") as f:
+            f.write(data)
+
+        os.replace(temporary_path, path)
+
+    def _evict(self) -> None:
+        """
+        **Description:**
+
+        Deletes the least recently used results, until the total size fits in the limit
+        """
+
+        entries = []
+        total_size = 0
+
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(self._file_extension): continue
+
+            stat = entry.stat()
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            total_size += stat.st_size
+
+        entries.sort()
+
+        for _, size, path in entries:
+            if total_size <= self.max_bytes: break
+
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+            total_size -= size
+
+def _parse_text_chunk(chunk_type : str, chunk_data : bytes) -> dict:
+    """
+    **Description:**
+
+    Parses the data of a tEXt, zTXt or iTXt chunk
+
+    **Returns:**
+
+    A dictionary, that looks like this:
+    - type: str, the chunk type
+    - key: str
+    - value: str|None, None, if the compressed text could not be decompressed
+    - compressed: bool
+    - language: str (only in iTXt)
+    - translated_key: str (only in iTXt)
+    """
+
+    key, _, rest = bytes(chunk_data).partition(b"\x00")
+
+    out = {
+        "type": chunk_type,
+        "key": key.decode("ISO-8859-1"),
+        "value": None,
+        "compressed": False,
+    }
+
+    try:
+        match chunk_type:
+            case "tEXt":
+                out["value"] = rest.decode("ISO-8859-1")
+
+            case "zTXt":
+                # The first byte is the compression method (0: deflate)
+                out["compressed"] = True
+                out["value"] = zlib.decompress(rest[1:]).decode("ISO-8859-1")
+
+            case "iTXt":
+                compressed = rest[0] == 1
+                language, _, rest = rest[2:].partition(b"\x00")
+                translated_key, _, text = rest.partition(b"\x00")
+
+                out["compressed"] = compressed
+                out["language"] = language.decode("ascii", errors="replace")
+                out["translated_key"] = translated_key.decode("utf-8", errors="replace")
+                out["value"] = (zlib.decompress(text) if compressed else text).decode("utf-8")
+
+    except (zlib.error, UnicodeDecodeError, IndexError):
+        pass
+
+    return out
+
+def _generate_text_chunk(key : str, value : str, compress : bool = False) -> bytearray:
+    """
+    **Description:**
+
+    Generates a text chunk. Latin-1 text is stored in a tEXt chunk (or zTXt, if compressed), any other text in an iTXt chunk (UTF-8)
+
+    **Parameters:**
+    - key(str) The keyword, 1 - 79 Latin-1 characters
+    - value(str) The text
+    - compress(bool) Compress the text with deflate
+    """
+
+    try:
+        key_bytes = key.encode("ISO-8859-1")
+    except UnicodeEncodeError:
+        raise ValueError(f"Invalid text key: '{key}', only Latin-1 characters are allowed!")
+
+    if len(key_bytes) < 1 or len(key_bytes) > 79 or b"\x00" in key_bytes:
+        raise ValueError(f"Invalid text key: '{key}', must be 1 - 79 characters long, without null characters!")
+
+    try:
+        value_bytes = value.encode("ISO-8859-1")
+    except UnicodeEncodeError:
+        # International text: keyword, compression flag, compression method, language, translated keyword, text
+        text = value.encode("utf-8")
+        if compress: text = zlib.compress(text)
+
+        return _generate_chunk(b"iTXt", key_bytes + bytes([0, 1 if compress else 0, 0, 0, 0]) + text)
+
+    if compress:
+        return _generate_chunk(b"zTXt", key_bytes + b"\x00\x00" + zlib.compress(value_bytes))
+
+    return _generate_chunk(b"tEXt", key_bytes + b"\x00" + value_bytes)
+
+def _generate_time_chunk(modification_time : "dict|bool") -> bytearray:
+    """
+    **Description:**
+
+    Generates a tIME chunk, from a dictionary (year, month, day, hour, minute, second), or the current (UTC) time, if set to True
+    """
+
+    if modification_time is True:
+        now = time.gmtime()
+        modification_time = {"year": now.tm_year, "month": now.tm_mon, "day": now.tm_mday, "hour": now.tm_hour, "minute": now.tm_min, "second": now.tm_sec}
+
+    return _generate_chunk(b"tIME", struct.pack(">HBBBBB", *(modification_time[name] for name in ("year", "month", "day", "hour", "minute", "second"))))
+
+def _copy_chunks(source, target, new_chunks : bytes, removed_keys : set, replace_time : bool, palette_chunks : bytes|None = None, name : str = "") -> None:
+    """
+    **Description:**
+
+    Copies the chunks of a PNG stream (after the magic header) to the target stream, byte for byte, while replacing
+    the text entries, the modification time, and the palette. Used to change an image, without decoding, or encoding its pixels.
+
+    **Parameters:**
+    - source(file) The stream to read from, positioned after the magic header
+    - target(file) The stream to write into
+    - new_chunks(bytes) Chunks written before the image data
+    - removed_keys(set) The text entries (tEXt, zTXt, iTXt) with these keys are dropped
+    - replace_time(bool) Drop the tIME chunk
+    - palette_chunks(bytes) The new PLTE (and tRNS) chunks, written in place of the original ones, if set
+    - name(str) The name of the image, used in error messages
+    """
+
+    inserted = False
+    replace_palette = palette_chunks is not None
+
+    while True:
+        chunk_header = source.read(8)
+
+        if len(chunk_header) < 8:
+            raise ValueError(f"Invalid PNG image (Missing IEND chunk): {name}")
+
+        chunk_length, chunk_type = struct.unpack(">I4s", chunk_header)
+
+        if chunk_type in (b"tEXt", b"zTXt", b"iTXt"):
+            chunk_data = source.read(chunk_length + 4) # With the CRC
+
+            # Replaced, or removed entry
+            if chunk_data.partition(b"\x00")[0].decode("ISO-8859-1") in removed_keys: continue
+
+            target.write(chunk_header + chunk_data)
+            continue
+
+        if (chunk_type == b"tIME" and replace_time) or (chunk_type in (b"PLTE", b"tRNS") and replace_palette):
+            source.seek(chunk_length + 4, os.SEEK_CUR)
+
+            if chunk_type == b"PLTE":
+                target.write(palette_chunks)
+                palette_chunks = b""
+
+            continue
+
+        # The new chunks go before the image data (and the animation frames)
+        if not inserted and chunk_type in (b"IDAT", b"fcTL", b"IEND"):
+            # No PLTE chunk was found, the palette goes before the image data too
+            if palette_chunks:
+                target.write(palette_chunks)
+                palette_chunks = b""
+
+            target.write(new_chunks)
+            inserted = True
+
+        target.write(chunk_header)
+
+        remaining = chunk_length + 4
+
+        while remaining > 0:
+            block = source.read(min(remaining, 1024 * 1024))
+
+            if len(block) == 0:
+                raise ValueError(f"Invalid PNG image (Unexpected end of file): {name}")
+
+            target.write(block)
+            remaining -= len(block)
+
+        if chunk_type == b"IEND": break
+
+def edit_metadata(file_name : str, output_file : str|None = None, text : dict|None = None, compress_text : bool = False, modification_time : "dict|bool|None" = None) -> None:
+    """
+    **Description:**
+
+    Changes the text and time metadata of a PNG file, without decoding the image. Every other chunk (including the image data,
+    and chunks this module does not know) is copied byte for byte, so the edit runs at the speed of copying the file.
+
+    **Parameters:**
+    - file_name(str) The name of the PNG file
+    - output_file(str) The name of the new file, if not set, the file is changed in place (through a temporary file)
+    - text(dict) Key: value pairs of text entries. Every existing entry (tEXt, zTXt or iTXt) with the key is replaced, a None value removes the entries
+    - compress_text(bool) Store the new text entries compressed (zTXt, or compressed iTXt)
+    - modification_time(dict|bool) The new modification time (year, month, day, hour, minute, second), True for the current time,
+    False to remove the time, None keeps the time as is
+
+    **Example:**
+    ```
+    edit_metadata("image.png", text={"Author": "Me", "Comment": None}, modification_time=True)
+    ```
+    """
+
+    text = text or {}
+
+    # The new chunks are generated first, so invalid values do not leave a half written file
+    new_chunks = bytearray()
+
+    for key, value in text.items():
+        if value is not None: new_chunks += _generate_text_chunk(key, value, compress_text)
+
+    if modification_time: new_chunks += _generate_time_chunk(modification_time)
+
+    if output_file is None: output_file = file_name
+
+    magic_header = bytes([0x89, 0x50, 0x4E, 0x47, 0x0D, 0x0A, 0x1A, 0x0A])
+
+    with open(file_name, "rb") as source:
+        if source.read(len(magic_header)) != magic_header:
+            raise ValueError(f"Invalid PNG image (Invalid header): {file_name}")
+
+        # Written next to the output, then moved in place, so the original is never left broken
+        target = tempfile.NamedTemporaryFile("wb", dir=os.path.dirname(os.path.abspath(output_file)), suffix=".tmp", delete=False)
+
+        try:
+            with target:
+                target.write(magic_header)
+                _copy_chunks(source, target, new_chunks, set(text), modification_time is not None, name=file_name)
+
+            # The temporary file is created with 0600, the permissions of the replaced (or the source) file are kept
+            shutil.copymode(output_file if os.path.exists(output_file) else file_name, target.name)
+
+            os.replace(target.name, output_file)
+
+        except BaseException:
+            os.remove(target.name)
+            raise
+
+def _parse_time_chunk(chunk_data : bytes) -> dict:
+    """
+    **Description:**
+
+    Parses the data of a tIME chunk
+    """
+
+    year, month, day, hour, minute, second = struct.unpack(">HBBBBB", chunk_data[:7])
+
+    return {"year": year, "month": month, "day": day, "hour": hour, "minute": minute, "second": second}
+
+def probe(file_name : str) -> dict:
+    """
+    **Description:**
+
+    Reads the metadata of a PNG file, without reading the image data. Only the chunk headers, and the small metadata chunks are read,
+    the rest of the file is skipped over, so probing a large image reads only a few kilobytes.
+
+    **Parameters:**
+    - file_name(str) The name of the file
+
+    **Returns:**
+
+    A dictionary, that looks like this:
+    - path: str
+    - size: int, the size of the file in bytes
+    - width: int
+    - height: int
+    - bit_depth: int
+    - color_type: int
+    - interlace_method: int
+    - frames: int, the number of animation frames (1 for still images)
+    - text: list, every text entry (see _parse_text_chunk)
+    - time: dict, the last modification time (year, month, day, hour, minute, second), or empty
+    - chunks: list, (type : str, offset : int, length : int) of every chunk, the offset is the position of the chunk length in the file
+    """
+
+    out = {
+        "path": file_name,
+        "size": 0,
+        "width": 0,
+        "height": 0,
+        "bit_depth": 0,
+        "color_type": 0,
+        "interlace_method": 0,
+        "frames": 1,
+        "text": [],
+        "time": {},
+        "chunks": [],
+    }
+
+    magic_header = bytes([0x89, 0x50, 0x4E, 0x47, 0x0D, 0x0A, 0x1A, 0x0A])
+
+    with open(file_name, "rb") as f:
+        out["size"] = os.fstat(f.fileno()).st_size
+
+        if f.read(len(magic_header)) != magic_header:
+            raise ValueError(f"Invalid PNG image (Invalid header): {file_name}")
+
+        while True:
+            offset = f.tell()
+            chunk_header = f.read(8)
+
+            if len(chunk_header) < 8: break
+
+            chunk_length, chunk_type = struct.unpack(">I4s", chunk_header)
+            chunk_type = chunk_type.decode("ascii", errors="replace")
+
+            out["chunks"].append((chunk_type, offset, chunk_length))
+
+            match chunk_type:
                 case "IHDR":
-                    chunk_data_bytes = out["chunks"]["IHDR"]["data_bytes"]
+                    out["width"], out["height"], out["bit_depth"], out["color_type"], _, _, out["interlace_method"] = struct.unpack(">IIBBBBB", f.read(13))
+
+                case "acTL":
+                    out["frames"] = struct.unpack(">I", f.read(4))[0]
+
+                case "tEXt" | "zTXt" | "iTXt":
+                    out["text"].append(_parse_text_chunk(chunk_type, f.read(chunk_length)))
+
+                case "tIME":
+                    out["time"] = _parse_time_chunk(f.read(7))
+
+                case "IEND":
+                    break
+
+            # Skip the (rest of the) data and the CRC
+            f.seek(offset + 8 + chunk_length + 4)
+
+    return out
+
+def _safe_probe(file_name : str) -> dict:
+    """
+    **Description:**
+
+    Probes the file, but returns with the error message, instead of raising it: {"path": str, "error": str}
+    """
+
+    try:
+        return probe(file_name)
+    except (OSError, ValueError, struct.error) as e:
+        return {"path": file_name, "error": str(e)}
+
+def probe_tree(root : str, pattern : str = "*.png", workers : int = 8) -> iter:
+    """
+    **Description:**
+
+    Probes every matching file in a folder, and its subfolders, on multiple threads.
+    The folders are walked while the files are probed, and only a limited number of files are queued at once.
+
+    **Parameters:**
+    - root(str) The folder to scan
+    - pattern(str) Only the files, whose name matches this pattern are probed
+    - workers(int) The number of threads
+
+    **Returns:**
+
+    A generator, yielding the result of probe for every file, in the order they finish.
+    Files that could not be read yield a dictionary with the path and an error message: {"path": str, "error": str}
+    """
+
+    def file_names() -> iter:
+        for directory, _, names in os.walk(root):
+            for name in sorted(names):
+                if fnmatch.fnmatch(name.lower(), pattern.lower()):
+                    yield os.path.join(directory, name)
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        pending = set()
+
+        for file_name in file_names():
+            pending.add(pool.submit(_safe_probe, file_name))
+
+            if len(pending) < workers * 4: continue
+
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for future in done: yield future.result()
+
+        for future in concurrent.futures.as_completed(pending):
+            yield future.result()
+
+def analyze(file_name : str, recompress : bool = False, step : int = 64) -> dict:
+    """
+    **Description:**
+
+    Analyzes the compression of a PNG file, without decoding the pixels. The image data is decompressed once (a block at a time),
+    only the filter type byte of every scanline is read, and the compressed bytes are attributed to the scanlines they decompress into,
+    so it finds the expensive rows, and the wasted bytes of large images quickly. Only the first image (IDAT) of animated images is analyzed.
+
+    **Parameters:**
+    - file_name(str) The name of the file
+    - recompress(bool) Also compress the image data with the best compression level, to see how much smaller it could be (slow)
+    - step(int) The compressed bytes decompressed at once. Smaller steps attribute the compressed bytes to the rows more precisely, but take longer
+
+    **Returns:**
+
+    The result of probe, with these additional keys:
+    - image_data: dict, chunks (the number of IDAT chunks), compressed (bytes), inflated (bytes), expected (bytes of the scanlines), complete (bool)
+    - filters: list, the number of scanlines with each filter type (none, sub, up, average, paeth)
+    - invalid_filters: int, the number of scanlines with an unknown filter type
+    - rows: list, every scanline: {"pass": int (0 - 6 for interlaced images, else 0), "row": int, "filter": int|None, "inflated": int, "compressed": float}
+    - wasted: dict, bytes, that could be removed without changing the pixels:
+        - metadata: text and time chunks
+        - chunk_overhead: the headers, and checksums of the extra IDAT chunks
+        - stream_padding: data after the end of the compressed stream, and decompressed bytes after the last scanline
+        - trailing: data after the IEND chunk
+        - recompression: the difference to the best compression level (only with recompress, else None)
+    - seconds: float, the time of the analysis
+    """
+
+    start = time.perf_counter()
+    out = probe(file_name)
+
+    # The sizes of the scanlines (with the filter type byte), in the order they are stored
+    bits_per_pixel = max(PNG._channels_per_color[out["color_type"]] if out["color_type"] < len(PNG._channels_per_color) else 4, 1) * out["bit_depth"]
+    width, height = out["width"], out["height"]
+
+    if out["interlace_method"] == 1:
+        passes = ((0, 0, 8, 8), (4, 0, 8, 8), (0, 4, 4, 8), (2, 0, 4, 4), (0, 2, 2, 4), (1, 0, 2, 2), (0, 1, 1, 2))
+    else:
+        passes = ((0, 0, 1, 1),)
+
+    rows = []
+
+    for pass_index, (start_x, start_y, step_x, step_y) in enumerate(passes):
+        pass_width = (width - start_x + step_x - 1) // step_x
+        pass_height = (height - start_y + step_y - 1) // step_y
+
+        # Empty passes have no scanlines at all
+        if pass_width <= 0 or pass_height <= 0: continue
+
+        for y in range(pass_height):
+            rows.append({"pass": pass_index, "row": y, "filter": None, "inflated": (pass_width * bits_per_pixel + 7) // 8 + 1, "compressed": 0.0})
+
+    image_chunks = [(offset, length) for chunk_type, offset, length in out["chunks"] if chunk_type == "IDAT"]
+
+    inflater = zlib.decompressobj()
+    deflater = zlib.compressobj(9) if recompress else None
+    recompressed = 0
+
+    # The decompressed position, the first row, that is not complete yet, and the start of that row
+    position, row_index, row_start = 0, 0, 0
+    carried = 0 # Compressed bytes, that did not produce output yet
+
+    def attribute(piece : bytes, compressed : int) -> None:
+        nonlocal position, row_index, row_start, carried
+
+        compressed += carried
+
+        if len(piece) == 0:
+            carried = compressed
+            return
+
+        carried = 0
+        end = position + len(piece)
+
+        while row_index < len(rows) and row_start < end:
+            row = rows[row_index]
+            row_end = row_start + row["inflated"]
 
-                    out["chunks"]["IHDR"]["data"] = {
-                        "width": 0,
-                        "height": 0,
-                        "bit_depth": 0,
-                        "color_type": 0,
-                        "compression_method": 0,
-                        "filter_method": 0,
-                        "interlace_method": 0,
-                    }                    
+            # The first byte of the scanline is its filter type
+            if row_start >= position: row["filter"] = piece[row_start - position]
 
-                    out["chunks"]["IHDR"]["data"]["width"] = int.from_bytes(chunk_data_bytes[:4])
-                    chunk_data_bytes = chunk_data_bytes[4:]
-                    out["chunks"]["IHDR"]["data"]["height"] = int.from_bytes(chunk_data_bytes[:4])
-                    chunk_data_bytes = chunk_data_bytes[4:]
-                    out["chunks"]["IHDR"]["data"]["bit_depth"] = int.from_bytes(chunk_data_bytes[:1])
-                    chunk_data_bytes = chunk_data_bytes[1:]
-                    out["chunks"]["IHDR"]["data"]["color_type"] = int.from_bytes(chunk_data_bytes[:1])
-                    chunk_data_bytes = chunk_data_bytes[1:]
-                    out["chunks"]["IHDR"]["data"]["compression_method"] = int.from_bytes(chunk_data_bytes[:1])
-                    chunk_data_bytes = chunk_data_bytes[1:]
-                    out["chunks"]["IHDR"]["data"]["filter_method"] = int.from_bytes(chunk_data_bytes[:1])
-                    chunk_data_bytes = chunk_data_bytes[1:]
-                    out["chunks"]["IHDR"]["data"]["interlace_method"] = int.from_bytes(chunk_data_bytes[:1])
-                    chunk_data_bytes = chunk_data_bytes[1:]
+            overlap = min(row_end, end) - max(row_start, position)
+            row["compressed"] += compressed * overlap / len(piece)
 
-                    if self.log_level > 1: print(out["chunks"]["IHDR"]["data"])
+            if row_end > end: break
 
-                case "PLTE":
-                    chunk_data_bytes = out["chunks"]["PLTE"]["data_bytes"]
+            row_index += 1
+            row_start = row_end
 
-                    out["chunks"]["PLTE"]["data"] = []
+        position = end
 
-                    for i in range(int(len(chunk_data_bytes) / 3)):
-                        data_offset = i * 3
+    with open(file_name, "rb") as f:
+        for offset, length in image_chunks:
+            f.seek(offset + 8)
+            remaining = length
 
-                        r = int.from_bytes(chunk_data_bytes[data_offset:data_offset+1])
-                        g = int.from_bytes(chunk_data_bytes[data_offset+1:data_offset+2])
-                        b = int.from_bytes(chunk_data_bytes[data_offset+2:data_offset+3])
-                        
-                        out["chunks"]["PLTE"]["data"].append([r, g, b, 255])
+            while remaining > 0:
+                block = f.read(min(remaining, 1024 * 1024))
 
-                    if self.log_level > 1: print(out["chunks"]["PLTE"]["data"])
+                if len(block) == 0: break
 
-                case "tRNS":
-                    chunk_data_bytes = out["chunks"]["tRNS"]["data_bytes"]
+                remaining -= len(block)
 
-                    out["chunks"]["tRNS"]["data"] = []
+                for block_offset in range(0, len(block), step):
+                    data = block[block_offset:block_offset + step]
+                    piece = inflater.decompress(data)
 
-                    match out["chunks"]["IHDR"]["data"]["color_type"]:
-                        case PNG._color_type_grayscale:
-                            # Image global alpha
-                            out["chunks"]["tRNS"]["data"].append( int.from_bytes(chunk_data_bytes[data_offset+1:data_offset+2]) )
+                    if deflater: recompressed += len(deflater.compress(piece))
 
-                        case PNG._color_type_truecolor:
-                            # Image global alpha per channel
-                            out["chunks"]["tRNS"]["data"].append( int.from_bytes(chunk_data_bytes[data_offset+1:data_offset+2]) )
+                    attribute(piece, len(data))
 
-                        case PNG._color_type_indexed:
-                            for i, byte in enumerate(chunk_data_bytes):
-                                a = byte
+        piece = inflater.flush()
+        if deflater: recompressed += len(deflater.compress(piece)) + len(deflater.flush())
 
-                                # Set alpha values in the palette                                
-                                out["chunks"]["PLTE"]["data"][i][3] = a
-                                
-                                # Add to chunk data
-                                out["chunks"]["tRNS"]["data"].append( a )
+        attribute(piece, 0)
 
-                    if self.log_level > 1: print(out["chunks"]["tRNS"]["data"])
+    # The compressed bytes after the last output belong to the last row
+    if carried and rows: rows[min(row_index, len(rows) - 1)]["compressed"] += carried
 
-                case "IDAT":
-                    chunk_data_bytes = zlib.decompress( out["chunks"]["IDAT"]["data_bytes"])
+    expected = sum(row["inflated"] for row in rows)
+    compressed = sum(length for _, length in image_chunks)
 
-                    out["chunks"]["IDAT"]["data"] = {
-                        "matrix": [], # The completed color matrix, after applying the filter
-                    }
+    out["image_data"] = {
+        "chunks": len(image_chunks),
+        "compressed": compressed,
+        "inflated": position,
+        "expected": expected,
+        "complete": inflater.eof and position >= expected,
+    }
 
-                    channel_count = self._channels_per_color[out["chunks"]["IHDR"]["data"]["color_type"]]
-                    pixel_size = int(channel_count * (out["chunks"]["IHDR"]["data"]["bit_depth"] / 8))
+    out["filters"] = [0] * len(PNG._filter_names)
+    out["invalid_filters"] = 0
 
-                    for y in range(out["chunks"]["IHDR"]["data"]["height"]):
-                        scanline = []
+    for row in rows:
+        if row["filter"] is not None and row["filter"] < len(PNG._filter_names):
+            out["filters"][row["filter"]] += 1
+        else:
+            out["invalid_filters"] += 1
 
-                        # Save line filter type
-                        data_offset = (y*out["chunks"]["IHDR"]["data"]["width"]) * pixel_size + y
-                        filter_type = int.from_bytes(chunk_data_bytes[data_offset:data_offset + 1])
+    out["rows"] = rows
 
-                        for x in range(out["chunks"]["IHDR"]["data"]["width"]):
-                            data_offset = (y*out["chunks"]["IHDR"]["data"]["width"] + x) * pixel_size + (y + 1) # For filter bytes
+    # The end of the IEND chunk
+    end_offset = next((offset + length + 12 for chunk_type, offset, length in out["chunks"] if chunk_type == "IEND"), out["size"])
 
-                            raw_pixel_data = chunk_data_bytes[data_offset:data_offset + pixel_size]
+    out["wasted"] = {
+        "metadata": sum(length + 12 for chunk_type, _, length in out["chunks"] if chunk_type in ("tEXt", "zTXt", "iTXt", "tIME")),
+        "chunk_overhead": max(len(image_chunks) - 1, 0) * 12,
+        "stream_padding": len(inflater.unused_data) + max(position - expected, 0),
+        "trailing": out["size"] - end_offset,
+        "recompression": max(compressed - recompressed, 0) if recompress else None,
+    }
 
-                            if self.log_level > 1: print(f"Read {pixel_size} bytes ({channel_count}*{int(out["chunks"]["IHDR"]["data"]["bit_depth"]/8)}) on offset {data_offset}: {list(raw_pixel_data)}")
+    out["seconds"] = time.perf_counter() - start
 
-                            """
-                            c b
-                            a x
-                            Where X is the current pixel
-                            """
+    return out
 
-                            a = scanline[x - 1] if x > 0 else [0, 0, 0, 0]
-                            b = out["chunks"]["IDAT"]["data"]["matrix"][y - 1][x] if y > 0 else [0, 0, 0, 0]
-                            c = out["chunks"]["IDAT"]["data"]["matrix"][y - 1][x - 1] if x > 0 and y > 0 else [0, 0, 0, 0]
+def _format_probe(result : dict, show_chunks : bool = False) -> str:
+    """
+    **Description:**
 
-                            pixel_value : list
+    Formats the result of probe, as a few lines of text
+    """
 
-                            # Iterate over each channel in the pixel and apply the filter
-                            if filter_type == 0:
-                                # No filter
-                                """ Recon(x) = Filt(x) """
+    if "error" in result:
+        return f"{result["path"]}: error: {result["error"]}"
 
-                                pixel_value = [raw_pixel_data[channel] for channel in range(channel_count)]
+    details = [
+        f"{result["width"]}x{result["height"]}",
+        f"color type {result["color_type"]}",
+        f"{result["bit_depth"]} bit",
+        f"{result["size"]} bytes",
+    ]
 
-                            if filter_type == 1:
-                                # Sub filter
-                                """ Recon(x) = Filt(x) + Recon(a) """
+    if result["interlace_method"]: details.append("interlaced")
+    if result["frames"] > 1: details.append(f"{result["frames"]} frames")
 
-                                pixel_value = [raw_pixel_data[channel] + a[channel] for channel in range(channel_count)]
+    lines = [f"{result["path"]}: {", ".join(details)}"]
 
-                            if filter_type == 2:
-                                # Up filter
-                                """ Recon(x) = Filt(x) + Recon(b) """
+    if result["time"]:
+        time_data = result["time"]
+        lines.append(f"  time: {time_data["year"]:04}-{time_data["month"]:02}-{time_data["day"]:02} {time_data["hour"]:02}:{time_data["minute"]:02}:{time_data["second"]:02}")
 
-                                pixel_value = [raw_pixel_data[channel] + b[channel] for channel in range(channel_count)]
+    for text in result["text"]:
+        lines.append(f"  {text["type"]} {text["key"]}: {text["value"]}")
 
-                            if filter_type == 3:
-                                # Average filter
-                                """ Recon(x) = Filt(x) + floor((Recon(a) + Recon(b)) / 2) """
+    if show_chunks:
+        for chunk_type, offset, length in result["chunks"]:
+            lines.append(f"  {chunk_type} at {offset}, {length} bytes")
 
-                                pixel_value = [raw_pixel_data[channel] + int((a[channel] + b[channel]) / 2) for channel in range(channel_count)]
+    return "\n".join(lines)
 
-                            if filter_type == 4:
-                                # Paeth filter
-                                """ Recon(x) = Filt(x) + PaethPredictor(Recon(a), Recon(b), Recon(c)) """
+def _main_probe(args : argparse.Namespace) -> None:
+    start = time.perf_counter()
+    count = 0
 
-                                pixel_value = [raw_pixel_data[channel] + self._paeth_predictor(a[channel], b[channel], c[channel]) for channel in range(channel_count)]
+    for path in args.paths:
+        results = probe_tree(path, args.pattern, args.workers) if os.path.isdir(path) else [_safe_probe(path)]
 
-                            # Create RGBA format
-                            match out["chunks"]["IHDR"]["data"]["color_type"]:
-                                case PNG._color_type_grayscale:
-                                    # Convert to grayscale image
-                                    pixel_value += [pixel_value[0], pixel_value[0], 255]
+        for result in results:
+            count += 1
 
-                                case PNG._color_type_truecolor:
-                                    # Add alpha
-                                    pixel_value += [255]
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print(_format_probe(result, args.chunks))
 
-                                case PNG._color_type_indexed:
-                                    # Replace with color from the palette
-                                    pixel_value = out["chunks"]["PLTE"]["data"][pixel_value[0]]
+    elapsed = time.perf_counter() - start
+    print(f"Probed {count} files in {elapsed:.2f}s", file=sys.stderr)
 
-                            scanline.append([c % 256 for c in pixel_value])
+def _parse_batch_operation(spec : str) -> tuple:
+    """
+    **Description:**
 
-                        out["chunks"]["IDAT"]["data"]["matrix"].append(scanline)
-                        if self.log_level > 0: print(f"Reading IDAT chunk: {y+1}/{out["chunks"]["IHDR"]["data"]["height"]}", end="\r")
+    Parses an operation of the batch command, and checks its arguments
 
-                    if self.log_level > 0: print(f"\n")
+    **Operations:**
+    - resize:WIDTHxHEIGHT[:METHOD] (the height can be left out, to keep the aspect ratio)
+    - blur:SIZE, gaussian:SIZE
+    - sharpen, emboss, edges
+    - shader:MODULE:FUNCTION[:ARG,ARG...] (number arguments, a sampler is passed, if the shader has a sampler parameter)
+    - palette[:COLORS]
 
-                case "tEXt":
-                    chunk_data_bytes = out["chunks"]["tEXt"]["data_bytes"]
+    **Returns:**
 
-                    out["chunks"]["tEXt"]["data"] = {
-                        "key": "",
-                        "value": "",
-                    }
+    A tuple: (name : str, arguments : tuple)
+    """
 
-                    destination = "key"
+    name, *parts = spec.split(":")
 
-                    while len(chunk_data_bytes) > 0:
-                        character = chunk_data_bytes[:1]
-                        chunk_data_bytes = chunk_data_bytes[1:]
-                        
-                        if character == b"\00":
-                            destination = "value"
-                            continue
+    try:
+        match name:
+            case "resize":
+                width, _, height = parts[0].partition("x")
+                method = parts[1] if len(parts) > 1 else "box"
 
-                        out["chunks"]["tEXt"]["data"][destination] += str(character, encoding="ascii")
-                
-                case "zTXt":
-                    chunk_data_bytes = out["chunks"]["zTXt"]["data_bytes"]
+                if method not in PNG._resize_methods:
+                    raise ValueError(f"Invalid resize method: '{method}', must be one of: {", ".join(PNG._resize_methods)}")
 
-                    out["chunks"]["zTXt"]["data"] = {
-                        "key": bytearray(),
-                        "value": bytearray(),
-                    }
+                return name, (int(width), int(height) if height else None, method)
 
-                    destination = "key"
+            case "blur" | "gaussian":
+                return name, (int(parts[0]),)
 
-                    while len(chunk_data_bytes) > 0:
-                        character = chunk_data_bytes[:1]
-                        chunk_data_bytes = chunk_data_bytes[1:]
-                        
-                        if character == b"\x00":
-                            destination = "value"
-                        
-                            compression_method = int.from_bytes(chunk_data_bytes[:1])
-                            chunk_data_bytes = chunk_data_bytes[1:]
-                        
-                            out["chunks"]["zTXt"]["data"]["compression_method"] = compression_method
+            case "sharpen" | "emboss" | "edges":
+                return name, ()
 
-                            continue
+            case "shader":
+                arguments = tuple(float(value) for value in parts[2].split(",")) if len(parts) > 2 and parts[2] else ()
+                return name, (parts[0], parts[1], arguments)
 
-                        out["chunks"]["zTXt"]["data"][destination] += character
+            case "palette":
+                return name, (int(parts[0]) if parts else 256,)
 
-                    # Decode key and value
-                    out["chunks"]["zTXt"]["data"]["key"] = out["chunks"]["zTXt"]["data"]["key"].decode('ISO-8859-1')
-                    #out["chunks"]["zTXt"]["data"]["value"] = zlib.decompress(out["chunks"]["zTXt"]["data"]["value"], wbits=8).decode('ISO-8859-1')
+    except (IndexError, ValueError) as e:
+        raise ValueError(f"Invalid operation: '{spec}' ({e})")
 
-                case "tIME":
-                    chunk_data_bytes = out["chunks"]["tIME"]["data_bytes"]
+    raise ValueError(f"Unknown operation: '{spec}'")
 
-                    out["chunks"]["tIME"]["data"]["year"] = int.from_bytes(chunk_data_bytes[:2])
-                    chunk_data_bytes = chunk_data_bytes[2:]
+def _batch_transform(file_data : bytes, operations : list) -> tuple:
+    """
+    **Description:**
 
-                    out["chunks"]["tIME"]["data"]["month"] = int.from_bytes(chunk_data_bytes[:1])
-                    chunk_data_bytes = chunk_data_bytes[1:]
+    Decodes an image, applies the operations, and serializes the pixels. Runs in the process pool of the batch command.
 
-                    out["chunks"]["tIME"]["data"]["day"] = int.from_bytes(chunk_data_bytes[:1])
-                    chunk_data_bytes = chunk_data_bytes[1:]
+    **Returns:**
 
-                    out["chunks"]["tIME"]["data"]["hour"] = int.from_bytes(chunk_data_bytes[:1])
-                    chunk_data_bytes = chunk_data_bytes[1:]
+    A tuple: (start of the file : bytearray, uncompressed image data : bytearray)
+    """
 
-                    out["chunks"]["tIME"]["data"]["minute"] = int.from_bytes(chunk_data_bytes[:1])
-                    chunk_data_bytes = chunk_data_bytes[1:]
+    image = PNG(file_data, flags=PNG_READ | PNG_INPUT_BYTES)
 
-                    out["chunks"]["tIME"]["data"]["second"] = int.from_bytes(chunk_data_bytes[:1])
-                    chunk_data_bytes = chunk_data_bytes[1:]
+    for name, arguments in operations:
+        match name:
+            case "resize":
+                width, height, method = arguments
 
-                case "IEND":
-                    out["chunks"]["IEND"]["data"] = None
+                if height is None:
+                    height = max(1, round(image.image_meta["height"] * width / image.image_meta["width"]))
 
-        # Get necessary data from the chunks, and format it nicely
-        # Default values
-        formatted = {
-            "width": 0,
-            "height": 0,
-            "bit_depth": 8,
-            "color_type": 6,
-            "interlace_method": 0,
-            "palette": [],
-            "text": {},
-            "time": {},
-        }
+                image.resize(width, height, method)
 
-        # Set values if corresponding chunk was found
-        if "IHDR" in out["chunks"]:
-            formatted["width"] = out["chunks"]["IHDR"]["data"]["width"]
-            formatted["height"] = out["chunks"]["IHDR"]["data"]["height"]
-            formatted["bit_depth"] = out["chunks"]["IHDR"]["data"]["bit_depth"]
-            formatted["color_type"] = out["chunks"]["IHDR"]["data"]["color_type"]
-            formatted["interlace_method"] = out["chunks"]["IHDR"]["data"]["interlace_method"]
+            case "blur":
+                image.convolve(box_kernel(arguments[0]))
 
-        if "tIME" in out["chunks"]:
-            formatted["time"] = out["chunks"]["tIME"]["data"]
+            case "gaussian":
+                image.convolve(gaussian_kernel(arguments[0]))
 
-        if "PLTE" in out["chunks"]:
-            formatted["palette"] = out["chunks"]["PLTE"]["data"]
+            case "sharpen":
+                image.convolve(KERNEL_SHARPEN)
 
-        if "tEXt" in out["chunks"]:
-            formatted["text"] = out["chunks"]["tEXt"]["data"]
-            formatted["text"]["value"] = out["chunks"]["tEXt"]["data"]["key"] + ": " + out["chunks"]["tEXt"]["data"]["value"]
+            case "emboss":
+                image.convolve(KERNEL_EMBOSS)
 
-        return formatted, out
+            case "edges":
+                image.edge_detect()
 
+            case "shader":
+                module_name, function_name, shader_args = arguments
+                callback = getattr(importlib.import_module(module_name), function_name)
 
-    def _generate_crc(self, data : bytearray) -> int:
-        crc = 0xFFFFFFFF
-        poly = 0xEDB88320
+                image.shader(callback, list(shader_args), sampler = "sampler" in inspect.signature(callback).parameters)
 
-        for byte in data:
-            crc = crc ^ byte
+            case "palette":
+                image.to_palette(arguments[0])
 
-            for _ in range(8):
-                if crc & 1:
-                    crc = (crc >> 1) ^ poly
-                else:
-                    crc = crc >> 1
+    use_palette = bool(image.flags & PNG_COLOR_PALETTE)
 
-        return crc ^ 0xFFFFFFFF
+    if use_palette:
+        return image._generate_head(True), image._generate_scanlines_palette(image.image_data)
 
-    def _generate_chunk_IHDR(self) -> bytearray:
-        if self.log_level > 0: print("Generating IHDR chunk...")
+    return image._generate_head(False), image._generate_scanlines_rgb(image.image_data)
 
-        out = bytearray()
+def _start_stage(function : callable, in_queue : queue.Queue, out_queue : queue.Queue, workers : int) -> list:
+    """
+    **Description:**
 
-        chunk_data = {
-            "width": self.image_meta["width"],
-            "height": self.image_meta["height"],
-            "bit_depth": 8, # 8 bit color depth
-            "color_type": 6, # 3: Palette, 6: True color with alpha
-            "compression_method": 0, # Deflate compression
-            "filter_method": 0, # No filter
-            "interlace_method": 0, # No interlacing
-        }
+    Starts the threads of a pipeline stage. Every thread takes items from the input queue, and puts the result of the function into the output queue.
+    None marks the end of the items, it is passed on, when every thread of the stage stopped.
+    Items with an error are passed on, without calling the function.
+    """
 
-        if self.flags & PNG_COLOR_PALETTE:
-            chunk_data["color_type"] = 3
+    remaining = [workers]
+    lock = threading.Lock()
 
-        chunk_data_bytes = bytearray([0x49, 0x48, 0x44, 0x52]) # Chunk name IHDR
-        chunk_data_bytes += bytearray(chunk_data['width'].to_bytes(4, 'big')) 
-        chunk_data_bytes += bytearray(chunk_data['height'].to_bytes(4, 'big')) 
-        chunk_data_bytes += bytearray(chunk_data['bit_depth'].to_bytes(1, 'big')) 
-        chunk_data_bytes += bytearray(chunk_data['color_type'].to_bytes(1, 'big')) 
-        chunk_data_bytes += bytearray(chunk_data['compression_method'].to_bytes(1, 'big')) 
-        chunk_data_bytes += bytearray(chunk_data['filter_method'].to_bytes(1, 'big')) 
-        chunk_data_bytes += bytearray(chunk_data['interlace_method'].to_bytes(1, 'big')) 
+    def work() -> None:
+        while True:
+            item = in_queue.get()
 
-        chunk_crc = self._generate_crc(chunk_data_bytes)
+            if item is None:
+                # Stop the other threads of the stage too
+                in_queue.put(None)
 
-        chunk_size = len(chunk_data_bytes) - 4 # Not counting the chunk name (4 bytes)
+                with lock:
+                    remaining[0] -= 1
+                    if remaining[0] == 0: out_queue.put(None)
 
-        out += chunk_size.to_bytes(4, 'big')
-        out += chunk_data_bytes
-        out += chunk_crc.to_bytes(4, 'big')
+                return
 
-        return out
+            if item["error"] is None:
+                try:
+                    function(item)
+                except Exception as e:
+                    item["error"] = f"{type(e).__name__}: {e}"
 
-    def _generate_chunk_PLTE(self, palette : list) -> bytearray:
-        if self.log_level > 0: print("Generating PLTE chunk...")
+                    # Drop the buffers of the failed item
+                    for key in ("data", "head", "raw"): item.pop(key, None)
 
-        out = bytearray()
+            out_queue.put(item)
 
-        chunk_data_bytes = bytearray([0x50, 0x4c, 0x54, 0x45]) # Chunk name PLTE
+    threads = [threading.Thread(target=work, daemon=True) for _ in range(workers)]
 
-        for color in palette:
-            chunk_data_bytes += bytearray(color[0].to_bytes(1, 'big'))
-            chunk_data_bytes += bytearray(color[1].to_bytes(1, 'big'))
-            chunk_data_bytes += bytearray(color[2].to_bytes(1, 'big'))
+    for thread in threads: thread.start()
 
-        chunk_crc = self._generate_crc(chunk_data_bytes)
+    return threads
 
-        chunk_size = len(chunk_data_bytes) - 4 # Not counting the chunk name (4 bytes)
+def batch_convert(file_names : list, output_folder : str, operations : list, jobs : int|None = None, threads : int = 4, queue_size : int = 8, verbose : bool = True, in_place : bool = False) -> dict:
+    """
+    **Description:**
 
-        out += chunk_size.to_bytes(4, 'big')
-        out += chunk_data_bytes
-        out += chunk_crc.to_bytes(4, 'big')
+    Converts many images, with a pipeline of stages, that run at the same time, connected by bounded queues:
+    - read: Reads the files (thread pool)
+    - decode & transform: Decodes the images, applies the operations, and serializes the pixels (process pool, this is the pure Python part)
+    - encode: Compresses the image data, and builds the chunks (thread pool, zlib runs without holding the GIL)
+    - write: Writes the output files (thread pool)
 
-        return out
+    Only queue_size images wait between two stages, so the memory use does not depend on the number of files.
 
-    def _generate_chunk_tRNS(self, palette : list) -> bytearray:
-        if self.log_level > 0: print("Generating tRNS chunk...")
+    **Parameters:**
+    - file_names(list) The input files
+    - output_folder(str) The folder of the outputs, files are written with the same path, relative to the common folder of the inputs
+    - operations(list) The operations (see _parse_batch_operation) applied to every image, in order
+    - jobs(int) The number of processes (**default**: the number of CPU cores)
+    - threads(int) The number of threads in the read, encode, and write stages
+    - queue_size(int) The maximum number of images waiting between two stages
+    - verbose(bool) Print a line for every finished image
+    - in_place(bool) Allow replacing the input files with the outputs, otherwise an output path, that is an input file, raises a ValueError
 
-        out = bytearray()
+    **Returns:**
 
-        chunk_data_bytes = bytearray([0x74, 0x52, 0x4e, 0x53]) # Chunk name PLTE
+    A dictionary: {"converted": int, "failed": int, "seconds": float, "images_per_second": float}
+    """
 
-        if self.flags & PNG_COLOR_PALETTE:
-            for color in palette:
-                chunk_data_bytes += bytearray(color[3].to_bytes(1, 'big'))
+    if jobs is None: jobs = os.cpu_count() or 1
 
-        chunk_crc = self._generate_crc(chunk_data_bytes)
+    # Inputs with the same name, in different folders (found by a recursive pattern), are kept apart by their folders
+    paths = [os.path.abspath(file_name) for file_name in file_names]
+    root = os.path.commonpath([os.path.dirname(path) for path in paths]) if paths else ""
+    output_names = [os.path.join(output_folder, os.path.relpath(path, root)) for path in paths]
 
-        chunk_size = len(chunk_data_bytes) - 4 # Not counting the chunk name (4 bytes)
+    if len(set(output_names)) != len(output_names):
+        duplicate = next(name for name in output_names if output_names.count(name) > 1)
+        raise ValueError(f"More than one input would be written to: {duplicate}!")
 
-        out += chunk_size.to_bytes(4, 'big')
-        out += chunk_data_bytes
-        out += chunk_crc.to_bytes(4, 'big')
+    if not in_place:
+        for path, output_name in zip(paths, output_names):
+            if os.path.abspath(output_name) == path or (os.path.exists(output_name) and os.path.samefile(output_name, path)):
+                raise ValueError(f"The output would replace the input: {path}! (Use in_place to allow it)")
 
-        return out
+    os.makedirs(output_folder, exist_ok=True)
 
-    def _generate_chunk_IDAT_rgb(self, rgb_2d_matrix : list) -> bytearray:
-        if self.log_level > 0: print("Generating (rgba) IDAT chunk...")
+    start = time.perf_counter()
 
-        out = bytearray()
+    queues = [queue.Queue(queue_size) for _ in range(5)]
+    pool = concurrent.futures.ProcessPoolExecutor(jobs)
 
-        chunk_data_bytes = bytearray([0x49, 0x44, 0x41, 0x54]) # Chunk name IDAT
+    def read(item : dict) -> None:
+        item["start"] = time.perf_counter()
 
-        pixel_data = bytearray()
+        with open(item["path"], "rb") as f:
+            item["data"] = f.read()
 
-        for line in rgb_2d_matrix:
-            pixel_data += bytearray([0x00]) # Scanline filtering method
-        
-            for r, g, b, a in line:
-                pixel_data += bytearray(r.to_bytes(1, 'big'))
-                pixel_data += bytearray(g.to_bytes(1, 'big'))
-                pixel_data += bytearray(b.to_bytes(1, 'big'))
-                pixel_data += bytearray(a.to_bytes(1, 'big'))
+    def transform(item : dict) -> None:
+        # Every thread of this stage waits for one process, so at most `jobs` images are in the pool
+        item["head"], item["raw"] = pool.submit(_batch_transform, item.pop("data"), operations).result()
 
-        chunk_data_bytes += bytearray(zlib.compress(pixel_data))
+    def encode(item : dict) -> None:
+        data = item.pop("head")
+        data += _generate_chunk(b"IDAT", zlib.compress(item.pop("raw")))
+        data += _generate_chunk(b"IEND", b"")
 
-        chunk_crc = self._generate_crc(chunk_data_bytes)
+        item["data"] = data
 
-        chunk_size = len(chunk_data_bytes) - 4 # Not counting the chunk name (4 bytes)
+    def write(item : dict) -> None:
+        os.makedirs(os.path.dirname(item["output"]), exist_ok=True)
 
-        out += chunk_size.to_bytes(4, 'big')
-        out += chunk_data_bytes
-        out += chunk_crc.to_bytes(4, 'big')
+        with open(item["output"], "wb") as f:
+            f.write(item.pop("data"))
 
-        return out
+    def feed() -> None:
+        for file_name, output_name in zip(file_names, output_names):
+            queues[0].put({
+                "path": file_name,
+                "output": output_name,
+                "error": None,
+            })
 
-    def _generate_chunk_IDAT_palette(self, palette_2d_matrix : list) -> bytearray:
-        if self.log_level > 0: print("Generating (palette) IDAT chunk...")
+        queues[0].put(None)
 
-        out = bytearray()
+    threading.Thread(target=feed, daemon=True).start()
 
-        chunk_data_bytes = bytearray([0x49, 0x44, 0x41, 0x54]) # Chunk name IDAT
+    _start_stage(read, queues[0], queues[1], threads)
+    _start_stage(transform, queues[1], queues[2], jobs)
+    _start_stage(encode, queues[2], queues[3], threads)
+    _start_stage(write, queues[3], queues[4], threads)
 
-        pixel_data = bytearray()
+    converted = 0
+    failed = 0
 
-        for line in palette_2d_matrix:
-            pixel_data += bytearray([0x00]) # Scanline filtering method
-        
-            for index in line:
-                pixel_data += bytearray(index.to_bytes(1, 'big'))
+    try:
+        while True:
+            item = queues[4].get()
 
-        chunk_data_bytes += bytearray(zlib.compress(pixel_data))
+            if item is None: break
 
-        chunk_crc = self._generate_crc(chunk_data_bytes)
+            elapsed = (time.perf_counter() - item["start"]) * 1000 if "start" in item else 0
 
-        chunk_size = len(chunk_data_bytes) - 4 # Not counting the chunk name (4 bytes)
+            if item["error"] is None:
+                converted += 1
+                if verbose: print(f"[{converted + failed}/{len(file_names)}] {item["path"]} -> {item["output"]} ({elapsed:.0f}ms)")
+            else:
+                failed += 1
+                if verbose: print(f"[{converted + failed}/{len(file_names)}] {item["path"]}: error: {item["error"]}", file=sys.stderr)
 
-        out += chunk_size.to_bytes(4, 'big')
-        out += chunk_data_bytes
-        out += chunk_crc.to_bytes(4, 'big')
+    finally:
+        pool.shutdown(cancel_futures=True)
 
-        return out
+    seconds = time.perf_counter() - start
 
+    return {
+        "converted": converted,
+        "failed": failed,
+        "seconds": seconds,
+        "images_per_second": (converted / seconds) if seconds > 0 else 0,
+    }
 
-    def _generate_chunk_IEND(self) -> bytearray:
-        if self.log_level > 0: print("Generating IEND chunk...")
+def _main_batch(args : argparse.Namespace) -> None:
+    operations = [_parse_batch_operation(spec) for spec in args.operations]
 
-        out = bytearray() # Size of the chunk
+    file_names = []
 
-        chunk_data_bytes = bytearray([0x49, 0x45, 0x4E, 0x44]) # Chunk name IEND
+    for pattern in args.inputs:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        file_names += [name for name in matches if os.path.isfile(name)]
 
-        chunk_size = len(chunk_data_bytes) - 4 # Not counting the chunk name (4 bytes)
+    # A file matching more than one pattern is converted once
+    file_names = list({os.path.abspath(name): name for name in file_names}.values())
 
-        chunk_crc = self._generate_crc(chunk_data_bytes)
+    if len(file_names) == 0:
+        print("No input files found", file=sys.stderr)
+        sys.exit(1)
 
-        out += chunk_size.to_bytes(4, 'big')
-        out += chunk_data_bytes
-        out += chunk_crc.to_bytes(4, 'big')
+    try:
+        result = batch_convert(file_names, args.output, operations, args.jobs, args.threads, args.queue_size, not args.quiet, args.in_place)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
 
-        return out
+    print(f"Converted {result["converted"]} images ({result["failed"]} failed) in {result["seconds"]:.2f}s, {result["images_per_second"]:.2f} images/s")
 
-    def _generate_image(self, use_palette : bool|None = None) -> bytearray:
-        """
-        ** Description: **
+    if result["failed"] > 0: sys.exit(1)
 
-        Generates a PNG image, and returns with a bytearray
+def _main_meta(args : argparse.Namespace) -> None:
+    text = {}
 
-        **Parameters:**
+    for entry in args.set:
+        key, separator, value = entry.partition("=")
 
-        - use_palette(bool) Decides whenever to use paletted image generation or regular RGBA
-        """
+        if not separator:
+            print(f"Invalid text entry: '{entry}', must be KEY=VALUE", file=sys.stderr)
+            sys.exit(1)
 
-        if self.log_level > 0: print("Stated generation...")
+        text[key] = value
 
-        # Set default value for paletted generation
-        if use_palette == None: use_palette = self.flags & PNG_COLOR_PALETTE
+    for key in args.remove: text[key] = None
 
-        # The magic header for every PNG
-        out = bytearray([0x89, 0x50, 0x4E, 0x47, 0x0D, 0x0A, 0x1A, 0x0A])
+    modification_time = {"now": True, "remove": False, "keep": None}[args.time]
 
-        out += self._generate_chunk_IHDR()
+    edit_metadata(args.file, args.output, text, args.compress, modification_time)
 
-        if use_palette:
-            out += self._generate_chunk_PLTE(self.palette)
-            out += self._generate_chunk_tRNS(self.palette)
-            out += self._generate_chunk_IDAT_palette(self.image_data)
-        else:
-            out += self._generate_chunk_IDAT_rgb(self.image_data)
-        
-        out += self._generate_chunk_IEND()
+    print(_format_probe(probe(args.output or args.file)))
 
-        if self.log_level > 0: print("End generation...")
+def main(arguments : list|None = None) -> None:
+    """
+    **Description:**
+
+    The command line interface of the module (python -m png ...)
+    """
+
+    parser = argparse.ArgumentParser(prog="python -m png")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    probe_parser = commands.add_parser("probe", help="Print the metadata of PNG files, without reading the image data")
+    probe_parser.add_argument("paths", nargs="+", help="Files, or folders to scan recursively")
+    probe_parser.add_argument("--pattern", type=str, default="*.png", help="File name pattern, used in folders")
+    probe_parser.add_argument("--workers", type=int, default=8, help="Number of threads scanning folders")
+    probe_parser.add_argument("--json", action="store_true", help="Print one JSON object per file")
+    probe_parser.add_argument("--chunks", action="store_true", help="List the chunks of every file")
+    probe_parser.set_defaults(handler=_main_probe)
+
+    meta_parser = commands.add_parser("meta", help="Change the text and time metadata of a file, without re-encoding the image")
+    meta_parser.add_argument("file", help="The PNG file")
+    meta_parser.add_argument("--output", "-o", type=str, default=None, help="Write the result into this file, instead of changing the file in place")
+    meta_parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="Add or replace a text entry (can be repeated)")
+    meta_parser.add_argument("--remove", action="append", default=[], metavar="KEY", help="Remove the text entries with the key (can be repeated)")
+    meta_parser.add_argument("--compress", action="store_true", help="Store the new text entries compressed")
+    meta_parser.add_argument("--time", choices=["keep", "now", "remove"], default="keep", help="Set the modification time to the current time, or remove it")
+    meta_parser.set_defaults(handler=_main_meta)
+
+    batch_parser = commands.add_parser("batch", help="Apply operations to many images, and write the results into a folder")
+    batch_parser.add_argument("inputs", nargs="+", help="Input files, or glob patterns (** matches folders recursively)")
+    batch_parser.add_argument("--output", "-o", type=str, required=True, help="Output folder, the files keep their paths, relative to the common folder of the inputs")
+    batch_parser.add_argument("--op", dest="operations", action="append", default=[], help=(
+        "Operation, applied in the given order (can be repeated): resize:WIDTHxHEIGHT[:box|bilinear|nearest], resize:WIDTH, "
+        "blur:SIZE, gaussian:SIZE, sharpen, emboss, edges, shader:MODULE:FUNCTION[:ARG,...], palette[:COLORS]"
+    ))
+    batch_parser.add_argument("--jobs", type=int, default=None, help="Number of processes for the pixel work (default: number of CPU cores)")
+    batch_parser.add_argument("--threads", type=int, default=4, help="Number of threads for reading, compressing and writing")
+    batch_parser.add_argument("--queue-size", type=int, default=8, help="Maximum number of images waiting between two stages")
+    batch_parser.add_argument("--quiet", action="store_true", help="Only print the summary")
+    batch_parser.add_argument("--in-place", action="store_true", help="Allow replacing the input files, when the output folder is their folder")
+    batch_parser.set_defaults(handler=_main_batch)
+
+    args = parser.parse_args(arguments)
+    args.handler(args)
 
-        return out
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Tests of the png module
+
+Usage:
+python -m unittest png_test
+"""
+
+import os
+import glob
+import zlib
+import struct
+import shutil
+import tempfile
+import unittest
+
+from png import *
+
+class EditMetadataTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.folder, "dice.png")
+        shutil.copy(os.path.join("test_images", "dice.png"), self.file_name)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.folder)
+
+    def test_keeps_permissions(self) -> None:
+        os.chmod(self.file_name, 0o644)
+
+        edit_metadata(self.file_name, text={"Title": "Dice"})
+
+        self.assertEqual(os.stat(self.file_name).st_mode & 0o777, 0o644)
+
+# The test images, that are fast to decode
+SMALL_IMAGES = sorted(path for path in glob.glob(os.path.join("test_images", "*.png")) if os.path.getsize(path) < 1024 * 1024)
+
+def _image_data(data : bytes) -> bytes:
+    """
+    **Description:**
+
+    Returns with the joined data of the IDAT chunks of a PNG file
+    """
+
+    offset = 8
+    out = bytearray()
+
+    while offset < len(data):
+        length = int.from_bytes(data[offset:offset + 4])
+
+        if data[offset + 4:offset + 8] == b"IDAT": out += data[offset + 8:offset + 8 + length]
+
+        offset += length + 12
+
+    return bytes(out)
+
+class PassThroughTest(unittest.TestCase):
+    def test_set_text(self) -> None:
+        file_name = os.path.join("test_images", "dice.png")
+
+        with open(file_name, "rb") as f:
+            expected = _image_data(f.read())
+
+        image = PNG(file_name, flags=PNG_READ)
+        image.set_text("Title", "Dice")
+
+        data = image.get_bytes()
+
+        self.assertEqual(_image_data(data), expected)
+        self.assertIn(b"tEXtTitle\x00Dice", data)
+
+    def test_set_palette(self) -> None:
+        for file_name in (os.path.join("test_images", "logo.png"), os.path.join("test_images", "tank.png")):
+            with self.subTest(file_name=file_name):
+                with open(file_name, "rb") as f:
+                    expected = _image_data(f.read())
+
+                image = PNG(file_name, flags=PNG_READ)
+                image.set_palette([(255 - r, 255 - g, 255 - b, a) for r, g, b, a in image.palette])
+
+                data = image.get_bytes()
+
+                self.assertEqual(_image_data(data), expected)
+                self.assertEqual(PNG(data, flags=PNG_READ | PNG_INPUT_BYTES).image_data, image.image_data)
+
+class MemoryBudgetTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.mkdtemp()
+
+        # Tiny blocks, so every image is split into many
+        self.block_size = PNG._stream_block_size
+        PNG._stream_block_size = 7
+
+    def tearDown(self) -> None:
+        PNG._stream_block_size = self.block_size
+        set_memory_budget(None)
+        shutil.rmtree(self.folder)
+
+    def test_streaming_read(self) -> None:
+        for file_name in SMALL_IMAGES:
+            with self.subTest(file_name=file_name):
+                expected = PNG(file_name, flags=PNG_READ)
+
+                image = PNG([[[0, 0, 0, 0]]])
+                image.flags = PNG_READ
+                image._read_streaming(file_name)
+
+                self.assertEqual(image.image_meta, expected.image_meta)
+                self.assertEqual(image.image_data, expected.image_data)
+                self.assertEqual(image.palette, expected.palette)
+
+    def test_streaming_write(self) -> None:
+        for file_name in SMALL_IMAGES:
+            with self.subTest(file_name=file_name):
+                image = PNG(file_name, flags=PNG_READ)
+                image.set_text("Title", "Streamed")
+
+                output = os.path.join(self.folder, os.path.basename(file_name))
+                image._write_streaming(output)
+
+                with open(output, "rb") as f:
+                    data = f.read()
+
+                self.assertEqual(PNG(data, flags=PNG_READ | PNG_INPUT_BYTES).image_data, image.image_data)
+                self.assertIn(b"tEXtTitle\x00Streamed", data)
+
+    def test_over_budget(self) -> None:
+        file_name = os.path.join("test_images", "dice.png")
+        image = PNG(file_name, flags=PNG_READ)
+
+        set_memory_budget(0)
+
+        with self.assertRaises(MemoryError):
+            PNG(file_name, flags=PNG_READ)
+
+        # Changed pixels have to be encoded again
+        image.shader(lambda uv, pos, color: color)
+
+        with self.assertRaises(MemoryError):
+            image.write(os.path.join(self.folder, "dice.png"))
+
+        self.assertFalse(os.path.exists(os.path.join(self.folder, "dice.png")))
+
+def _chunk(chunk_type : bytes, data : bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+def _write_apng(file_name : str, width : int, height : int, frames : list) -> None:
+    """
+    **Description:**
+
+    Writes an RGBA animation, the frames are (x, y, width, height, dispose, blend, pixels) tuples, the pixels are a flat list of RGBA values
+    """
+
+    data = bytearray(bytes([0x89, 0x50, 0x4E, 0x47, 0x0D, 0x0A, 0x1A, 0x0A]))
+    data += _chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+    data += _chunk(b"acTL", struct.pack(">II", len(frames), 0))
+
+    sequence = 0
+
+    for index, (x, y, frame_width, frame_height, dispose, blend, pixels) in enumerate(frames):
+        data += _chunk(b"fcTL", struct.pack(">IIIIIHHBB", sequence, frame_width, frame_height, x, y, 1, 10, dispose, blend))
+        sequence += 1
+
+        stride = frame_width * 4
+        image_data = zlib.compress(b"".join(b"\x00" + bytes(pixels[row * stride:(row + 1) * stride]) for row in range(frame_height)))
+
+        if index == 0:
+            data += _chunk(b"IDAT", image_data)
+        else:
+            data += _chunk(b"fdAT", struct.pack(">I", sequence) + image_data)
+            sequence += 1
+
+    data += _chunk(b"IEND", b"")
+
+    with open(file_name, "wb") as f:
+        f.write(data)
+
+class APNGReaderTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.folder)
+
+    def test_seek_back_over_dispose_previous(self) -> None:
+        red, green, blue, white = [255, 0, 0, 255], [0, 255, 0, 255], [0, 0, 255, 255], [255, 255, 255, 255]
+        file_name = os.path.join(self.folder, "animation.png")
+
+        # The second frame covers the canvas, but it is disposed to the first frame
+        _write_apng(file_name, 2, 1, [
+            (0, 0, 2, 1, 0, 0, red * 2),
+            (0, 0, 2, 1, 2, 0, green * 2),
+            (0, 0, 1, 1, 0, 0, blue),
+            (0, 0, 2, 1, 0, 0, white * 2),
+        ])
+
+        with APNGReader(file_name) as reader:
+            expected = [pixel[:] for pixel in reader.get_frame(2).image_data[0]]
+
+            reader.get_frame(3)
+
+            self.assertEqual(reader.get_frame(2).image_data[0], expected)
+            self.assertEqual(expected, [blue, red])
+
+if __name__ == "__main__":
+    unittest.main()
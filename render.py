@@ -18,9 +18,16 @@ parser = argparse.ArgumentParser()
 # Add the filename argument
 parser.add_argument('filename', type=str, help='File to open and manipulate')
 parser.add_argument('filename2', type=str, help='2nd file to open and manipulate')
-
-# Parse the arguments
-args = parser.parse_args()
+parser.add_argument('--frames', type=int, default=1, help='Number of frames to render')
+parser.add_argument('--whirlpool', action='store_true', help='Animate the frames with the whirlpool shader')
+parser.add_argument('--live', action='store_true', help='Show the frames in the terminal while rendering (with one job, late frames are not drawn if rendering falls behind)')
+parser.add_argument('--cache', type=str, default=None, help='Folder to cache the results of the passes, that are the same in every frame and every run')
+parser.add_argument('--cache-size', type=int, default=256, help='Maximum size of the cache folder, in megabytes')
+parser.add_argument('--jobs', type=int, default=None, help='Number of processes rendering frames in parallel (default: number of CPU cores)')
+parser.add_argument('--fps', type=float, default=24, help='Frame rate of the live preview and the raw video')
+parser.add_argument('--sink', type=str, default=None, help='Stream the frames as raw video to this file ("-" for stdout) instead of writing PNG files')
+parser.add_argument('--apng', type=str, default=None, help='Write the frames into this animated PNG file instead of separate PNG files')
+parser.add_argument('--sink-format', type=str, default="y4m", choices=FrameSink._formats, help='Format of the raw video')
 
 """
 Shader utility functions
@@ -101,19 +108,14 @@ def alpha_edge_shader(uv, pos, color : tuple, *args) -> tuple:
 
     return out_color
 
-def blur_shader(uv, pos, color : tuple, blur_size) -> tuple:
-    global color_matrix, image_meta
-
+def blur_shader(uv, pos, color : tuple, blur_size, sampler : Sampler) -> tuple:
     BOX_SIZE = blur_size
 
     color_sum = [0, 0, 0, 0]
 
     for y in range(int(-BOX_SIZE / 2), int(BOX_SIZE / 2 + 0.5), 1):
         for x in range(int(-BOX_SIZE / 2), int(BOX_SIZE / 2 + 0.5), 1):
-            pos_x = wrap(pos[0] + x, 0, image_meta["width"])
-            pos_y = wrap(pos[1] + y, 0, image_meta["height"])
-
-            pixel = color_matrix[pos_y][pos_x]
+            pixel = sampler.fetch(pos[0] + x, pos[1] + y)
 
             for channel in range(4):
                 color_sum[channel] += pixel[channel]
@@ -156,23 +158,25 @@ def uv_shader(uv, pos, color : tuple) -> tuple:
         255
     ]
 
-def uv_warp_shader(uv, pos, color : tuple, offset) -> tuple:
-    global color_matrix, image_meta
-    
+def uv_warp_shader(uv, pos, color : tuple, offset, sampler : Sampler) -> tuple:
     uv_x = uv[0] + math.sin((pos[0] + offset) * math.pi / 180 * 3)
     uv_y = uv[1] + math.sin((pos[0] + pos[1]) * math.pi / 180 * 5)
 
     uv_x = uv_x * 5
     uv_y = uv_y * 5
 
-    pos_x = wrap( int(pos[0] + uv_x), 0, image_meta["width"] )
-    pos_y = wrap( int(pos[1] + uv_y), 0, image_meta["height"] )
+    return sampler.fetch( int(pos[0] + uv_x), int(pos[1] + uv_y) )
 
-    return color_matrix[pos_y][pos_x]
+def uv_whirlpool_invariants(uv, pos) -> tuple:
+    """
+    The base angle, and the vertical part of the distance from the center.
+    The center only moves horizontally, so these do not depend on the time.
+    """
 
-def uv_whirlpool_shader(uv, pos, color : tuple, time) -> tuple:
-    global color_matrix, image_meta
-    
+    return (math.atan2(uv[0], uv[1]), (uv[1] - 0.5) ** 2)
+
+@shader_invariants(uv_whirlpool_invariants)
+def uv_whirlpool_shader(uv, pos, color : tuple, time, sampler : Sampler, invariants : tuple) -> tuple:
     RADIUS = 0.75
     RING_AMOUNT = 2
     DEPTH_AMOUNT = 0.25
@@ -180,7 +184,10 @@ def uv_whirlpool_shader(uv, pos, color : tuple, time) -> tuple:
     CENTER = (0.5 + math.sin(time) * 0.25, 0.5)
     #CENTER = (0.5, 0.5)
 
-    dist = distance(uv, CENTER)
+    base_angle, dist_y_squared = invariants
+
+    dist_x = uv[0] - CENTER[0]
+    dist = math.sqrt(dist_x * dist_x + dist_y_squared)
 
     if dist < RADIUS:
         # Calculate angle and new distance
@@ -188,7 +195,7 @@ def uv_whirlpool_shader(uv, pos, color : tuple, time) -> tuple:
         #newDist = dist * (1.0 - (dist / RADIUS))
 
         new_dist = (RADIUS - dist) * DEPTH_AMOUNT
-        angle = math.atan2(uv[0], uv[1]) + (RADIUS - dist) * RING_AMOUNT * (RADIUS - dist) - time * SPEED
+        angle = base_angle + (RADIUS - dist) * RING_AMOUNT * (RADIUS - dist) - time * SPEED
 
         # Calculate new UV coordinates
         uv_x = CENTER[0] + math.cos(angle) * new_dist
@@ -205,10 +212,7 @@ def uv_whirlpool_shader(uv, pos, color : tuple, time) -> tuple:
         #     255
         # ]
 
-        pos_x = wrap( int(uv_x * image_meta["width"]), 0, image_meta["width"] )
-        pos_y = wrap( int(uv_y * image_meta["height"]), 0, image_meta["height"] )
-
-        return color_matrix[pos_y][pos_x]
+        return sampler.sample(uv_x, uv_y)
 
     # return [
     #     clamp(mix(0, 255, uv[0]), 0, 255),
@@ -236,22 +240,20 @@ def band_diff_shader(uv, pos, color : tuple) -> tuple:
         color[3] - band(color[3], 8),
     ]
 
-def mask_shader(uv, pos, color : tuple, mask_matrix : list, mask_meta : dict) -> tuple:
+def mask_shader(uv, pos, color : tuple, mask : Sampler) -> tuple:
     """
     **Description:**
 
     Multiplies the original image with the mask
     
     ** Parameters:**
-    - mask_matrix(list) The mask color matrix (will be repeated)
-    - mask_meta(dict) The metadata from the mask image (needed for mask size)
+    - mask(Sampler) A sampler of the mask image (will be repeated, if the sampler wraps)
     """
 
-    mask_pos_x = wrap(pos[0], 0, mask_meta["width"])
-    mask_pos_y = wrap(pos[1], 0, mask_meta["height"])
+    mask_color = mask.fetch(pos[0], pos[1])
 
-    mask_brightness = sum(mask_matrix[mask_pos_y][mask_pos_x][0:3]) / 3
-    mask_brightness *= mask_matrix[mask_pos_y][mask_pos_x][3] / 255
+    mask_brightness = sum(mask_color[0:3]) / 3
+    mask_brightness *= mask_color[3] / 255
     mask_brightness /= 255 # Normalise to 0 - 1
 
     # Move range to 0.25 - 1
@@ -266,17 +268,28 @@ def mask_shader(uv, pos, color : tuple, mask_matrix : list, mask_meta : dict) ->
     ]
 
 
-# Prepare folder
-if os.path.exists("renders/"):
-    shutil.rmtree("renders/")
-    
-    # Re-create the folder
-    os.makedirs("renders/")
+# The decoded inputs and the options of the frames, set in every rendering process
+inputs = None
+options = None
+
+def mask_pass(image : PNG, kernel : list, shader : callable) -> None:
+    """
+    Blurs the image, and converts its alpha channel to brightness
+    """
+
+    image.convolve(kernel, edge_mode = "wrap")
+    image.shader(shader)
+
+def prepare_inputs(filename : str, filename2 : str, verbose : bool, cache : ShaderCache|None = None) -> tuple:
+    """
+    Reads the inputs, and computes everything that is the same in every frame
+    """
+
+    output = "bar" if verbose else None
 
-for i in range(1):
     # Read image data
-    print("Reading...")
-    image = PNG(args.filename, flags=PNG_READ, )
+    if verbose: print("Reading...")
+    image = PNG(filename, flags=PNG_READ, )
 
     # Apply shader to the image
     #print("Alpha monchrome...")
@@ -284,38 +297,130 @@ for i in range(1):
     #print("Alpha edge...")
     #image.shader(alpha_edge_shader)
     #print("Blur...")
-    #color_matrix = image.get_matrix()
-    #image.shader(blur_shader, [3])
+    #image.shader(blur_shader, [3], sampler = True)
     #print("UV...")
     #image.shader(uv_shader)
     #print("UV warp...")
-    #color_matrix = image.get_matrix()
-    #image.shader(uv_whirlpool_shader, [i * 0.05])
+    #image.shader(uv_whirlpool_shader, [i * 0.05], sampler = Sampler(image, filter = "bilinear"))
     #print("Band...")
     #image.shader(band_shader, [2**0])
     #image.shader(alpha_monochrome_shader)
     #print("Alpha checkerboard...")
 
-    image.print()
+    if verbose: image.print()
 
-    image_meta = image.get_meta()
-    color_matrix = image.get_matrix()
-    image.shader(blur_shader, [5], output = "bar")
-    image.shader(alpha_monochrome_shader, output = "bar")
+    #image.shader(blur_shader, [5], output = "bar", sampler = True)
+    if verbose: print("Blur...")
 
-    color_mask = image.get_matrix()
-    mask_meta = image.get_meta()
+    if cache:
+        cache.run(image, mask_pass, box_kernel(5), alpha_monochrome_shader)
+    else:
+        mask_pass(image, box_kernel(5), alpha_monochrome_shader)
 
-    image.shader(alpha_checkerboard_shader, [0.5], output = "bar")
+    color_mask = Sampler(image)
 
-    image.print()
+    if verbose:
+        image.shader(alpha_checkerboard_shader, [0.5], output = output)
+        image.print()
 
     # Load second image
-    print("Reading...")
-    image = PNG(args.filename2, flags=PNG_READ)
+    if verbose: print("Reading...")
+    image2 = PNG(filename2, flags=PNG_READ)
+
+    return color_mask, image2
+
+def init_renderer(frame_inputs : tuple, frame_options : dict) -> None:
+    global inputs, options
+
+    inputs = frame_inputs
+    options = frame_options
+
+def render_frame(i : int) -> PNG|None:
+    """
+    Renders a frame, writes it into the renders folder (when no other output is used), and returns with it (when it is needed)
+    """
+
+    color_mask, source = inputs
+    verbose = options["verbose"]
+    output = "bar" if verbose else None
+
+    image = source.copy()
+
+    image.shader(mask_shader, [color_mask], output = output)
+
+    if options["whirlpool"]:
+        if verbose: print("Whirlpool...")
+        image.shader(uv_whirlpool_shader, [i * 0.05], output = output, sampler = Sampler(image, filter = "bilinear"))
+
+    if verbose: image.print()
+
+    if options["write_files"]:
+        image.write(f"renders/frame_{i:>03}.png")
+
+    if not options["return_image"]: return None
+
+    return image if options["in_process"] else image.copy() # Only the pixels are sent back to the main process
+
+if __name__ == "__main__":
+    # Parse the arguments
+    args = parser.parse_args()
+
+    if args.sink == "-" and args.live:
+        parser.error("--live can not be used, when the raw video is written to the standard output")
+
+    # Prepare folder
+    if os.path.exists("renders/"):
+        shutil.rmtree("renders/")
+
+    # Re-create the folder
+    os.makedirs("renders/")
+
+    jobs = args.jobs if args.jobs is not None else (os.cpu_count() or 1)
+
+    # Progress and intermediate images are only shown with a single job, without the live preview, and when the standard output is free
+    verbose = not args.live and args.sink != "-"
+
+    sink = FrameSink(args.sink, format = args.sink_format, fps = args.fps) if args.sink else None
+    animation = APNGWriter(args.apng, fps = args.fps) if args.apng else None
+
+    frame_options = {
+        "verbose": verbose and jobs == 1,
+        "whirlpool": args.whirlpool,
+        "write_files": not sink and not animation,
+        "return_image": bool(sink or animation or args.live),
+        "in_process": jobs == 1,
+    }
+
+    # The inputs are decoded once, and sent to every process
+    cache = ShaderCache(args.cache, args.cache_size * 1024 * 1024) if args.cache else None
+    frame_inputs = prepare_inputs(args.filename, args.filename2, verbose, cache)
+
+    if args.live and jobs == 1:
+        init_renderer(frame_inputs, frame_options)
+
+        def show_frame(i : int) -> PNG:
+            image = render_frame(i)
+
+            if sink: sink.write_frame(image)
+            if animation: animation.write_frame(image)
+
+            return image
+
+        # Every frame is written (into the sink, the animation, or the renders folder), only drawing the late frames is skipped
+        with LivePreview(fps = args.fps) as preview:
+            preview.play(show_frame, args.frames, render_late = bool(sink or animation or frame_options["write_files"]))
+
+    else:
+        preview = LivePreview(fps = args.fps) if args.live else None
+
+        for i, image in render_frames(render_frame, args.frames, workers = jobs, initializer = init_renderer, initargs = (frame_inputs, frame_options)):
+            if sink: sink.write_frame(image)
+            if animation: animation.write_frame(image)
+            if preview: preview.show(image)
 
-    image.shader(mask_shader, [color_mask, mask_meta], output = "bar")
+            if verbose and jobs > 1: print(f"Rendered frame {i + 1}/{args.frames}")
 
-    image.print()
+        if preview: preview.close()
 
-    image.write(f"renders/frame_{i:>03}.png")
\ No newline at end of file
+    if sink: sink.close()
+    if animation: animation.close()
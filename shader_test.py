@@ -9,9 +9,6 @@ parser = argparse.ArgumentParser()
 # Add the filename argument
 parser.add_argument('filename', type=str, help='File to open and show')
 
-# Parse the arguments
-args = parser.parse_args()
-
 """
 Shader utility functions
 """
@@ -81,9 +78,7 @@ def alpha_edge_shader(uv, pos, color : tuple, *args) -> tuple:
 
     return out_color
 
-def blur_shader(uv, pos, color : tuple, blur_size) -> tuple:
-    global color_matrix, image_meta
-
+def blur_shader(uv, pos, color : tuple, blur_size, sampler : Sampler) -> tuple:
     BOX_SIZE = blur_size
 
     color_sum = [0, 0, 0, 0]
@@ -92,10 +87,10 @@ def blur_shader(uv, pos, color : tuple, blur_size) -> tuple:
         for x in range(BOX_SIZE):
             pixel = []
 
-            if pos[0] + x == 0 or pos[0] + x >= image_meta["width"]: pixel = color
-            if pos[1] + y == 0 or pos[1] + y >= image_meta["height"]: pixel = color
+            if pos[0] + x == 0 or pos[0] + x >= sampler.width: pixel = color
+            if pos[1] + y == 0 or pos[1] + y >= sampler.height: pixel = color
 
-            if pixel == []: pixel = color_matrix[pos[1] + y][pos[0] + x]
+            if pixel == []: pixel = sampler.fetch(pos[0] + x, pos[1] + y)
 
             for channel in range(4):
                 color_sum[channel] += pixel[channel]
@@ -138,22 +133,14 @@ def uv_shader(uv, pos, color : tuple) -> tuple:
         255
     ]
 
-def uv_warp_shader(uv, pos, color : tuple) -> tuple:
-    global color_matrix, image_meta
-    
+def uv_warp_shader(uv, pos, color : tuple, sampler : Sampler) -> tuple:
     uv_x = uv[0] + math.sin(pos[0] * math.pi / 180 * 3)
     uv_y = uv[1] + math.sin((pos[0] + pos[1]) * math.pi / 180 * 5)
 
     uv_x = uv_x * 5
     uv_y = uv_y * 5
 
-    pos_x = wrap( int(pos[0] + uv_x), 0, image_meta["width"] )
-    pos_y = wrap( int(pos[1] + uv_y), 0, image_meta["height"] )
-
-    #if pos_x < 0 or pos_x >= image_meta["width"] or pos_y < 0 or pos_y >= image_meta["height"]:
-    #    return [255, 0, 0, 255]
-    #else:
-    return color_matrix[pos_y][pos_x]
+    return sampler.fetch( int(pos[0] + uv_x), int(pos[1] + uv_y) )
 
 def band_shader(uv, pos, color : tuple, number_of_bands : int) -> tuple:
     return [
@@ -163,45 +150,47 @@ def band_shader(uv, pos, color : tuple, number_of_bands : int) -> tuple:
         band(color[3], number_of_bands),
     ]
 
-# Read image data
-print("Reading...")
-image = PNG(args.filename, flags=PNG_READ)
-
-image_meta = image.get_meta()
-
-# Apply shader to the image
-#print("Grayscale...")
-#image.shader(grayscale_shader)
-#print("Alpha monchrome...")
-#image.shader(alpha_monochrome_shader)
-#print("Alpha edge...")
-#image.shader(alpha_edge_shader)
-#print("Blur...")
-#color_matrix = image.get_matrix()
-#image.shader(blur_shader, 3)
-#print("UV...")
-#image.shader(uv_shader)
-print("UV warp...")
-color_matrix = image.get_matrix()
-image.shader(uv_warp_shader)
-#print("Band...")
-#image.shader(band_shader, 2**0)
-#image.shader(alpha_monochrome_shader)
-#print("Alpha checkerboard...")
-#image.shader(alpha_checkerboard_shader)
-
-w, _ = os.get_terminal_size()
-scale = int((image_meta["width"] / w) + 1) if image_meta["width"] > w else 1
-
-print("Print...")
-image.print(scale)
-
-print("Image data")
-
-for key in image_meta:
-    if type(image_meta[key]) is dict: continue
-    if type(image_meta[key]) is list: continue
-
-    print(f" - {key}: {image_meta[key]}")
-
-image.write("test.png")
\ No newline at end of file
+if __name__ == "__main__":
+    # Parse the arguments
+    args = parser.parse_args()
+
+    # Read image data
+    print("Reading...")
+    image = PNG(args.filename, flags=PNG_READ)
+
+    image_meta = image.get_meta()
+
+    # Apply shader to the image
+    #print("Grayscale...")
+    #image.shader(grayscale_shader)
+    #print("Alpha monchrome...")
+    #image.shader(alpha_monochrome_shader)
+    #print("Alpha edge...")
+    #image.shader(alpha_edge_shader)
+    #print("Blur...")
+    #image.shader(blur_shader, [3], sampler = True)
+    #print("UV...")
+    #image.shader(uv_shader)
+    print("UV warp...")
+    image.shader(uv_warp_shader, sampler = True)
+    #print("Band...")
+    #image.shader(band_shader, 2**0)
+    #image.shader(alpha_monochrome_shader)
+    #print("Alpha checkerboard...")
+    #image.shader(alpha_checkerboard_shader)
+
+    w, _ = os.get_terminal_size()
+    scale = int((image_meta["width"] / w) + 1) if image_meta["width"] > w else 1
+
+    print("Print...")
+    image.print(scale)
+
+    print("Image data")
+
+    for key in image_meta:
+        if type(image_meta[key]) is dict: continue
+        if type(image_meta[key]) is list: continue
+
+        print(f" - {key}: {image_meta[key]}")
+
+    image.write("test.png")
\ No newline at end of file